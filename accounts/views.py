@@ -3,9 +3,7 @@ from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.views.decorators.http import require_http_methods
-from django.utils import timezone
-from django.db.models import Count, Avg, Q
-from datetime import timedelta
+from products.dashboard_stats import get_dashboard_stats
 from products.models import Product, PriceAlert, Notification
 
 
@@ -45,72 +43,24 @@ def logout_view(request):
 def dashboard_view(request):
     """Vista de dashboard con estadísticas"""
     user = request.user
-    now = timezone.now()
-    seven_days_ago = now - timedelta(days=7)
-    one_day_ago = now - timedelta(days=1)
     
-    # Estadísticas de Productos (filtradas por usuario)
-    user_products = Product.objects.filter(queried_by=user)
-    total_products = user_products.count()
-    recent_products = user_products.filter(last_updated__gte=seven_days_ago).count()
+    # Contadores y distribuciones precalculados (una fila, se recalcula tras DASHBOARD_STATS_TTL)
+    stats = get_dashboard_stats(user)
     
-    # Precio promedio (solo productos con precio)
-    avg_price_result = user_products.filter(
-        current_price_new__isnull=False
-    ).aggregate(avg_price=Avg('current_price_new'))
-    avg_price = (avg_price_result['avg_price'] / 100) if avg_price_result['avg_price'] else 0
-    
-    # Top 3 productos mejor calificados del usuario
-    top_rated_products = user_products.filter(
-        rating__isnull=False
-    ).order_by('-rating', '-review_count')[:3]
-    
-    # Estadísticas de Alertas
-    user_alerts = PriceAlert.objects.filter(user=user)
-    total_alerts = user_alerts.count()
-    active_alerts = user_alerts.filter(is_active=True).count()
-    triggered_alerts = user_alerts.filter(triggered=True).count()
-    
-    # Distribución de alertas por tipo de precio
-    alerts_by_price_type = user_alerts.values('price_type').annotate(
-        count=Count('id')
-    )
-    alerts_by_type = {
-        'new': 0,
-        'amazon': 0,
-        'used': 0
-    }
-    for item in alerts_by_price_type:
-        alerts_by_type[item['price_type']] = item['count']
+    # Top 3 productos mejor calificados del usuario (ASINs guardados en el snapshot)
+    top_rated_by_asin = Product.objects.only(
+        'asin', 'title', 'rating', 'review_count'
+    ).in_bulk(stats['top_rated_asins'])
+    top_rated_products = [top_rated_by_asin[asin] for asin in stats['top_rated_asins'] if asin in top_rated_by_asin]
     
     # Alertas activas recientes
-    recent_active_alerts = user_alerts.filter(
+    recent_active_alerts = PriceAlert.objects.filter(
+        user=user,
         is_active=True
-    ).order_by('-created_at')[:5]
-    
-    # Estadísticas de Notificaciones
-    user_notifications = Notification.objects.filter(user=user)
-    total_notifications = user_notifications.count()
-    unread_notifications = user_notifications.filter(is_read=False).count()
-    recent_notifications_count = user_notifications.filter(
-        created_at__gte=one_day_ago
-    ).count()
-    
-    # Distribución de notificaciones por tipo
-    notifications_by_type = user_notifications.values('notification_type').annotate(
-        count=Count('id')
-    )
-    notif_by_type = {
-        'price_alert': 0,
-        'system': 0,
-        'info': 0,
-        'warning': 0
-    }
-    for item in notifications_by_type:
-        notif_by_type[item['notification_type']] = item['count']
+    ).with_product_summary().order_by('-created_at')[:5]
     
     # Notificaciones recientes
-    recent_notifications = user_notifications.order_by('-created_at')[:5]
+    recent_notifications = Notification.objects.filter(user=user).order_by('-created_at')[:5]
     
     # Breadcrumbs
     breadcrumbs = [
@@ -120,21 +70,21 @@ def dashboard_view(request):
     context = {
         'user': user,
         # Productos
-        'total_products': total_products,
-        'recent_products': recent_products,
-        'avg_price': avg_price,
+        'total_products': stats['total_products'],
+        'recent_products': stats['recent_products'],
+        'avg_price': stats['avg_price'],
         'top_rated_products': top_rated_products,
         # Alertas
-        'total_alerts': total_alerts,
-        'active_alerts': active_alerts,
-        'triggered_alerts': triggered_alerts,
-        'alerts_by_type': alerts_by_type,
+        'total_alerts': stats['total_alerts'],
+        'active_alerts': stats['active_alerts'],
+        'triggered_alerts': stats['triggered_alerts'],
+        'alerts_by_type': stats['alerts_by_type'],
         'recent_active_alerts': recent_active_alerts,
         # Notificaciones
-        'total_notifications': total_notifications,
-        'unread_notifications': unread_notifications,
-        'recent_notifications_count': recent_notifications_count,
-        'notif_by_type': notif_by_type,
+        'total_notifications': stats['total_notifications'],
+        'unread_notifications': stats['unread_notifications'],
+        'recent_notifications_count': stats['recent_notifications_count'],
+        'notif_by_type': stats['notif_by_type'],
         'recent_notifications': recent_notifications,
         # Breadcrumbs
         'breadcrumbs': breadcrumbs,
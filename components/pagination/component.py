@@ -8,7 +8,8 @@ class Pagination(component.Component):
     Componente para paginación estilo Laravel.
     
     Props:
-    - page_obj: Objeto de página de Django Paginator
+    - page_obj: Objeto de página de Django Paginator, o KeysetPage (products.keyset) para
+      paginación por cursor: en ese caso solo hay Primera, Anterior y Siguiente
     - extra_params: Dict con parámetros adicionales para mantener en la URL (ej: {'category_id': '123', 'category_search': 'laptops'})
     """
     template_name = "pagination/pagination.html"
@@ -22,7 +23,14 @@ class Pagination(component.Component):
         
         # Construir URLs para cada botón de paginación
         urls = {}
-        if page_obj and hasattr(page_obj, 'paginator'):
+        keyset = page_obj is not None and hasattr(page_obj, 'next_token')
+        if keyset:
+            urls['first'] = '?' + urlencode(base_params)
+            if page_obj.has_previous():
+                urls['previous'] = '?' + urlencode({**base_params, page_obj.cursor_param: page_obj.previous_token})
+            if page_obj.has_next():
+                urls['next'] = '?' + urlencode({**base_params, page_obj.cursor_param: page_obj.next_token})
+        elif page_obj and hasattr(page_obj, 'paginator'):
             # Primera página
             params_first = base_params.copy()
             params_first['page'] = 1
@@ -48,5 +56,6 @@ class Pagination(component.Component):
         return {
             'page_obj': page_obj,
             'urls': urls,
+            'keyset': keyset,
         }
 
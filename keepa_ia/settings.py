@@ -103,6 +103,21 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Respuestas crudas de Keepa compartidas entre procesos del mismo servidor
+    'keepa': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': config('KEEPA_CACHE_DIR', default=str(BASE_DIR / '.cache' / 'keepa')),
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -171,6 +186,41 @@ MESSAGE_STORAGE = 'django.contrib.messages.storage.session.SessionStorage'
 
 # Keepa API settings
 KEEPA_API_KEY = config('KEEPA_API_KEY', default='')
+KEEPA_TIMEOUT = config('KEEPA_TIMEOUT', default=10.0, cast=float)  # Segundos por petición HTTP
+KEEPA_HTTP_POOL_SIZE = config('KEEPA_HTTP_POOL_SIZE', default=10, cast=int)  # Conexiones persistentes por proceso
+
+# Presupuesto de tokens Keepa compartido entre workers web y comandos (ver products/keepa_budget.py)
+KEEPA_TOKEN_BUDGET_ENABLED = config('KEEPA_TOKEN_BUDGET_ENABLED', default=True, cast=bool)
+KEEPA_TOKENS_PER_MINUTE = config('KEEPA_TOKENS_PER_MINUTE', default=20, cast=int)  # Se ajusta con el refillRate real
+KEEPA_INTERACTIVE_RESERVE = config('KEEPA_INTERACTIVE_RESERVE', default=0.2, cast=float)  # Fracción reservada para vistas
+KEEPA_INTERACTIVE_MAX_WAIT = config('KEEPA_INTERACTIVE_MAX_WAIT', default=5, cast=float)  # Segundos
+KEEPA_BATCH_MAX_WAIT = config('KEEPA_BATCH_MAX_WAIT', default=600, cast=float)  # Segundos
+
+# Refrescos incrementales: días máximos de historial a pedir antes de hacer una consulta completa
+KEEPA_HISTORY_MAX_WINDOW_DAYS = config('KEEPA_HISTORY_MAX_WINDOW_DAYS', default=30, cast=int)
+
+# Tabla normalizada PricePoint (una fila por punto de precio) para consultas por rango en SQL
+KEEPA_PRICE_POINTS_ENABLED = config('KEEPA_PRICE_POINTS_ENABLED', default=True, cast=bool)
+
+# Evaluar alertas de precio en cuanto se actualiza el precio de un producto (además del cron)
+PRICE_ALERTS_ON_PRODUCT_UPDATE = config('PRICE_ALERTS_ON_PRODUCT_UPDATE', default=True, cast=bool)
+
+# Segundos que el dashboard usa sus estadísticas precalculadas antes de recalcularlas
+DASHBOARD_STATS_TTL = config('DASHBOARD_STATS_TTL', default=300, cast=int)
+
+# Segundos que el detalle de un producto muestra sus datos guardados sin refrescarlos en segundo plano
+PRODUCT_FRESHNESS_TTL = config('PRODUCT_FRESHNESS_TTL', default=21600, cast=int)
+
+# Caché de respuestas Keepa: LRU en memoria + caché persistente 'keepa' (ver products/keepa_cache.py)
+KEEPA_CACHE_ENABLED = config('KEEPA_CACHE_ENABLED', default=True, cast=bool)
+KEEPA_CACHE_ALIAS = 'keepa'
+KEEPA_CACHE_LRU_SIZE = config('KEEPA_CACHE_LRU_SIZE', default=256, cast=int)  # Respuestas por proceso
+KEEPA_CACHE_TTLS = {  # Segundos por tipo de llamada
+    'product': config('KEEPA_CACHE_TTL_PRODUCT', default=900, cast=int),
+    'best_sellers': config('KEEPA_CACHE_TTL_BEST_SELLERS', default=3600, cast=int),
+    'category_lookup': config('KEEPA_CACHE_TTL_CATEGORIES', default=86400, cast=int),
+    'category_search': config('KEEPA_CACHE_TTL_CATEGORIES', default=86400, cast=int),
+}
 
 # OpenAI API settings
 OPENAI_API_KEY = config('OPENAI_API_KEY', default='')
@@ -186,6 +236,16 @@ EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='noreply@keepa-ia.local')
 SERVER_EMAIL = config('SERVER_EMAIL', default='admin@keepa-ia.local')
 
+# Encolar los emails de notificación en OutboundEmail; los envía el comando send_queued_emails.
+# Activarlo solo con ese comando en el cron: sin él, ningún email sale de la cola.
+# Desactivado, cada email se envía en el momento
+EMAIL_QUEUE_ENABLED = config('EMAIL_QUEUE_ENABLED', default=False, cast=bool)
+
+# Dejar los trabajos en segundo plano (Job) al comando run_workers; desactivado, cada trabajo
+# se ejecuta en un hilo del proceso web que lo encola. Activarlo solo con run_workers desplegado:
+# sin workers, los trabajos se quedan en cola y la página espera indefinidamente
+JOB_QUEUE_ENABLED = config('JOB_QUEUE_ENABLED', default=False, cast=bool)
+
 # Site settings
 SITE_NAME = config('SITE_NAME', default='Keepa IA')
 SITE_URL = config('SITE_URL', default='http://localhost:8000')
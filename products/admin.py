@@ -1,14 +1,34 @@
 from django.contrib import admin
-from .models import Product, PriceAlert, Notification, BestSellerSearch
+from django.db.models import Q
+from django.utils import timezone
+from .models import (
+    Product, PriceAlert, Notification, BestSellerSearch, KeepaTokenBucket, PricePoint, OutboundEmail, Job,
+    product_heavy_fields,
+)
+
+
+class SummaryChangelistMixin:
+    """Difiere columnas pesadas en el listado del admin (el formulario de edición sigue cargándolas)"""
+    changelist_defer = ()
+    
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        url_name = getattr(getattr(request, 'resolver_match', None), 'url_name', '') or ''
+        if url_name.endswith('_changelist'):
+            queryset = queryset.defer(*self.changelist_defer)
+        return queryset
 
 # Register your models here.
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(SummaryChangelistMixin, admin.ModelAdmin):
+    list_select_related = ('queried_by',)
+    changelist_defer = product_heavy_fields()
     list_display = ('asin', 'title', 'brand', 'current_price_new', 'rating', 'sales_rank_current', 'last_updated', 'queried_by')
     list_filter = ('brand', 'binding', 'availability_amazon', 'last_updated', 'queried_by')
     search_fields = ('asin', 'title', 'brand')
-    readonly_fields = ('asin', 'created_at', 'last_updated')
+    # Los historiales se guardan como series binarias; se muestran decodificados y no se editan
+    readonly_fields = ('asin', 'created_at', 'last_updated', 'price_history', 'rating_history', 'sales_rank_history')
     ordering = ('-last_updated',)
     
     fieldsets = (
@@ -36,7 +56,9 @@ class ProductAdmin(admin.ModelAdmin):
 
 
 @admin.register(PriceAlert)
-class PriceAlertAdmin(admin.ModelAdmin):
+class PriceAlertAdmin(SummaryChangelistMixin, admin.ModelAdmin):
+    list_select_related = ('user', 'product')
+    changelist_defer = product_heavy_fields('product__')
     list_display = ('user', 'product', 'price_type', 'target_price_display', 'frequency', 'is_active', 'triggered', 'created_at')
     list_filter = ('price_type', 'frequency', 'is_active', 'triggered', 'created_at', 'user')
     search_fields = ('user__username', 'product__asin', 'product__title')
@@ -63,6 +85,7 @@ class PriceAlertAdmin(admin.ModelAdmin):
 
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
+    list_select_related = ('user',)
     list_display = ('user', 'title', 'notification_type', 'is_read', 'created_at')
     list_filter = ('notification_type', 'is_read', 'created_at', 'user')
     search_fields = ('user__username', 'title', 'message')
@@ -85,6 +108,7 @@ class NotificationAdmin(admin.ModelAdmin):
 
 @admin.register(BestSellerSearch)
 class BestSellerSearchAdmin(admin.ModelAdmin):
+    list_select_related = ('user',)
     list_display = ('user', 'category_search', 'category_id', 'category_name', 'created_at')
     list_filter = ('created_at', 'user')
     search_fields = ('user__username', 'category_search', 'category_name', 'category_id')
@@ -100,3 +124,63 @@ class BestSellerSearchAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         })
     )
+
+
+@admin.register(KeepaTokenBucket)
+class KeepaTokenBucketAdmin(admin.ModelAdmin):
+    list_display = ('name', 'tokens', 'reserved', 'capacity', 'refill_rate', 'updated_at', 'synced_at')
+    readonly_fields = ('name', 'updated_at', 'synced_at')
+
+
+@admin.register(PricePoint)
+class PricePointAdmin(SummaryChangelistMixin, admin.ModelAdmin):
+    list_select_related = ('product',)
+    changelist_defer = product_heavy_fields('product__')
+    list_display = ('product', 'series_type', 'ts', 'price')
+    list_filter = ('series_type',)
+    search_fields = ('product__asin',)
+    raw_id_fields = ('product',)
+    date_hierarchy = 'ts'
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'key', 'user', 'status', 'attempts', 'run_at', 'created_at', 'finished_at')
+    list_filter = ('status', 'kind', 'created_at')
+    search_fields = ('kind', 'key', 'user__username')
+    readonly_fields = ('created_at', 'started_at', 'finished_at', 'attempts', 'worker', 'result', 'last_error')
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    ordering = ('-created_at',)
+    actions = ['retry_now']
+    
+    def retry_now(self, request, queryset):
+        updated = queryset.filter(status=Job.STATUS_FAILED).update(
+            status=Job.STATUS_PENDING, attempts=0, run_at=timezone.now(), finished_at=None
+        )
+        self.message_user(request, f'{updated} trabajos volverán a ejecutarse')
+    retry_now.short_description = 'Reintentar ahora'
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(SummaryChangelistMixin, admin.ModelAdmin):
+    changelist_defer = ('body_text', 'body_html')
+    list_display = ('to_email', 'subject', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('to_email', 'subject', 'user__username')
+    readonly_fields = ('created_at', 'sent_at', 'attempts', 'last_error')
+    raw_id_fields = ('user',)
+    ordering = ('-created_at',)
+    actions = ['retry_now']
+    
+    def retry_now(self, request, queryset):
+        now = timezone.now()
+        # Los emails 'enviando' con la reserva vigente los está enviando un worker ahora mismo:
+        # reiniciarlos los enviaría dos veces
+        retryable = queryset.filter(
+            Q(status__in=[OutboundEmail.STATUS_FAILED, OutboundEmail.STATUS_PENDING])
+            | Q(status=OutboundEmail.STATUS_SENDING, next_attempt_at__lte=now)
+        )
+        updated = retryable.update(status=OutboundEmail.STATUS_PENDING, attempts=0, next_attempt_at=now)
+        self.message_user(request, f'{updated} emails volverán a enviarse')
+    retry_now.short_description = 'Reintentar envío ahora'
@@ -0,0 +1,150 @@
+"""
+Event-driven evaluation of price alerts when a product's prices change.
+
+The cron-driven check_price_alerts only looks at alerts when they are due, so a
+product refreshed by a user or a best-seller page could already satisfy alerts
+that fire hours later. The same goes for the refreshes of the cron itself: after
+writing a product it evaluates the product's other alerts (the ones not in its
+batch) for the prices that changed. The upsert path calls
+schedule_alert_evaluation with the columns it wrote (best-seller pages write the
+current prices from Keepa's stats.current, see BEST_SELLER_UPDATE_FIELDS); once
+the transaction commits, one indexed query per changed price type (product,
+price_type, is_active, triggered, target_price >= current) finds the alerts to
+fire.
+
+Each alert is claimed with a conditional UPDATE before it is notified, so two
+concurrent refreshes of the same product never notify an alert twice. fire_alert
+writes the claim, the notification and the queued email in one transaction, so
+an alert is never left triggered without its notification.
+"""
+import logging
+from typing import Iterable, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .alert_writes import AlertWriteBuffer
+from .models import PriceAlert, Product
+from .notifications import send_price_alert_notification
+from .user_counters import invalidate_user_counters
+
+logger = logging.getLogger(__name__)
+
+# PriceAlert.price_type -> Product column with the current price
+PRICE_TYPE_FIELDS = {
+    'new': 'current_price_new',
+    'amazon': 'current_price_amazon',
+    'used': 'current_price_used',
+}
+
+
+def alert_events_enabled() -> bool:
+    """Whether product updates evaluate price alerts immediately"""
+    return getattr(settings, 'PRICE_ALERTS_ON_PRODUCT_UPDATE', True)
+
+
+def claim_alert(alert: PriceAlert) -> bool:
+    """
+    Mark an alert as triggered unless another process already did
+
+    Returns:
+        True if this caller claimed the alert and must notify it
+    """
+    now = timezone.now()
+    claimed = PriceAlert.objects.filter(pk=alert.pk, is_active=True, triggered=False).update(
+        triggered=True, triggered_at=now, is_active=False, last_checked=now,
+    )
+    if claimed:
+        invalidate_user_counters([alert.user_id])
+        alert.triggered = True
+        alert.triggered_at = now
+        alert.is_active = False
+        alert.last_checked = now
+    return bool(claimed)
+
+
+def fire_alert(alert: PriceAlert, current_price) -> Optional[bool]:
+    """
+    Claim an alert and write its notification and email in the same transaction
+
+    If the notification cannot be built or written, the claim is rolled back and
+    the alert stays active for the next check.
+
+    Args:
+        alert: Satisfied alert, with its product and user loaded
+        current_price: Current price in cents
+
+    Returns:
+        None if another process already claimed the alert, otherwise whether the
+        notification was written
+    """
+    rows = AlertWriteBuffer()
+    with transaction.atomic():
+        if not claim_alert(alert):
+            return None
+        if not send_price_alert_notification(alert, current_price, buffer=rows):
+            transaction.set_rollback(True)
+            return False
+        rows.flush()
+    return True
+
+
+def evaluate_product_alerts(
+    product: Product, changed_fields: Iterable[str], exclude_ids: Iterable[int] = (),
+) -> List[PriceAlert]:
+    """
+    Fire the active alerts of a product satisfied by its changed prices
+
+    Args:
+        product: Product with the prices just written
+        changed_fields: Product fields the update wrote
+        exclude_ids: Alerts the caller evaluates itself
+
+    Returns:
+        Alerts that were fired
+    """
+    changed_fields = set(changed_fields)
+    exclude_ids = list(exclude_ids)
+    fired = []
+    for price_type, field_name in PRICE_TYPE_FIELDS.items():
+        current_price = getattr(product, field_name)
+        if field_name not in changed_fields or current_price is None:
+            continue
+        alerts = PriceAlert.objects.filter(
+            product=product,
+            price_type=price_type,
+            is_active=True,
+            triggered=False,
+            target_price__gte=current_price,
+        ).exclude(id__in=exclude_ids).select_related('user')
+        for alert in alerts:
+            alert.product = product
+            if fire_alert(alert, current_price):
+                fired.append(alert)
+
+    if fired:
+        logger.info(f"[ALERT_EVENTS] {len(fired)} alertas disparadas por la actualización de {product.asin}")
+    return fired
+
+
+def schedule_alert_evaluation(product: Product, changed_fields: Iterable[str]) -> None:
+    """
+    Evaluate the product's alerts after the current transaction commits
+
+    Args:
+        product: Product being written
+        changed_fields: Product fields the update writes
+    """
+    changed_fields = [name for name in changed_fields if name in PRICE_TYPE_FIELDS.values()]
+    if not changed_fields or not alert_events_enabled():
+        return
+
+    def evaluate():
+        try:
+            evaluate_product_alerts(product, changed_fields)
+        except Exception as e:
+            # A failed evaluation must not break the request that saved the product
+            logger.error(f"[ALERT_EVENTS] Error evaluando alertas de {product.asin}: {e}")
+
+    transaction.on_commit(evaluate)
@@ -0,0 +1,98 @@
+"""
+Leases that let several check_price_alerts workers split the due alerts.
+
+A worker claims the due alerts of a batch of products by writing its id and a
+lease expiry on them. The claim reads candidates with SELECT ... FOR UPDATE SKIP
+LOCKED where the backend supports it (MySQL 8, PostgreSQL), so workers never wait
+on each other's rows, and the lease itself is a conditional UPDATE, so it is safe
+on any backend. All due alerts of a product go to the same worker, so a product is
+refreshed from Keepa once per run. If a worker dies, its leases expire and the
+alerts are claimed again.
+"""
+import os
+import socket
+from datetime import timedelta
+from typing import List, Optional
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import PriceAlert
+
+
+def default_worker_id() -> str:
+    """Worker id for this process (host:pid)"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def unleased(now=None) -> Q:
+    """Alerts with no lease or an expired one"""
+    now = now or timezone.now()
+    return Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lte=now)
+
+
+def due_alerts(now=None, frequency: Optional[int] = None):
+    """Active alerts that are due now and not leased by a live worker"""
+    now = now or timezone.now()
+    alerts = PriceAlert.objects.filter(is_active=True, triggered=False, next_check_at__lte=now).filter(unleased(now))
+    if frequency:
+        alerts = alerts.filter(frequency=frequency)
+    return alerts
+
+
+def claim_alert_batch(
+    worker_id: str,
+    max_products: int,
+    lease_seconds: int,
+    frequency: Optional[int] = None,
+) -> List[int]:
+    """
+    Lease the due alerts of up to max_products products
+
+    Args:
+        worker_id: Id written on the leased alerts
+        max_products: Maximum number of products in the batch
+        lease_seconds: Lease duration; the batch must be processed before it expires
+        frequency: Only claim alerts with this frequency
+
+    Returns:
+        Ids of the leased alerts (empty when nothing is due)
+    """
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=lease_seconds)
+    due = due_alerts(now, frequency)
+    with transaction.atomic():
+        candidates = (
+            due.select_for_update(skip_locked=True)
+            .order_by('next_check_at')
+            .values_list('product_id', flat=True)[:max_products]
+        )
+        product_ids = list(dict.fromkeys(candidates))
+        if not product_ids:
+            return []
+        due.filter(product_id__in=product_ids).update(lease_owner=worker_id, lease_expires_at=expires_at)
+    # Filtered by product as well so the read uses the product index instead of a full scan
+    return list(
+        PriceAlert.objects.filter(
+            product_id__in=product_ids, lease_owner=worker_id, lease_expires_at=expires_at,
+        ).values_list('id', flat=True)
+    )
+
+
+def release_alert_batch(worker_id: str, alert_ids: List[int], retry_delay: timedelta) -> None:
+    """
+    Release a processed batch
+
+    Alerts still due (their product could not be refreshed) are postponed by
+    retry_delay so the worker does not claim them again in the same run.
+
+    Args:
+        worker_id: Id the alerts were leased with
+        alert_ids: Ids returned by claim_alert_batch
+        retry_delay: Delay before unchecked alerts are due again
+    """
+    now = timezone.now()
+    leased = PriceAlert.objects.filter(id__in=alert_ids, lease_owner=worker_id)
+    leased.filter(is_active=True, triggered=False, next_check_at__lte=now).update(next_check_at=now + retry_delay)
+    leased.update(lease_owner='', lease_expires_at=None)
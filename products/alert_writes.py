@@ -0,0 +1,109 @@
+"""
+Per-run write buffer for the rows check_price_alerts touches for each alert.
+
+Checking an alert used to cost one UPDATE to store last_checked and, when it
+fired, one INSERT for its Notification plus a full-row UPDATE of the alert. The
+checker now collects the last_checked updates in an AlertWriteBuffer and writes
+them with one bulk_update (restricted to the bookkeeping columns) every
+FLUSH_SIZE rows, so a run over thousands of alerts costs a handful of statements.
+
+A fired alert's Notification and queued email are collected in a buffer of
+their own and flushed in the transaction that claims the alert (see
+alert_events.fire_alert), so a failed write never leaves an alert triggered
+without its notification.
+
+bulk_update does not call PriceAlert.save(), so mark_checked sets next_check_at
+itself.
+"""
+import logging
+import threading
+from datetime import datetime
+from typing import Optional
+
+from django.utils import timezone
+
+from .models import Notification, OutboundEmail, PriceAlert
+from .user_counters import invalidate_user_counters
+
+logger = logging.getLogger(__name__)
+
+# Buffered rows that trigger an automatic flush
+FLUSH_SIZE = 1000
+
+# Rows per INSERT / UPDATE statement
+BULK_BATCH_SIZE = 500
+
+# PriceAlert columns written for a checked alert
+CHECKED_FIELDS = ['last_checked', 'next_check_at']
+
+
+class AlertWriteBuffer:
+    """Notifications, queued emails and checked alerts waiting to be written (safe to share between threads)"""
+
+    def __init__(self, flush_size: int = FLUSH_SIZE):
+        self.flush_size = flush_size
+        self.notifications = []
+        self.emails = []
+        self.checked_alerts = {}
+        self.notifications_written = 0
+        self.emails_written = 0
+        self.alerts_written = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.notifications) + len(self.emails) + len(self.checked_alerts)
+
+    def add_notification(self, notification: Notification) -> None:
+        """Queue an unsaved Notification"""
+        with self._lock:
+            self.notifications.append(notification)
+        self._flush_if_full()
+
+    def add_email(self, email: OutboundEmail) -> None:
+        """Queue an unsaved OutboundEmail"""
+        with self._lock:
+            self.emails.append(email)
+        self._flush_if_full()
+
+    def mark_checked(self, alert: PriceAlert, checked_at: Optional[datetime] = None) -> None:
+        """
+        Queue the last_checked / next_check_at update of an alert
+
+        Args:
+            alert: Alert that was just checked
+            checked_at: Check time (defaults to now)
+        """
+        alert.last_checked = checked_at or timezone.now()
+        next_check_at = alert.get_next_check_at()
+        if next_check_at is not None:
+            alert.next_check_at = next_check_at
+        with self._lock:
+            self.checked_alerts[alert.pk] = alert
+        self._flush_if_full()
+
+    def _flush_if_full(self) -> None:
+        if len(self) >= self.flush_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the buffered rows"""
+        with self._lock:
+            notifications, self.notifications = self.notifications, []
+            emails, self.emails = self.emails, []
+            alerts, self.checked_alerts = list(self.checked_alerts.values()), {}
+            if notifications:
+                Notification.objects.bulk_create(notifications, batch_size=BULK_BATCH_SIZE)
+                # bulk_create skips the signals that maintain the badge counters
+                invalidate_user_counters(notification.user_id for notification in notifications)
+                self.notifications_written += len(notifications)
+            if emails:
+                OutboundEmail.objects.bulk_create(emails, batch_size=BULK_BATCH_SIZE)
+                self.emails_written += len(emails)
+            if alerts:
+                PriceAlert.objects.bulk_update(alerts, CHECKED_FIELDS, batch_size=BULK_BATCH_SIZE)
+                self.alerts_written += len(alerts)
+        if notifications or emails or alerts:
+            logger.debug(
+                f"[ALERT_WRITES] {len(notifications)} notificaciones, {len(emails)} emails "
+                f"y {len(alerts)} alertas escritas"
+            )
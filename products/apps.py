@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ProductsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'products'
+
+    def ready(self):
+        # Señales que mantienen los contadores de los badges (UserCounters)
+        from . import user_counters  # noqa: F401
+        # Tipos de trabajo en segundo plano (run_workers)
+        from . import job_handlers  # noqa: F401
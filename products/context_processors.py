@@ -1,17 +1,19 @@
-from .notifications import get_user_unread_notifications_count
-from .models import PriceAlert
+from .user_counters import get_user_counters
 
 
 def notifications_context(request):
     """
     Context processor para agregar el contador de notificaciones no leídas
     y alertas activas a todos los templates
+    
+    Los contadores se leen de UserCounters (una fila por usuario) en lugar de
+    contar notificaciones y alertas en cada render
     """
     if request.user.is_authenticated:
-        active_alerts_count = PriceAlert.objects.filter(user=request.user, is_active=True).count()
+        counters = get_user_counters(request.user)
         return {
-            'unread_notifications_count': get_user_unread_notifications_count(request.user),
-            'active_alerts_count': active_alerts_count
+            'unread_notifications_count': counters.unread_notifications,
+            'active_alerts_count': counters.active_alerts
         }
     return {
         'unread_notifications_count': 0,
@@ -0,0 +1,124 @@
+"""
+Per-user snapshot of the dashboard statistics.
+
+The dashboard used to run about a dozen count, aggregate and group-by queries
+over the user's products, alerts and notifications on every visit. They are now
+computed with four queries (one aggregate per table plus the top-rated ASINs)
+and stored in one DashboardSnapshot row that the dashboard reads while it is
+younger than DASHBOARD_STATS_TTL.
+
+The same code paths that keep UserCounters current (see user_counters.py) drop
+the snapshot when a user's notifications or alerts change, and the product
+upserts drop it when they create products for a user, so the user's own actions
+show up on the next visit. The TTL bounds the staleness of the time-relative
+numbers ("last 7 days", "last 24 hours").
+"""
+from datetime import timedelta
+from typing import Any, Dict, Iterable
+
+from django.conf import settings
+from django.db.models import Avg, Count, Q
+from django.utils import timezone
+
+from .models import DashboardSnapshot, Notification, PriceAlert, Product
+
+# Top-rated products listed on the dashboard
+TOP_RATED_COUNT = 3
+
+
+def dashboard_stats_ttl() -> int:
+    """Seconds a snapshot is served before it is recomputed"""
+    return getattr(settings, 'DASHBOARD_STATS_TTL', 300)
+
+
+def compute_dashboard_stats(user) -> Dict[str, Any]:
+    """
+    Compute the dashboard statistics of a user
+
+    Args:
+        user: Dashboard owner
+
+    Returns:
+        JSON-serializable dict with the dashboard context values
+    """
+    now = timezone.now()
+    seven_days_ago = now - timedelta(days=7)
+    one_day_ago = now - timedelta(days=1)
+
+    user_products = Product.objects.filter(queried_by=user)
+    products = user_products.aggregate(
+        total=Count('asin'),
+        recent=Count('asin', filter=Q(last_updated__gte=seven_days_ago)),
+        avg_price=Avg('current_price_new'),
+    )
+    top_rated = list(
+        user_products.filter(rating__isnull=False)
+        .order_by('-rating', '-review_count')
+        .values_list('asin', flat=True)[:TOP_RATED_COUNT]
+    )
+
+    alerts_by_type = {'new': 0, 'amazon': 0, 'used': 0}
+    alert_totals = {'total': 0, 'active': 0, 'triggered': 0}
+    rows = PriceAlert.objects.filter(user=user).values('price_type').annotate(
+        total=Count('id'),
+        active=Count('id', filter=Q(is_active=True)),
+        triggered=Count('id', filter=Q(triggered=True)),
+    ).order_by()
+    for row in rows:
+        alerts_by_type[row['price_type']] = row['total']
+        for key in alert_totals:
+            alert_totals[key] += row[key]
+
+    notif_by_type = {'price_alert': 0, 'system': 0, 'info': 0, 'warning': 0}
+    notification_totals = {'total': 0, 'unread': 0, 'recent': 0}
+    rows = Notification.objects.filter(user=user).values('notification_type').annotate(
+        total=Count('id'),
+        unread=Count('id', filter=Q(is_read=False)),
+        recent=Count('id', filter=Q(created_at__gte=one_day_ago)),
+    ).order_by()
+    for row in rows:
+        notif_by_type[row['notification_type']] = row['total']
+        for key in notification_totals:
+            notification_totals[key] += row[key]
+
+    return {
+        'total_products': products['total'],
+        'recent_products': products['recent'],
+        'avg_price': (float(products['avg_price']) / 100) if products['avg_price'] else 0,
+        'top_rated_asins': top_rated,
+        'total_alerts': alert_totals['total'],
+        'active_alerts': alert_totals['active'],
+        'triggered_alerts': alert_totals['triggered'],
+        'alerts_by_type': alerts_by_type,
+        'total_notifications': notification_totals['total'],
+        'unread_notifications': notification_totals['unread'],
+        'recent_notifications_count': notification_totals['recent'],
+        'notif_by_type': notif_by_type,
+    }
+
+
+def get_dashboard_stats(user) -> Dict[str, Any]:
+    """
+    Dashboard statistics of a user, from the snapshot while it is fresh
+
+    Args:
+        user: Dashboard owner
+
+    Returns:
+        Dict returned by compute_dashboard_stats
+    """
+    now = timezone.now()
+    snapshot = DashboardSnapshot.objects.filter(user_id=user.pk).first()
+    if snapshot is not None and snapshot.computed_at > now - timedelta(seconds=dashboard_stats_ttl()):
+        return snapshot.stats
+
+    stats = compute_dashboard_stats(user)
+    DashboardSnapshot.objects.update_or_create(user_id=user.pk, defaults={'stats': stats, 'computed_at': now})
+    return stats
+
+
+def invalidate_dashboard_stats(user_ids: Iterable[int]) -> None:
+    """Drop the snapshots of the users so their next dashboard visit recomputes them"""
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if user_ids:
+        DashboardSnapshot.objects.filter(user_id__in=user_ids).delete()
@@ -0,0 +1,328 @@
+"""
+Database-backed outbound email queue.
+
+send_email_notification used to open an SMTP connection per message inside the
+request or command that produced it. With the queue enabled it only inserts an
+OutboundEmail row; the send_queued_emails command drains the queue in batches
+over one connection for the whole run, handing each batch to the backend in one
+send_messages call, and retries failures with exponential backoff. The queue lives in the application database, so no broker is
+needed and the delivery state of each email is visible in the admin.
+
+The queue is off by default (EMAIL_QUEUE_ENABLED): nothing leaves it unless
+send_queued_emails runs from cron, so deployments without that job keep sending
+inline.
+
+Batches are claimed by moving them to 'sending' with next_attempt_at set to the
+end of a lease, so several senders can run at once and a sender that dies only
+delays its batch until the lease expires.
+
+Only rejections of a message count as attempts. When the SMTP server cannot be
+reached (or drops the connection), the unsent emails of the batch go back to the
+queue with their attempts unchanged, so an outage never fails them for good.
+"""
+import logging
+import smtplib
+from datetime import timedelta
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+# Failed attempts before an email is marked as failed
+MAX_ATTEMPTS = 6
+
+# Delay before the first retry; doubles with each failed attempt
+RETRY_BASE_DELAY = timedelta(minutes=1)
+RETRY_MAX_DELAY = timedelta(hours=6)
+
+# Time a sender has to deliver a claimed batch before another sender may take it
+SEND_LEASE = timedelta(minutes=10)
+
+# Delay before a batch is retried after the SMTP server could not be reached
+CONNECTION_RETRY_DELAY = timedelta(minutes=1)
+
+
+class EmailConnectionError(Exception):
+    """Raised by send_batch when the SMTP server is unreachable; the unsent emails were re-queued"""
+
+    def __init__(self, message: str, sent: int = 0, failed: int = 0, requeued: int = 0):
+        super().__init__(message)
+        self.sent = sent
+        self.failed = failed
+        self.requeued = requeued
+
+
+def email_queue_enabled() -> bool:
+    """Whether notification emails are queued instead of sent inline"""
+    return getattr(settings, 'EMAIL_QUEUE_ENABLED', False)
+
+
+def build_email(to_email: str, subject: str, body_text: str, body_html: str = '', user=None) -> OutboundEmail:
+    """
+    Unsaved queue entry for an email (for callers that insert them with bulk_create)
+
+    Args:
+        to_email: Recipient address
+        subject: Email subject
+        body_text: Plain text body
+        body_html: Optional HTML alternative
+        user: Recipient user, if any
+
+    Returns:
+        Unsaved OutboundEmail
+    """
+    return OutboundEmail(
+        user=user,
+        to_email=to_email,
+        subject=subject,
+        body_text=body_text,
+        body_html=body_html or '',
+    )
+
+
+def queue_email(to_email: str, subject: str, body_text: str, body_html: str = '', user=None) -> OutboundEmail:
+    """Add an email to the outbound queue (same arguments as build_email)"""
+    email = build_email(to_email, subject, body_text, body_html, user)
+    email.save()
+    return email
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """Backoff before the next attempt after the given number of failed attempts"""
+    return min(RETRY_BASE_DELAY * (2 ** max(attempts - 1, 0)), RETRY_MAX_DELAY)
+
+
+def claim_batch(batch_size: int) -> List[OutboundEmail]:
+    """
+    Claim the next due emails for sending
+
+    Args:
+        batch_size: Maximum number of emails
+
+    Returns:
+        Claimed emails, oldest first
+    """
+    now = timezone.now()
+    due = OutboundEmail.objects.filter(
+        status__in=[OutboundEmail.STATUS_PENDING, OutboundEmail.STATUS_SENDING],
+        next_attempt_at__lte=now,
+    )
+    with transaction.atomic():
+        ids = list(
+            due.select_for_update(skip_locked=True)
+            .order_by('next_attempt_at')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return []
+        # The conditional UPDATE keeps two senders from claiming the same row on
+        # backends without SKIP LOCKED
+        due.filter(id__in=ids).update(status=OutboundEmail.STATUS_SENDING, next_attempt_at=now + SEND_LEASE)
+    return list(
+        OutboundEmail.objects.filter(
+            id__in=ids, status=OutboundEmail.STATUS_SENDING, next_attempt_at=now + SEND_LEASE,
+        ).order_by('id')
+    )
+
+
+def _build_message(email: OutboundEmail, connection) -> EmailMultiAlternatives:
+    message = EmailMultiAlternatives(
+        subject=email.subject,
+        body=email.body_text,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[email.to_email],
+        connection=connection,
+    )
+    if email.body_html:
+        message.attach_alternative(email.body_html, "text/html")
+    return message
+
+
+def _mark_failed(email: OutboundEmail, error: Exception, now) -> None:
+    email.attempts += 1
+    email.last_error = str(error)[:1000]
+    if email.attempts >= MAX_ATTEMPTS:
+        email.status = OutboundEmail.STATUS_FAILED
+    else:
+        email.status = OutboundEmail.STATUS_PENDING
+        email.next_attempt_at = now + retry_delay(email.attempts)
+
+
+def _requeue(email: OutboundEmail, error: Exception, now) -> None:
+    email.last_error = str(error)[:1000]
+    email.status = OutboundEmail.STATUS_PENDING
+    email.next_attempt_at = now + CONNECTION_RETRY_DELAY
+
+
+def _mark_sent(email: OutboundEmail) -> None:
+    email.status = OutboundEmail.STATUS_SENT
+    email.sent_at = timezone.now()
+    email.last_error = ''
+
+
+def _save_outcomes(emails: List[OutboundEmail]) -> None:
+    OutboundEmail.objects.bulk_update(
+        emails, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at'],
+    )
+
+
+def _close(connection) -> None:
+    try:
+        connection.close()
+    except Exception as e:
+        logger.warning(f"[EMAIL_QUEUE] Error cerrando la conexión de email: {e}")
+
+
+def _send_messages(emails: List[OutboundEmail], connection, now) -> Tuple[int, int, int, Optional[Exception]]:
+    """
+    Hand the emails to the backend in as few send_messages calls as possible
+
+    send_messages consumes the messages in order and stops at the first error, so
+    they are built lazily and counted as the backend takes them: when a call
+    fails, the last message taken is the one that failed, the ones before it were
+    delivered, and the rest go in another call.
+
+    Returns:
+        Tuple (sent, failed, re-queued, connection error or None)
+    """
+    sent = failed = 0
+    start = 0
+    while start < len(emails):
+        taken = 0
+
+        def messages():
+            nonlocal taken
+            for email in emails[start:]:
+                taken += 1
+                yield _build_message(email, connection)
+
+        try:
+            connection.send_messages(messages())
+        except smtplib.SMTPServerDisconnected as e:
+            # The message being sent when the server went away is re-queued with the rest
+            connection_error, delivered = e, max(taken - 1, 0)
+        except Exception as e:
+            if not taken:
+                # The backend failed before taking any message: not a rejection of one
+                connection_error, delivered = e, 0
+            else:
+                email = emails[start + taken - 1]
+                logger.warning(f"[EMAIL_QUEUE] Error enviando email {email.id} a {email.to_email}: {e}")
+                for delivered_email in emails[start:start + taken - 1]:
+                    _mark_sent(delivered_email)
+                _mark_failed(email, e, now)
+                sent += taken - 1
+                failed += 1
+                start += taken
+                continue
+        else:
+            if start + taken == len(emails):
+                for email in emails[start:]:
+                    _mark_sent(email)
+                return sent + taken, failed, 0, None
+            # The backend returned without taking every message (no open connection)
+            connection_error, delivered = smtplib.SMTPServerDisconnected('La conexión de email no está abierta'), taken
+
+        logger.error(f"[EMAIL_QUEUE] Conexión de email perdida: {connection_error}")
+        for email in emails[start:start + delivered]:
+            _mark_sent(email)
+        for email in emails[start + delivered:]:
+            _requeue(email, connection_error, now)
+        return sent + delivered, failed, len(emails) - start - delivered, connection_error
+    return sent, failed, 0, None
+
+
+def send_batch(emails: List[OutboundEmail], connection=None) -> int:
+    """
+    Send claimed emails and record the outcome of each
+
+    Args:
+        emails: Emails returned by claim_batch
+        connection: Open email backend connection, reused across batches (drain_queue).
+            Without one, a connection is opened and closed for this batch
+
+    Returns:
+        Number of emails sent
+
+    Raises:
+        EmailConnectionError: If the connection could not be opened or was dropped;
+            the unsent emails are re-queued without counting an attempt
+    """
+    if not emails:
+        return 0
+    now = timezone.now()
+    owns_connection = connection is None
+    connection = connection or get_connection()
+    if owns_connection:
+        try:
+            connection.open()
+        except Exception as e:
+            logger.error(f"[EMAIL_QUEUE] No se pudo abrir la conexión de email: {e}")
+            for email in emails:
+                _requeue(email, e, now)
+            _save_outcomes(emails)
+            raise EmailConnectionError(str(e), requeued=len(emails)) from e
+    try:
+        sent, failed, requeued, connection_error = _send_messages(emails, connection, now)
+    finally:
+        if owns_connection:
+            _close(connection)
+
+    _save_outcomes(emails)
+    if connection_error is not None:
+        raise EmailConnectionError(
+            str(connection_error), sent=sent, failed=failed, requeued=requeued,
+        ) from connection_error
+    return sent
+
+
+def drain_queue(batch_size: int = 100, max_batches: Optional[int] = None, connection=None) -> dict:
+    """
+    Send due emails until the queue is empty, over one connection for the whole run
+
+    Args:
+        batch_size: Emails claimed per batch
+        max_batches: Stop after this many batches
+        connection: Email backend connection (get_connection() by default); it is
+            opened before the first batch and closed at the end
+
+    Returns:
+        Dict with the number of 'sent' and 'failed' emails, and of the emails
+        're-queued' because the SMTP server dropped the connection (draining stops there)
+
+    Raises:
+        EmailConnectionError: If the connection could not be opened (no email is claimed)
+    """
+    totals = {'sent': 0, 'failed': 0, 'requeued': 0}
+    connection = connection or get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        logger.error(f"[EMAIL_QUEUE] No se pudo abrir la conexión de email: {e}")
+        raise EmailConnectionError(str(e)) from e
+    batches = 0
+    try:
+        while max_batches is None or batches < max_batches:
+            emails = claim_batch(batch_size)
+            if not emails:
+                break
+            try:
+                sent = send_batch(emails, connection)
+            except EmailConnectionError as e:
+                # The server went away: leave the rest of the queue for the next run
+                totals['sent'] += e.sent
+                totals['failed'] += e.failed
+                totals['requeued'] += e.requeued
+                break
+            totals['sent'] += sent
+            totals['failed'] += len(emails) - sent
+            batches += 1
+    finally:
+        _close(connection)
+    return totals
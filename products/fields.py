@@ -0,0 +1,85 @@
+import base64
+from typing import Any
+
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+
+from .series_codec import HISTORY_KINDS, decode_history, encode_history
+
+
+class EncodedHistory(bytes):
+    """Stored history bytes that have not been decoded yet"""
+
+
+class LazyHistoryAttribute(DeferredAttribute):
+    """
+    Model attribute that decodes a CompactHistoryField on first access
+
+    Rows are loaded with the encoded bytes, so listing or updating products never
+    pays for decoding histories nobody reads.
+    """
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if isinstance(value, EncodedHistory):
+            value = decode_history(self.field.kind, value)
+            instance.__dict__[self.field.attname] = value
+        return value
+
+    def __set__(self, instance, value):
+        # Defining __set__ makes this a data descriptor, so reads always go through
+        # __get__ even though the value lives in the instance __dict__
+        instance.__dict__[self.field.attname] = value
+
+
+class CompactHistoryField(models.BinaryField):
+    """
+    Binary column holding a product history encoded with series_codec
+
+    In Python the attribute is the same dict the JSON field used to hold; the
+    database stores delta-encoded int32 series compressed with zlib.
+    """
+
+    descriptor_class = LazyHistoryAttribute
+
+    def __init__(self, *args, kind: str = 'price', **kwargs):
+        """
+        Args:
+            kind: History layout: 'price', 'rating' or 'sales_rank'
+        """
+        if kind not in HISTORY_KINDS:
+            raise ValueError(f"kind debe ser uno de {HISTORY_KINDS}")
+        self.kind = kind
+        kwargs.setdefault('default', dict)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['kind'] = self.kind
+        if kwargs.get('default') is dict:
+            del kwargs['default']
+        return name, path, args, kwargs
+
+    def from_db_value(self, value, expression, connection) -> Any:
+        if value is None:
+            return {}
+        return EncodedHistory(value)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if not isinstance(value, EncodedHistory):
+            value = encode_history(self.kind, value)
+        return connection.Database.Binary(bytes(value))
+
+    def to_python(self, value) -> Any:
+        # Serialized fixtures carry the encoded bytes as base64 (see value_to_string)
+        if isinstance(value, str):
+            return EncodedHistory(base64.b64decode(value.encode('ascii')))
+        return value
+
+    def value_to_string(self, obj) -> str:
+        value = self.value_from_object(obj)
+        if not isinstance(value, EncodedHistory):
+            value = encode_history(self.kind, value)
+        return base64.b64encode(value).decode('ascii')
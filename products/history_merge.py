@@ -0,0 +1,177 @@
+"""
+Incremental merge of freshly fetched Keepa histories into the stored JSON blobs.
+
+A refresh only needs the points Keepa recorded since the previous fetch. The
+refresh paths ask Keepa for a short window (history_window_days) and append the
+points that are newer than both the last stored point of each series and the
+previous fetch, so the merged history is the same as a full rewrite would be.
+"""
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+
+# Price series in the order extract_price_history produces them
+PRICE_TYPES = ['NEW', 'AMAZON', 'USED', 'COLLECTIBLE', 'REFURBISHED']
+
+# Product fields that hold history blobs
+HISTORY_FIELDS = ['price_history', 'rating_history', 'sales_rank_history']
+
+# Keepa and server clocks are not in sync; points this close to the previous fetch are re-checked
+SYNC_MARGIN = timedelta(hours=1)
+
+
+def history_window_days(product, now: Optional[datetime] = None) -> Optional[int]:
+    """
+    Days of history to request from Keepa to refresh a stored product
+
+    Args:
+        product: Product instance
+        now: Current time (defaults to timezone.now())
+
+    Returns:
+        Window in days, or None when the product needs a full history query (never
+        synced, no stored history, or last sync older than KEEPA_HISTORY_MAX_WINDOW_DAYS)
+    """
+    synced_at = getattr(product, 'history_synced_at', None)
+    if synced_at is None or not product.price_history:
+        return None
+
+    now = now or timezone.now()
+    elapsed = now - synced_at + SYNC_MARGIN
+    # One extra day so the window always starts before the merge cutoff
+    days = math.ceil(elapsed.total_seconds() / 86400) + 1
+    if days > getattr(settings, 'KEEPA_HISTORY_MAX_WINDOW_DAYS', 30):
+        return None
+    return days
+
+
+def _cutoff(stored_last: Optional[str], synced_at: datetime, separator: str) -> str:
+    """Latest timestamp (as a stored string) already covered by the stored history"""
+    synced = timezone.make_naive(synced_at - SYNC_MARGIN, dt_timezone.utc)
+    synced_str = synced.strftime(f'%Y-%m-%d{separator}%H:%M:%S')
+    if stored_last and stored_last > synced_str:
+        return stored_last
+    return synced_str
+
+
+def _merge_price_series(stored: Dict[str, List], fresh: Dict[str, List], synced_at: datetime) -> Optional[Dict[str, List]]:
+    """Append the fresh points of one price series; None if the stored series is malformed"""
+    prices = stored.get('prices', [])
+    times = stored.get('times', [])
+    formatted_times = stored.get('formatted_times', [])
+    if not (len(prices) == len(times) == len(formatted_times)):
+        return None
+    fresh_prices = fresh.get('prices', [])
+    fresh_times = fresh.get('times', [])
+    fresh_formatted = fresh.get('formatted_times', [])
+    if not (len(fresh_prices) == len(fresh_times) == len(fresh_formatted)):
+        return None
+
+    cutoff = _cutoff(times[-1] if times else None, synced_at, 'T')
+    start = next((i for i, t in enumerate(fresh_times) if t > cutoff), len(fresh_times))
+    return {
+        'prices': prices + fresh_prices[start:],
+        'times': times + fresh_times[start:],
+        'formatted_times': formatted_times + fresh_formatted[start:],
+    }
+
+
+def merge_price_history(stored: Dict[str, Any], fresh: Dict[str, Any], synced_at: datetime) -> Optional[Dict[str, Any]]:
+    """
+    Merge a windowed price_history into the stored one
+
+    Args:
+        stored: Product.price_history as stored
+        fresh: price_history parsed from the windowed Keepa response
+        synced_at: Start time of the fetch that produced the stored history
+
+    Returns:
+        Merged price_history, or None if the stored history cannot be merged safely
+    """
+    merged = {}
+    for price_type in PRICE_TYPES:
+        if price_type not in stored and price_type not in fresh:
+            continue
+        series = _merge_price_series(stored.get(price_type, {}), fresh.get(price_type, {}), synced_at)
+        if series is None:
+            return None
+        merged[price_type] = series
+    return merged
+
+
+def _merge_dated_history(
+    stored: Dict[str, Any],
+    fresh: Dict[str, Any],
+    synced_at: datetime,
+    points_key: str,
+    value_key: str,
+) -> Optional[Dict[str, Any]]:
+    """Shared merge for rating_history and sales_rank_history"""
+    if not stored and not fresh:
+        return {}
+    points = stored.get(points_key, [])
+    dates = stored.get('formatted_times', [])
+    values = stored.get('values', [])
+    if not (len(points) == len(dates) == len(values)):
+        return None
+
+    cutoff = _cutoff(dates[-1] if dates else None, synced_at, ' ')
+    new_points = [point for point in fresh.get(points_key, []) if point['date'] > cutoff]
+    return {
+        points_key: points + new_points,
+        'formatted_times': dates + [point['date'] for point in new_points],
+        'values': values + [point[value_key] for point in new_points],
+    }
+
+
+def merge_rating_history(stored: Dict[str, Any], fresh: Dict[str, Any], synced_at: datetime) -> Optional[Dict[str, Any]]:
+    """Merge a windowed rating_history into the stored one (see merge_price_history)"""
+    return _merge_dated_history(stored, fresh, synced_at, 'ratings', 'rating')
+
+
+def merge_sales_rank_history(stored: Dict[str, Any], fresh: Dict[str, Any], synced_at: datetime) -> Optional[Dict[str, Any]]:
+    """Merge a windowed sales_rank_history into the stored one (see merge_price_history)"""
+    return _merge_dated_history(stored, fresh, synced_at, 'sales_ranks', 'salesRank')
+
+
+def merge_product_data(product, product_data: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], List[str]]:
+    """
+    Merge the histories of a windowed Keepa result into a stored product
+
+    The current prices are recomputed from the merged series, since a window with
+    no valid price would otherwise lose the last known one. Scalar values that only
+    come from the csv fallback keep their stored value when the window has none.
+
+    Args:
+        product: Product instance with the stored histories and history_synced_at
+        product_data: Result of KeepaService.parse_product_data for the window
+
+    Returns:
+        Tuple (merged product_data, changed history field names). The merged data is
+        None when a stored history is malformed and a full query is needed instead
+    """
+    synced_at = product.history_synced_at
+    price_history = merge_price_history(product.price_history or {}, product_data.get('price_history') or {}, synced_at)
+    rating_history = merge_rating_history(product.rating_history or {}, product_data.get('rating_history') or {}, synced_at)
+    sales_rank_history = merge_sales_rank_history(
+        product.sales_rank_history or {}, product_data.get('sales_rank_history') or {}, synced_at
+    )
+    if price_history is None or rating_history is None or sales_rank_history is None:
+        return None, []
+
+    merged = dict(product_data)
+    merged['price_history'] = price_history
+    merged['rating_history'] = rating_history
+    merged['sales_rank_history'] = sales_rank_history
+    for price_type, field_name in [('NEW', 'current_price_new'), ('AMAZON', 'current_price_amazon'), ('USED', 'current_price_used')]:
+        prices = price_history.get(price_type, {}).get('prices', [])
+        merged[field_name] = prices[-1] if prices else None
+    for field_name in ['rating', 'review_count', 'sales_rank_current']:
+        if merged.get(field_name) is None:
+            merged[field_name] = getattr(product, field_name)
+
+    changed = [name for name in HISTORY_FIELDS if merged[name] != getattr(product, name)]
+    return merged, changed
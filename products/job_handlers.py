@@ -0,0 +1,76 @@
+"""
+Handlers of the background job kinds (see jobs.py).
+
+Each handler receives the job payload and the Job, and returns a
+JSON-serializable result that job_status_view hands to the page.
+"""
+from typing import Any, Dict
+
+from django.utils import timezone
+
+from .jobs import PermanentJobError, job_handler
+from .models import Job, Product
+from .openai_service import OpenAIService
+from .product_freshness import REFRESH_JOB, refresh_product, synced_at
+
+AI_SUMMARY_JOB = 'ai_summary'
+
+# Jobs about a product rather than a user: they are deduplicated per ASIN, so any
+# user who can see the product may follow the job another user queued
+PRODUCT_JOB_KINDS = (REFRESH_JOB, AI_SUMMARY_JOB)
+
+
+@job_handler(REFRESH_JOB)
+def refresh_product_job(payload: Dict[str, Any], job: Job) -> Dict[str, Any]:
+    """Refresh a stored product from Keepa (payload: asin)"""
+    product = refresh_product(payload['asin'])
+    if product is None:
+        raise PermanentJobError(f"No se pudo refrescar el producto {payload['asin']}")
+    return {'asin': product.asin, 'synced_at': synced_at(product).isoformat()}
+
+
+def summary_input(product: Product) -> Dict[str, Any]:
+    """Product data sent to OpenAI for the price summary"""
+    return {
+        'title': product.title,
+        'brand': product.brand,
+        'categories': product.categories,
+        'asin': product.asin,
+        # PRECIOS - Historial completo
+        'price_history': product.price_history,
+        'current_price_new': product.current_price_new,
+        'current_price_amazon': product.current_price_amazon,
+        'current_price_used': product.current_price_used,
+        # VENTAS - Actual + Historial
+        'sales_rank_current': product.sales_rank_current,
+        'sales_rank_history': product.sales_rank_history,
+        # REPUTACIÓN - Actual + Historiales
+        'rating': product.rating,
+        'review_count': product.review_count,
+        'rating_history': product.rating_history,
+        'reviews_data': product.reviews_data,
+    }
+
+
+@job_handler(AI_SUMMARY_JOB)
+def ai_summary_job(payload: Dict[str, Any], job: Job) -> Dict[str, Any]:
+    """Generate and store the AI price summary of a product (payload: asin)"""
+    product = Product.objects.filter(asin=payload['asin']).first()
+    if product is None:
+        raise PermanentJobError('Producto no encontrado')
+    try:
+        openai_service = OpenAIService()
+    except ValueError as e:
+        raise PermanentJobError('OpenAI no está configurado. Por favor, contacta al administrador.') from e
+
+    ai_summary = openai_service.generate_price_summary(summary_input(product))
+    if not ai_summary:
+        raise PermanentJobError('No se pudo generar el resumen. Verifica que el producto tenga historial de precios.')
+
+    product.ai_summary = ai_summary
+    product.ai_summary_generated_at = timezone.now()
+    product.save(update_fields=['ai_summary', 'ai_summary_generated_at'])
+    return {
+        'summary': ai_summary,
+        'generated_at': timezone.localtime(product.ai_summary_generated_at).strftime('%d/%m/%Y %H:%M'),
+    }
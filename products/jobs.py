@@ -0,0 +1,255 @@
+"""
+Database-backed background job queue.
+
+Slow work (Keepa refreshes, OpenAI summaries) used to run inside the request,
+pinning a gunicorn worker for as long as the external API took. Views now call
+enqueue_job() and return at once; the run_workers command claims due jobs with
+SELECT ... FOR UPDATE SKIP LOCKED and runs them in a pool of threads (and
+optionally processes). The page follows the job through job_status_view.
+
+Claiming follows the email queue (email_queue.py): a claimed job moves to
+'running' with run_at set to the end of a lease, so a worker that dies only
+delays the job until the lease expires. Failed jobs are retried with
+exponential backoff up to max_attempts; handlers raise PermanentJobError for
+failures a retry cannot fix.
+
+Handlers are registered by kind with @job_handler (see job_handlers.py, loaded
+by ProductsConfig.ready()). With JOB_QUEUE_ENABLED off (the default, for
+deployments without workers), each job is run by a background thread of the
+process that enqueued it. That thread is the only thing that will ever run the
+job, so if the process dies first (worker recycle, deploy, crash) or a failed
+attempt is left waiting for a retry, the job is abandoned; enqueue_job starts it
+again when its key is requested, instead of handing back a job nobody runs.
+
+Fetching a product that is not stored yet stays inline (_fetch_missing_product
+in views.py): the page has nothing to render until Keepa answers, and
+single_flight already keeps concurrent requests for it down to one call.
+"""
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .email_queue import retry_delay
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Time a worker has to finish a claimed job before another worker may take it
+JOB_LEASE = timedelta(minutes=10)
+
+# Without workers, time a due job may wait for its thread before it is considered abandoned
+INLINE_START_TIMEOUT = timedelta(minutes=1)
+
+JOB_HANDLERS: Dict[str, Callable[[Dict[str, Any], Job], Any]] = {}
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler when retrying the job cannot succeed"""
+
+
+def job_handler(kind: str):
+    """Register the decorated function as the handler of a job kind"""
+    def register(handler):
+        JOB_HANDLERS[kind] = handler
+        return handler
+    return register
+
+
+def job_queue_enabled() -> bool:
+    """Whether jobs wait for run_workers instead of running in a thread of the enqueuing process"""
+    return getattr(settings, 'JOB_QUEUE_ENABLED', False)
+
+
+def enqueue_job(kind: str, payload: Optional[Dict[str, Any]] = None, user=None, key: str = '', max_attempts: int = 3) -> Job:
+    """
+    Add a job to the queue
+
+    Args:
+        kind: Registered job kind
+        payload: JSON-serializable arguments of the handler
+        user: User the job belongs to (only they can see its status, except for the
+            product jobs of job_handlers.PRODUCT_JOB_KINDS)
+        key: Deduplication key; while a job with the same key is unfinished it is
+            returned instead of queuing another one (an abandoned one is started again)
+        max_attempts: Attempts before the job is marked as failed
+
+    Returns:
+        The queued (or already unfinished) job
+    """
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f'Tipo de trabajo desconocido: {kind}')
+    if key:
+        existing = Job.objects.filter(key=key, status__in=Job.UNFINISHED_STATUSES).first()
+        if existing is not None:
+            if is_abandoned(existing):
+                logger.warning(f"[JOBS] {existing} abandonado por su hilo; se ejecuta de nuevo")
+                _start_in_thread(existing.pk)
+            return existing
+    job = Job.objects.create(kind=kind, key=key, payload=payload or {}, user=user, max_attempts=max_attempts)
+    if not job_queue_enabled():
+        _start_in_thread(job.pk)
+    return job
+
+
+def is_abandoned(job: Job, now: Optional[datetime] = None) -> bool:
+    """
+    Whether an unfinished job will never run unless it is started again
+
+    With workers, a job whose lease expired is claimed again by run_workers, so
+    only jobs run in threads of the enqueuing process can be abandoned.
+
+    Args:
+        job: Unfinished job
+        now: Current time (defaults to now)
+
+    Returns:
+        True if the job's thread died or never picked it up
+    """
+    if job_queue_enabled() or job.status not in Job.UNFINISHED_STATUSES:
+        return False
+    now = now or timezone.now()
+    if job.status == Job.STATUS_RUNNING:
+        return job.run_at <= now
+    return job.run_at <= now - INLINE_START_TIMEOUT
+
+
+def _start_in_thread(job_id: int) -> None:
+    transaction.on_commit(lambda: threading.Thread(
+        target=_run_in_thread, args=(job_id,), name=f'job-{job_id}', daemon=True,
+    ).start())
+
+
+def _claim(queryset, worker_id: str, batch_size: int) -> List[Job]:
+    now = timezone.now()
+    lease_end = now + JOB_LEASE
+    due = queryset.filter(status__in=Job.UNFINISHED_STATUSES, run_at__lte=now)
+    with transaction.atomic():
+        ids = list(
+            due.select_for_update(skip_locked=True)
+            .order_by('run_at')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return []
+        # The conditional UPDATE keeps two workers from claiming the same job on
+        # backends without SKIP LOCKED
+        due.filter(id__in=ids).update(
+            status=Job.STATUS_RUNNING, run_at=lease_end, worker=worker_id, started_at=now,
+        )
+    return list(
+        Job.objects.filter(id__in=ids, status=Job.STATUS_RUNNING, worker=worker_id, run_at=lease_end).order_by('id')
+    )
+
+
+def claim_jobs(worker_id: str, batch_size: int = 1, kinds: Optional[List[str]] = None) -> List[Job]:
+    """
+    Claim the next due jobs
+
+    Args:
+        worker_id: Id of the claiming worker
+        batch_size: Maximum number of jobs
+        kinds: Only claim jobs of these kinds
+
+    Returns:
+        Claimed jobs, oldest first
+    """
+    queryset = Job.objects.all()
+    if kinds:
+        queryset = queryset.filter(kind__in=kinds)
+    return _claim(queryset, worker_id, batch_size)
+
+
+def run_job(job: Job) -> bool:
+    """
+    Run a claimed job and record its outcome
+
+    Args:
+        job: Job returned by claim_jobs
+
+    Returns:
+        True if the job succeeded
+    """
+    job.attempts += 1
+    now = timezone.now()
+    handler = JOB_HANDLERS.get(job.kind)
+    try:
+        if handler is None:
+            raise PermanentJobError(f'Tipo de trabajo desconocido: {job.kind}')
+        job.result = handler(job.payload, job)
+    except Exception as e:
+        job.last_error = str(e)[:1000]
+        if isinstance(e, PermanentJobError) or job.attempts >= job.max_attempts:
+            job.status = Job.STATUS_FAILED
+            job.finished_at = timezone.now()
+            logger.error(f"[JOBS] {job} falló definitivamente: {e}")
+        else:
+            job.status = Job.STATUS_PENDING
+            job.run_at = now + retry_delay(job.attempts)
+            logger.warning(f"[JOBS] {job} falló (intento {job.attempts}/{job.max_attempts}): {e}")
+    else:
+        job.status = Job.STATUS_SUCCEEDED
+        job.last_error = ''
+        job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'attempts', 'run_at', 'result', 'last_error', 'finished_at'])
+    return job.status == Job.STATUS_SUCCEEDED
+
+
+def run_due_jobs(worker_id: str, kinds: Optional[List[str]] = None, max_jobs: Optional[int] = None) -> Dict[str, int]:
+    """
+    Run due jobs one at a time until none is left
+
+    Args:
+        worker_id: Id of the worker
+        kinds: Only run jobs of these kinds
+        max_jobs: Stop after this many jobs
+
+    Returns:
+        Dict with the number of 'succeeded' and 'failed' attempts
+    """
+    totals = {'succeeded': 0, 'failed': 0}
+    while max_jobs is None or sum(totals.values()) < max_jobs:
+        jobs = claim_jobs(worker_id, 1, kinds)
+        if not jobs:
+            break
+        totals['succeeded' if run_job(jobs[0]) else 'failed'] += 1
+    return totals
+
+
+def _run_in_thread(job_id: int) -> None:
+    close_old_connections()
+    try:
+        jobs = _claim(Job.objects.filter(pk=job_id), f'inline:{threading.get_ident()}', 1)
+        if jobs:
+            run_job(jobs[0])
+    except Exception as e:
+        logger.error(f"[JOBS] Error ejecutando el trabajo {job_id} en segundo plano: {e}")
+    finally:
+        connection.close()
+
+
+def job_status(job: Job) -> Dict[str, Any]:
+    """
+    Public state of a job (job_status_view)
+
+    Args:
+        job: Job
+
+    Returns:
+        JSON-serializable dict
+    """
+    return {
+        'id': job.pk,
+        'kind': job.kind,
+        'status': job.status,
+        'done': job.status not in Job.UNFINISHED_STATUSES,
+        'attempts': job.attempts,
+        'result': job.result,
+        'error': job.last_error if job.status == Job.STATUS_FAILED else '',
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
@@ -0,0 +1,210 @@
+import hashlib
+import logging
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import KeepaTokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Interactive page loads may spend the whole bucket; batch jobs must leave the
+# interactive reserve untouched and back off until it refills
+PRIORITY_INTERACTIVE = 'interactive'
+PRIORITY_BATCH = 'batch'
+
+# Estimated token cost of each Keepa call, reconciled with the real consumption afterwards
+KEEPA_CALL_COSTS = {
+    'product': 1,           # per ASIN
+    'product_rating': 1,    # extra per ASIN when rating=True
+    'best_sellers': 50,
+    'category_lookup': 1,
+    'category_search': 1,
+    'product_finder': 10,
+}
+
+# Reservations are released by commit(); if none was made for this long, whatever
+# is still recorded as reserved belongs to callers that died before committing
+RESERVATION_TTL = timedelta(minutes=10)
+
+
+class TokenBudgetExceeded(RuntimeError):
+    """Raised when the shared Keepa token budget cannot cover a call in time"""
+
+
+@dataclass
+class TokenReservation:
+    """Tokens reserved from the shared bucket before a Keepa call"""
+    tokens: int
+    priority: str
+
+
+class KeepaTokenBudget:
+    """
+    Token-bucket governor shared by every process through the database.
+
+    Web workers and management commands reserve the estimated cost of each Keepa
+    call before running it, then commit the tokens Keepa actually consumed. The
+    bucket row is locked with SELECT ... FOR UPDATE, so concurrent reservations
+    never double-spend the same tokens.
+
+    Reserved tokens are also kept in bucket.reserved until committed: Keepa's
+    tokensLeft only counts requests it has already received, so when the balance
+    is synced to it the tokens other callers reserved but have not spent yet are
+    subtracted again.
+    """
+
+    def __init__(self, priority: str = PRIORITY_INTERACTIVE, api_key: Optional[str] = None):
+        """
+        Initialize the budget for a caller priority
+
+        Args:
+            priority: PRIORITY_INTERACTIVE or PRIORITY_BATCH
+            api_key: Keepa API key the bucket belongs to. Defaults to settings.KEEPA_API_KEY
+        """
+        self.priority = priority
+        api_key = api_key or settings.KEEPA_API_KEY or ''
+        # Never store the key itself, only a short fingerprint to tell buckets apart
+        self.bucket_name = hashlib.sha256(api_key.encode()).hexdigest()[:16]
+        self.enabled = getattr(settings, 'KEEPA_TOKEN_BUDGET_ENABLED', True)
+
+    @property
+    def max_wait(self) -> float:
+        """Seconds a reservation may wait for tokens before giving up"""
+        if self.priority == PRIORITY_BATCH:
+            return getattr(settings, 'KEEPA_BATCH_MAX_WAIT', 600)
+        return getattr(settings, 'KEEPA_INTERACTIVE_MAX_WAIT', 5)
+
+    def _get_bucket(self) -> KeepaTokenBucket:
+        """Fetch and lock the shared bucket row, creating it on first use"""
+        refill_rate = getattr(settings, 'KEEPA_TOKENS_PER_MINUTE', 20)
+        bucket, _ = KeepaTokenBucket.objects.select_for_update().get_or_create(
+            name=self.bucket_name,
+            defaults={
+                'tokens': refill_rate * 60,
+                'capacity': refill_rate * 60,
+                'refill_rate': refill_rate,
+            },
+        )
+        return bucket
+
+    def _floor(self, bucket: KeepaTokenBucket) -> float:
+        """Tokens that must remain in the bucket after a reservation of this priority"""
+        if self.priority == PRIORITY_BATCH:
+            return bucket.capacity * getattr(settings, 'KEEPA_INTERACTIVE_RESERVE', 0.2)
+        return 0
+
+    def _expire_reservations(self, bucket: KeepaTokenBucket) -> None:
+        """Drop reservations left behind by callers that never committed them"""
+        if bucket.reserved and (bucket.reserved_at is None or bucket.reserved_at < timezone.now() - RESERVATION_TTL):
+            logger.warning(f"Keepa token budget: releasing {bucket.reserved:.0f} stale reserved tokens")
+            bucket.reserved = 0
+
+    def reserve(self, cost: int) -> Optional[TokenReservation]:
+        """
+        Reserve tokens for a Keepa call, waiting for a refill when needed
+
+        Inside a transaction (connection.in_atomic_block) the bucket row lock would
+        be held for the whole wait, blocking every other caller, so the reservation
+        is only attempted once.
+
+        Args:
+            cost: Estimated token cost of the call
+
+        Returns:
+            TokenReservation to pass to commit(), or None when the budget is disabled
+
+        Raises:
+            TokenBudgetExceeded: If the tokens are not available within max_wait (or
+                right away inside a transaction)
+        """
+        if not self.enabled:
+            return None
+
+        can_wait = not connection.in_atomic_block
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            with transaction.atomic():
+                bucket = self._get_bucket()
+                bucket.refill()
+                self._expire_reservations(bucket)
+                floor = self._floor(bucket)
+                if bucket.tokens - cost >= floor:
+                    bucket.tokens -= cost
+                    bucket.reserved += cost
+                    bucket.reserved_at = timezone.now()
+                    bucket.save(update_fields=['tokens', 'reserved', 'reserved_at', 'updated_at'])
+                    return TokenReservation(tokens=cost, priority=self.priority)
+                missing = cost + floor - bucket.tokens
+                wait_seconds = missing / max(bucket.refill_rate, 0.1) * 60
+                # Save the refill so other processes see a consistent balance
+                bucket.save(update_fields=['tokens', 'reserved', 'updated_at'])
+
+            remaining = deadline - time.monotonic()
+            if not can_wait or remaining <= 0:
+                raise TokenBudgetExceeded(
+                    f"TOKEN_BUDGET_EXCEEDED: {cost} tokens ({self.priority}) not available"
+                    + ('' if can_wait else ' (inside a transaction, not waiting)')
+                )
+            sleep_for = min(wait_seconds, remaining, 30)
+            logger.info(f"Keepa token budget ({self.priority}): waiting {sleep_for:.1f}s for {cost} tokens")
+            time.sleep(sleep_for)
+
+    def commit(self, reservation: Optional[TokenReservation], api=None) -> None:
+        """
+        Record the tokens actually consumed by a call that used a reservation
+
+        The difference between the estimate and the real consumption is returned to
+        (or taken from) the bucket. When the call sent requests to Keepa, the balance
+        and refill rate are synced to the values Keepa reported to them, minus the
+        tokens other callers still hold reserved. A call that sent no request (served
+        from cache, failed before reaching Keepa) gets its whole reservation back.
+
+        Args:
+            reservation: Value returned by reserve()
+            api: Keepa client used for the call (PooledKeepa), optional
+        """
+        if reservation is None:
+            return
+
+        consumed = None
+        tokens_left = None
+        refill_rate = None
+        if api is not None and hasattr(api, 'pop_request_status'):
+            request_status = api.pop_request_status()
+            if request_status is None:
+                consumed = 0
+            else:
+                consumed = request_status['tokens_consumed']
+                tokens_left = request_status['tokens_left']
+                refill_rate = request_status['refill_rate']
+
+        try:
+            with transaction.atomic():
+                bucket = self._get_bucket()
+                bucket.refill()
+                self._expire_reservations(bucket)
+                bucket.reserved = max(bucket.reserved - reservation.tokens, 0)
+                if consumed is not None:
+                    bucket.tokens += reservation.tokens - consumed
+                if refill_rate:
+                    bucket.refill_rate = refill_rate
+                    bucket.capacity = int(refill_rate * 60)
+                if tokens_left is not None:
+                    # Keepa's own counter is the source of truth across all callers, but it
+                    # does not know yet about the tokens other callers have reserved
+                    bucket.tokens = tokens_left - bucket.reserved
+                    bucket.synced_at = timezone.now()
+                bucket.tokens = min(bucket.tokens, bucket.capacity)
+                bucket.save()
+        except Exception as e:
+            # Accounting must never break the call that already succeeded
+            logger.warning(f"Error registrando consumo de tokens Keepa: {e}")
+
+        if consumed is not None and consumed != reservation.tokens:
+            logger.debug(f"Keepa tokens: estimated {reservation.tokens}, consumed {consumed}")
@@ -0,0 +1,257 @@
+import copy
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import InvalidCacheBackendError, caches
+
+logger = logging.getLogger(__name__)
+
+# Seconds each kind of Keepa response stays valid. Overridable with settings.KEEPA_CACHE_TTLS
+DEFAULT_KEEPA_CACHE_TTLS = {
+    'product': 15 * 60,            # Per ASIN, keyed by the query options
+    'best_sellers': 60 * 60,
+    'category_lookup': 24 * 60 * 60,
+    'category_search': 24 * 60 * 60,
+}
+
+# In-process marker for cached "no result" responses, told apart from a cache miss
+_MISSING = object()
+
+
+class KeepaResponseCache:
+    """
+    Two-tier cache for raw Keepa responses.
+
+    The first tier is a bounded in-process LRU, so repeated lookups inside a worker
+    do not even unpickle. The second tier is the Django cache configured under
+    settings.KEEPA_CACHE_ALIAS (file-based by default), shared by every process on
+    the host. Keys combine the call type, the Amazon domain and the call parameters.
+
+    Callers get their own copy of each response (callers such as the product
+    parsers add keys to the payloads), so an entry can never be changed through
+    a value handed out earlier.
+    """
+
+    def __init__(self, max_entries: int = 256, alias: Optional[str] = None):
+        """
+        Initialize the cache tiers
+
+        Args:
+            max_entries: Maximum number of responses kept in the in-process LRU
+            alias: Django cache alias of the persistent tier. None disables the tier
+        """
+        self.max_entries = max_entries
+        self.alias = alias
+        self._entries: 'OrderedDict[str, Tuple[float, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    @property
+    def persistent(self):
+        """Django cache backend of the persistent tier, or None if unavailable"""
+        if not self.alias:
+            return None
+        try:
+            return caches[self.alias]
+        except InvalidCacheBackendError:
+            return None
+
+    def ttl(self, call_type: str) -> int:
+        """Seconds a response of this call type stays valid"""
+        ttls = {**DEFAULT_KEEPA_CACHE_TTLS, **getattr(settings, 'KEEPA_CACHE_TTLS', {})}
+        return ttls.get(call_type, 0)
+
+    def make_key(self, call_type: str, domain: str, params: Dict[str, Any]) -> str:
+        """
+        Build a stable cache key for a Keepa call
+
+        Args:
+            call_type: Kind of call ('product', 'best_sellers', ...)
+            domain: Amazon domain ('MX', 'US', ...)
+            params: Parameters that change the response
+
+        Returns:
+            Cache key string
+        """
+        digest = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+        return f"keepa:{call_type}:{domain}:{digest}"
+
+    def _count(self, call_type: str, outcome: str) -> None:
+        with self._lock:
+            counters = self._stats.setdefault(call_type, {'memory_hits': 0, 'persistent_hits': 0, 'misses': 0})
+            counters[outcome] += 1
+
+    def get(self, call_type: str, domain: str, params: Dict[str, Any]) -> Tuple[bool, Any]:
+        """
+        Look up a cached response
+
+        Args:
+            call_type: Kind of call ('product', 'best_sellers', ...)
+            domain: Amazon domain
+            params: Parameters that change the response
+
+        Returns:
+            Tuple (found, value), value being a copy of the cached response
+        """
+        ttl = self.ttl(call_type)
+        if ttl <= 0:
+            return False, None
+
+        key = self.make_key(call_type, domain, params)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                else:
+                    del self._entries[key]
+                    entry = None
+        if entry is not None:
+            self._count(call_type, 'memory_hits')
+            return True, None if entry[1] is _MISSING else copy.deepcopy(entry[1])
+
+        backend = self.persistent
+        if backend is not None:
+            try:
+                stored = backend.get(key)
+            except Exception as e:
+                logger.warning(f"Error leyendo caché de Keepa ({call_type}): {e}")
+                stored = None
+            if stored is not None:
+                expires_at, value = stored
+                # The unpickled value goes to the LRU tier; the caller gets a copy
+                self._remember(key, expires_at, _MISSING if value is None else value)
+                self._count(call_type, 'persistent_hits')
+                return True, copy.deepcopy(value)
+
+        self._count(call_type, 'misses')
+        return False, None
+
+    def set(self, call_type: str, domain: str, params: Dict[str, Any], value: Any) -> None:
+        """
+        Store a response in both tiers
+
+        Args:
+            call_type: Kind of call ('product', 'best_sellers', ...)
+            domain: Amazon domain
+            params: Parameters that change the response
+            value: Response to cache. Pandas DataFrames are stripped from product payloads
+        """
+        ttl = self.ttl(call_type)
+        if ttl <= 0:
+            return
+
+        if call_type == 'product' and isinstance(value, dict):
+            value = strip_dataframes(value)
+        # The caller keeps using (and may change) the value it just fetched
+        value = copy.deepcopy(value)
+
+        key = self.make_key(call_type, domain, params)
+        expires_at = time.time() + ttl
+        self._remember(key, expires_at, _MISSING if value is None else value)
+
+        backend = self.persistent
+        if backend is not None:
+            try:
+                backend.set(key, (expires_at, value), timeout=ttl)
+            except Exception as e:
+                logger.warning(f"Error guardando caché de Keepa ({call_type}): {e}")
+
+    def _remember(self, key: str, expires_at: float, value: Any) -> None:
+        """Insert into the LRU tier, evicting the least recently used entries"""
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop the in-process tier and reset the counters (the persistent tier is kept)"""
+        with self._lock:
+            self._entries.clear()
+            self._stats.clear()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Hit/miss counters of this process, per call type
+
+        Returns:
+            Dict like {'product': {'memory_hits': 3, 'persistent_hits': 1, 'misses': 2}}
+        """
+        with self._lock:
+            return {call_type: dict(counters) for call_type, counters in self._stats.items()}
+
+
+def report_cache_stats(write: Optional[Callable[[str], None]] = None) -> Dict[str, Dict[str, int]]:
+    """
+    Log this process's cache counters, one line per call type
+
+    The counters live in each process, so commands report them when they finish
+    (check_price_alerts, fetch_product, run_workers).
+
+    Args:
+        write: Optional callable that also receives each line (e.g. self.stdout.write)
+
+    Returns:
+        The counters, as returned by KeepaResponseCache.stats()
+    """
+    cache = get_keepa_cache()
+    stats = cache.stats() if cache is not None else {}
+    for call_type, counters in sorted(stats.items()):
+        hits = counters['memory_hits'] + counters['persistent_hits']
+        total = hits + counters['misses']
+        line = (
+            f"Caché Keepa {call_type}: {counters['memory_hits']} aciertos en memoria, "
+            f"{counters['persistent_hits']} en disco, {counters['misses']} fallos "
+            f"({hits / total:.0%} aciertos)"
+        )
+        logger.info(f"[KEEPA_CACHE] {line}")
+        if write is not None:
+            write(line)
+    return stats
+
+
+def strip_dataframes(product: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Return a shallow copy of a product payload without the pandas DataFrames
+
+    The keepa client adds `df_*` DataFrames next to the history arrays; nothing in
+    the app reads them and they dominate the pickled size of a cached payload.
+    """
+    data = product.get('data')
+    if not isinstance(data, dict) or not any(str(k).startswith('df_') for k in data):
+        return product
+    product = dict(product)
+    product['data'] = {k: v for k, v in data.items() if not str(k).startswith('df_')}
+    return product
+
+
+_cache: Optional[KeepaResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_keepa_cache() -> Optional[KeepaResponseCache]:
+    """
+    Return the process-wide Keepa response cache
+
+    Returns:
+        Shared KeepaResponseCache, or None when settings.KEEPA_CACHE_ENABLED is False
+    """
+    global _cache
+    if not getattr(settings, 'KEEPA_CACHE_ENABLED', True):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = KeepaResponseCache(
+                    max_entries=getattr(settings, 'KEEPA_CACHE_LRU_SIZE', 256),
+                    alias=getattr(settings, 'KEEPA_CACHE_ALIAS', 'keepa'),
+                )
+    return _cache
@@ -0,0 +1,180 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import keepa
+import requests
+from django.conf import settings
+from keepa.interface import SCODES
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+KEEPA_API_URL = "https://api.keepa.com"
+
+
+class PooledKeepa(keepa.Keepa):
+    """
+    keepa.Keepa client that sends every request through one pooled HTTP session.
+
+    The upstream client calls `requests.get` for each request, which opens a new
+    TCP/TLS connection every time. This subclass keeps the connections alive and
+    reuses them across requests and threads of the same worker process.
+    """
+
+    def __init__(self, accesskey: str, timeout: float = 10.0, pool_size: int = 10):
+        """
+        Initialize the client and its HTTP connection pool
+
+        Args:
+            accesskey: Keepa API key
+            timeout: Timeout in seconds for each HTTP request
+            pool_size: Maximum number of pooled connections kept open
+        """
+        super().__init__(accesskey, timeout=timeout)
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._session.mount("https://", adapter)
+        self._status_checked_at: Optional[float] = None
+        # Token status reported to the requests of each thread, read by the token budget
+        self._thread_status = threading.local()
+
+    def token_status(self, max_age: float = 60.0) -> Dict[str, Any]:
+        """
+        Return the token status, refreshing it only when it is older than max_age
+
+        Every Keepa response already carries the token status, so an explicit
+        status round trip is only needed when the client has been idle.
+
+        Args:
+            max_age: Maximum age in seconds of the cached status
+
+        Returns:
+            Dict with tokensLeft, refillIn, refillRate and timestamp
+        """
+        checked_at = self._status_checked_at
+        if checked_at is None or time.monotonic() - checked_at > max_age:
+            self.update_status()
+        return self.status
+
+    def pop_request_status(self) -> Optional[Dict[str, Any]]:
+        """
+        Return what Keepa reported to this thread's requests since the last call
+
+        self.status is shared by every thread of the process and may come from
+        another thread's request (or an old one), so the token budget only trusts
+        the values seen by the requests of the call it is accounting for.
+
+        Returns:
+            Dict with 'tokens_consumed' (summed, None if not reported) and the
+            'tokens_left' and 'refill_rate' of the last response, or None if the
+            thread sent no request
+        """
+        status = getattr(self._thread_status, 'value', None)
+        self._thread_status.value = None
+        return status
+
+    def _request(self, request_type, payload, wait: bool = True, raw_response: bool = False):
+        """
+        Query the Keepa API server through the pooled session
+
+        Mirrors keepa.Keepa._request: updates the token status from every response
+        and waits for a token refill on HTTP 429 when `wait` is enabled.
+        """
+        while True:
+            raw = self._session.get(
+                f"{KEEPA_API_URL}/{request_type}/?",
+                params=payload,
+                timeout=self._timeout,
+            )
+            status_code = str(raw.status_code)
+
+            try:
+                response = raw.json()
+            except Exception:
+                raise RuntimeError(f"Invalid JSON from Keepa API (status {status_code})")
+
+            # The user status is returned with every response
+            thread_status = getattr(self._thread_status, 'value', None) or {
+                'tokens_consumed': None, 'tokens_left': None, 'refill_rate': None,
+            }
+            if "tokensLeft" in response:
+                self.tokens_left = response["tokensLeft"]
+                self.status["tokensLeft"] = self.tokens_left
+                self._status_checked_at = time.monotonic()
+                thread_status['tokens_left'] = response["tokensLeft"]
+            for key in ["refillIn", "refillRate", "timestamp"]:
+                if key in response:
+                    self.status[key] = response[key]
+            if "refillRate" in response:
+                thread_status['refill_rate'] = response["refillRate"]
+            if "tokensConsumed" in response:
+                thread_status['tokens_consumed'] = (thread_status['tokens_consumed'] or 0) + response["tokensConsumed"]
+            self._thread_status.value = thread_status
+
+            if status_code == "200":
+                if raw_response:
+                    return raw
+                return response
+
+            if status_code == "429" and wait:
+                tdelay = self.time_to_refill
+                logger.warning(f"Waiting {tdelay:.0f} seconds for additional Keepa tokens")
+                time.sleep(tdelay)
+                continue
+
+            if status_code in SCODES:
+                raise RuntimeError(SCODES[status_code])
+            raise RuntimeError(f"REQUEST_FAILED. Status code: {status_code}")
+
+
+_clients: Dict[Tuple[int, str], PooledKeepa] = {}
+_clients_lock = threading.Lock()
+
+
+def get_keepa_client(api_key: Optional[str] = None) -> PooledKeepa:
+    """
+    Return the process-wide Keepa client for an API key, creating it on first use
+
+    Clients are keyed by process id as well, so workers forked from a preloaded
+    parent never share the parent's HTTP connections.
+
+    Args:
+        api_key: Keepa API key. Defaults to settings.KEEPA_API_KEY
+
+    Returns:
+        Shared PooledKeepa instance
+
+    Raises:
+        ValueError: If no API key is configured
+    """
+    api_key = api_key or settings.KEEPA_API_KEY
+    if not api_key:
+        raise ValueError("KEEPA_API_KEY no está configurada en settings")
+
+    key = (os.getpid(), api_key)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = PooledKeepa(
+                api_key,
+                timeout=getattr(settings, 'KEEPA_TIMEOUT', 10.0),
+                pool_size=getattr(settings, 'KEEPA_HTTP_POOL_SIZE', 10),
+            )
+            _clients[key] = client
+            logger.info(f"Keepa client created for process {key[0]}")
+        return client
+
+
+def reset_keepa_clients() -> None:
+    """Drop every cached client and close its HTTP connections (tests, key rotation)"""
+    with _clients_lock:
+        for client in _clients.values():
+            client._session.close()
+        _clients.clear()
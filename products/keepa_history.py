@@ -0,0 +1,260 @@
+"""
+Vectorized parsing of the history arrays returned by the keepa client.
+
+The keepa client returns every history as a NumPy value array plus a parallel
+array of timestamps (datetime64 when queried with to_datetime=False, datetime
+objects otherwise). These helpers build validity masks, convert values and format
+all timestamps in one pass over the arrays, producing exactly the same lists as the
+original per-point loops in KeepaService.
+
+The *_series functions return None when the input is not in the expected NumPy
+shape, so callers can fall back to the per-point implementation.
+
+Products queried in raw mode skip the keepa client's parsing entirely (no pandas
+DataFrames, no datetime objects): decode_csv_series turns Keepa's interleaved
+[minute, value, minute, value, ...] lists into compact int32 arrays, and
+history_data_from_csv builds the `data` dict the extractors expect from them.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Keepa minutes count from 2011-01-01 00:00 UTC (keepa.interface.KEEPA_ST_ORDINAL)
+KEEPA_EPOCH = np.datetime64('2011-01-01T00:00', 'm')
+
+# Index in the Keepa csv list of each series used by the app, and whether its
+# values are prices (hundredths, converted to float like keepa.parse_csv does)
+CSV_SERIES = {
+    'AMAZON': (0, True),
+    'NEW': (1, True),
+    'USED': (2, True),
+    'SALES': (3, False),
+    'COLLECTIBLE': (5, True),
+    'REFURBISHED': (6, True),
+    'RATING': (16, True),
+    'COUNT_REVIEWS': (17, False),
+}
+
+
+def _as_numeric(values: Any) -> Optional[np.ndarray]:
+    """Return a 1-D numeric NumPy array, or None if the input is not one"""
+    if not isinstance(values, np.ndarray) or values.ndim != 1:
+        return None
+    if values.dtype.kind not in 'iuf':
+        return None
+    return values
+
+
+def _as_datetime64(times: Any) -> Optional[np.ndarray]:
+    """
+    Convert a timestamp array to datetime64[s]
+
+    Only naive datetimes without sub-second precision are accepted, since their
+    string forms are the only ones np.datetime_as_string reproduces exactly.
+
+    Returns:
+        datetime64[s] array, or None if the times cannot be converted losslessly
+    """
+    if not isinstance(times, np.ndarray) or times.ndim != 1:
+        return None
+    if times.dtype.kind == 'M':
+        # .tolist() turns nanosecond datetimes into ints, which the legacy path treats differently
+        if np.datetime_data(times.dtype)[0] == 'ns':
+            return None
+        converted = times
+    elif times.dtype == object:
+        if len(times) and getattr(times[0], 'tzinfo', None) is not None:
+            return None
+        try:
+            converted = times.astype('datetime64[us]')
+        except (TypeError, ValueError):
+            return None
+    else:
+        # Raw Keepa minutes are converted with the local timezone by the legacy path
+        return None
+
+    seconds = converted.astype('datetime64[s]')
+    if converted.dtype != seconds.dtype and np.any(converted != seconds):
+        return None
+    if np.isnat(seconds).any():
+        return None
+    return seconds
+
+
+def _format_times(seconds: np.ndarray, separator: str) -> List[str]:
+    """Format datetime64[s] values as 'YYYY-MM-DD<separator>HH:MM:SS'"""
+    formatted = np.datetime_as_string(seconds, unit='s').tolist()
+    if separator != 'T':
+        formatted = [value.replace('T', separator) for value in formatted]
+    return formatted
+
+
+def price_series(prices: Any, times: Any) -> Optional[Dict[str, List]]:
+    """
+    Build one price history entry (prices in cents, ISO times and display times)
+
+    Args:
+        prices: Float price array in currency units (NaN when missing)
+        times: Array of datetime timestamps, parallel to prices
+
+    Returns:
+        Dict with 'prices', 'times' and 'formatted_times', or None to use the fallback
+    """
+    values = _as_numeric(prices)
+    seconds = _as_datetime64(times)
+    if values is None or seconds is None:
+        return None
+
+    mask = values > 0
+    if values.dtype.kind == 'f':
+        mask &= ~np.isnan(values)
+    mask &= values != -1
+    indices = np.flatnonzero(mask)
+
+    # Same truncation as int(price * 100) on each float
+    cents = (values[indices] * 100).astype(np.int64).tolist()
+
+    # Points without a timestamp keep their price, like the per-point loop
+    timed = indices[indices < len(seconds)]
+    iso = _format_times(seconds[timed], 'T')
+    return {
+        'prices': cents,
+        'times': iso,
+        # 'YYYY-MM-DD HH:MM', as strftime('%Y-%m-%d %H:%M')
+        'formatted_times': [value[:16].replace('T', ' ') for value in iso],
+    }
+
+
+def _dated_values(values: Any, times: Any) -> Optional[Tuple[np.ndarray, np.ndarray, List[str]]]:
+    """
+    Shared part of the rating and sales rank parsers
+
+    Returns:
+        Tuple (kept values, positive mask, date strings), or None to use the fallback
+    """
+    numbers = _as_numeric(values)
+    seconds = _as_datetime64(times)
+    if numbers is None or seconds is None:
+        return None
+
+    count = min(len(numbers), len(seconds))
+    numbers = numbers[:count]
+    keep = numbers != -1
+    kept = numbers[keep]
+    dates = _format_times(seconds[:count][keep], ' ')
+    positive = kept > 0
+    return kept, positive, dates
+
+
+def rating_series(ratings: Any, times: Any) -> Optional[Dict[str, List]]:
+    """
+    Build the rating history ({'ratings', 'formatted_times', 'values'})
+
+    Args:
+        ratings: Rating array as returned by keepa (NaN when missing)
+        times: Array of datetime timestamps, parallel to ratings
+
+    Returns:
+        Rating history dict, or None to use the fallback
+    """
+    parsed = _dated_values(ratings, times)
+    if parsed is None:
+        return None
+    kept, positive, dates = parsed
+
+    values = (kept / 10).tolist()
+    # Missing or zero ratings are stored as the integer 0
+    for index in np.flatnonzero(~positive):
+        values[index] = 0
+
+    return {
+        'ratings': [{"date": date, "rating": value} for date, value in zip(dates, values)],
+        'formatted_times': dates,
+        'values': values,
+    }
+
+
+def sales_rank_series(sales_ranks: Any, times: Any) -> Optional[Dict[str, List]]:
+    """
+    Build the sales rank history ({'sales_ranks', 'formatted_times', 'values'})
+
+    Args:
+        sales_ranks: Sales rank array as returned by keepa (-1 when missing)
+        times: Array of datetime timestamps, parallel to sales_ranks
+
+    Returns:
+        Sales rank history dict, or None to use the fallback
+    """
+    parsed = _dated_values(sales_ranks, times)
+    if parsed is None:
+        return None
+    kept, positive, dates = parsed
+
+    values = np.where(positive, kept, 0).astype(np.int64).tolist()
+
+    return {
+        'sales_ranks': [{"date": date, "salesRank": value} for date, value in zip(dates, values)],
+        'formatted_times': dates,
+        'values': values,
+    }
+
+
+def decode_csv_series(series: Any) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Decode one raw Keepa csv series into int32 minute and value arrays
+
+    Args:
+        series: Interleaved [keepa_minute, value, keepa_minute, value, ...] list
+
+    Returns:
+        Tuple (keepa minutes, values) as int32 arrays, or None if the series is empty
+    """
+    if not series:
+        return None
+    pairs = np.asarray(series, dtype=np.int32)
+    if pairs.size % 2:
+        # Incomplete trailing pair (should not happen), drop it like zip() would
+        pairs = pairs[:-1]
+    pairs = pairs.reshape(-1, 2)
+    return pairs[:, 0].copy(), pairs[:, 1].copy()
+
+
+def history_data_from_csv(csv: Any) -> Dict[str, np.ndarray]:
+    """
+    Build the history `data` dict of a product from its raw Keepa csv
+
+    Produces the same arrays as keepa.parse_csv(csv, to_datetime=False) for the
+    series the app reads (prices as float currency units with NaN when missing,
+    RATING in stars * 10, integer SALES/COUNT_REVIEWS with -1 when missing, and
+    datetime64[m] timestamps), without building DataFrames for every series.
+
+    Args:
+        csv: The product's raw 'csv' list (None entries for missing series)
+
+    Returns:
+        Dict with '<KEY>' and '<KEY>_time' arrays for every available series
+    """
+    data: Dict[str, np.ndarray] = {}
+    if not csv:
+        return data
+
+    for key, (index, is_price) in CSV_SERIES.items():
+        if index >= len(csv):
+            continue
+        decoded = decode_csv_series(csv[index])
+        if decoded is None:
+            continue
+        minutes, values = decoded
+
+        if is_price:
+            missing = values < 0
+            values = values.astype(np.float64) / 100
+            values[missing] = np.nan
+            if key == 'RATING':
+                values *= 10
+        else:
+            values = values.astype(np.int64)
+
+        data[f'{key}_time'] = KEEPA_EPOCH + minutes.astype('timedelta64[m]')
+        data[key] = values
+    return data
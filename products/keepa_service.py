@@ -1,12 +1,21 @@
-import keepa
 import logging
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from django.conf import settings
-from typing import Dict, List, Optional, Any
+from django.utils import timezone
+from typing import Dict, Iterable, List, Optional, Any
 from datetime import datetime
+import numpy as np
+from .keepa_budget import KEEPA_CALL_COSTS, PRIORITY_INTERACTIVE, KeepaTokenBudget
+from .keepa_cache import get_keepa_cache
+from .history_merge import HISTORY_FIELDS, history_window_days, merge_product_data
+from .keepa_history import history_data_from_csv, price_series, rating_series, sales_rank_series
+from .keepa_client import get_keepa_client
 
 logger = logging.getLogger(__name__)
 
+# Keepa accepts at most 100 ASINs in a single product request
+KEEPA_MAX_BATCH_SIZE = 100
+
 
 @dataclass
 class RootCategoryDTO:
@@ -23,20 +32,170 @@ class RootCategoryDTO:
     matched: bool
 
 
+@dataclass
+class ProductBatchResult:
+    """Result of a batched product query, keyed by ASIN"""
+    products: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    errors: Dict[str, str] = field(default_factory=dict)
+    # History fields each product needs written (refresh_products only)
+    history_fields: Dict[str, List[str]] = field(default_factory=dict)
+    fetched_at: Optional[datetime] = None
+    
+    @property
+    def failed_asins(self) -> List[str]:
+        """ASINs that could not be fetched or parsed"""
+        return list(self.errors.keys())
+
+
 class KeepaService:
     """Service to interact with the Keepa API"""
     
-    def __init__(self):
-        """Inicializa el cliente de Keepa con la API key"""
+    def __init__(self, priority: str = PRIORITY_INTERACTIVE):
+        """
+        Inicializa el servicio con el cliente de Keepa compartido del proceso
+        
+        Args:
+            priority: Prioridad en el presupuesto de tokens compartido. Las vistas usan
+                PRIORITY_INTERACTIVE; los comandos batch usan PRIORITY_BATCH
+        """
         self.api_key = settings.KEEPA_API_KEY
         if not self.api_key:
             raise ValueError("KEEPA_API_KEY no está configurada en settings")
         
         try:
-            self.api = keepa.Keepa(self.api_key)
+            # Reusar el cliente del proceso (conexiones HTTP persistentes, sin round trip de estado)
+            self.api = get_keepa_client(self.api_key)
         except Exception as e:
             logger.error(f"Error inicializando Keepa API: {e}")
             raise
+        
+        self.budget = KeepaTokenBudget(priority=priority, api_key=self.api_key)
+        self.cache = get_keepa_cache()
+    
+    def _call_api(self, cost: int, func, *args, **kwargs):
+        """
+        Run a Keepa client call inside the shared token budget
+        
+        Args:
+            cost: Estimated token cost of the call
+            func: Bound method of the Keepa client to call
+            *args, **kwargs: Arguments for the call
+            
+        Returns:
+            Whatever the client call returns
+            
+        Raises:
+            TokenBudgetExceeded: If the budget cannot cover the call in time
+        """
+        reservation = self.budget.reserve(cost)
+        # Forget the status of earlier requests of this thread (e.g. update_status),
+        # so commit() only sees what Keepa reported to this call
+        self.api.pop_request_status()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.budget.commit(reservation, self.api)
+    
+    def _cached_call(self, call_type: str, params: Dict[str, Any], cost: int, func, *args, **kwargs):
+        """
+        Serve a Keepa call from the response cache, calling the API only on a miss
+        
+        Args:
+            call_type: Cache call type ('best_sellers', 'category_lookup', ...)
+            params: Parameters that identify the response in the cache
+            cost: Estimated token cost of the call
+            func: Bound method of the Keepa client to call
+            *args, **kwargs: Arguments for the call (the `domain` kwarg is part of the key)
+            
+        Returns:
+            Cached or freshly fetched response
+        """
+        domain = kwargs.get('domain', 'MX')
+        if self.cache is not None:
+            found, value = self.cache.get(call_type, domain, params)
+            if found:
+                logger.debug(f"Caché Keepa hit: {call_type} {params} (domain: {domain})")
+                return value
+        
+        value = self._call_api(cost, func, *args, **kwargs)
+        if self.cache is not None:
+            self.cache.set(call_type, domain, params, value)
+        return value
+    
+    def _fetch_products(
+        self,
+        asins: List[str],
+        domain: str,
+        use_cache: bool = True,
+        **query_kwargs,
+    ) -> List[Dict[str, Any]]:
+        """
+        Product query that only sends the ASINs missing from the response cache
+        
+        Products are cached one by one, keyed by ASIN and query options, so a page
+        that overlaps a previous one only pays for the new ASINs.
+        
+        Args:
+            asins: ASINs to query (at most KEEPA_MAX_BATCH_SIZE)
+            domain: Amazon domain
+            use_cache: Read the cache before querying (fresh payloads are always stored)
+            **query_kwargs: Options for keepa's query (history, stats, rating, offers...).
+                With raw=True the products are returned as sent by Keepa, with the
+                history still in the 'csv' arrays
+            
+        Returns:
+            Raw product dicts in the order of `asins` (ASINs Keepa did not return are omitted)
+        """
+        asins = [str(asin).strip().upper() for asin in asins]
+        query_kwargs.setdefault('progress_bar', False)
+        options = {k: v for k, v in query_kwargs.items() if k != 'progress_bar'}
+        
+        found: Dict[str, Dict[str, Any]] = {}
+        missing = list(asins)
+        if self.cache is not None and use_cache:
+            missing = []
+            for asin in asins:
+                hit, product = self.cache.get('product', domain, {'asin': asin, **options})
+                if hit and product:
+                    found[asin] = product
+                else:
+                    missing.append(asin)
+            if found:
+                logger.info(f"Caché Keepa: {len(found)} de {len(asins)} productos sin consultar la API")
+        
+        if missing:
+            cost = self._product_query_cost(
+                len(missing),
+                rating=query_kwargs.get('rating', False),
+                offers=query_kwargs.get('offers'),
+            )
+            products = self._call_api(cost, self.api.query, missing, domain=domain, **query_kwargs)
+            if query_kwargs.get('raw'):
+                # keepa returns one unparsed HTTP response per request of up to 100 ASINs
+                products = [
+                    product
+                    for response in products or []
+                    for product in (response.json().get('products') or [])
+                ]
+            for product in products or []:
+                asin = str(product.get('asin') or '').strip().upper()
+                if not asin:
+                    continue
+                found.setdefault(asin, product)
+                if self.cache is not None:
+                    self.cache.set('product', domain, {'asin': asin, **options}, product)
+        
+        return [found[asin] for asin in asins if asin in found]
+    
+    def _product_query_cost(self, asin_count: int, rating: bool = False, offers: Optional[int] = None) -> int:
+        """Estimate the token cost of a product query"""
+        per_asin = KEEPA_CALL_COSTS['product']
+        if rating:
+            per_asin += KEEPA_CALL_COSTS['product_rating']
+        if offers:
+            # Keepa charges 6 tokens for every page of up to 10 offers
+            per_asin += 6 * -(-offers // 10)
+        return asin_count * per_asin
     
     def query_product(self, asin: str, domain: str = 'MX') -> Optional[Dict[str, Any]]:
         """
@@ -49,49 +208,205 @@ class KeepaService:
         Returns:
             Dict con los datos del producto o None si hay error
         """
-        try:
-            logger.info(f"Consultando producto ASIN: {asin} (domain: {domain})")
-            
-            # Verificar que el ASIN tenga el formato correcto
-            if len(asin) != 10:
-                logger.error(f"ASIN inválido: {asin} (debe tener 10 caracteres)")
-                return None
-            
-            # Realizar la consulta con historial completo y stats, usando dominio MX por defecto
-            products = self.api.query(asin, history=True, stats=90, rating=True, domain=domain)
+        result = self.query_products([asin], domain=domain, include_raw=True)
+        return result.products.get(asin.strip().upper())
+    
+    def query_products(
+        self,
+        asins: Iterable[str],
+        domain: str = 'MX',
+        include_raw: bool = False,
+        use_cache: bool = True,
+        days: Optional[int] = None,
+    ) -> ProductBatchResult:
+        """
+        Query several products, packing up to KEEPA_MAX_BATCH_SIZE ASINs per Keepa request
+        
+        Each chunk is a single `api.query` round trip. A failing chunk only marks its own
+        ASINs as failed, so callers always get every successfully parsed product back.
+        
+        Args:
+            asins: ASINs to query. Duplicates are removed and the order is preserved
+            domain: Amazon domain ('MX', 'US', 'UK', etc.). Default: 'MX' (Mexico)
+            include_raw: Attach the raw Keepa payload under 'raw_data' (debugging only,
+                it keeps the NumPy/pandas history objects alive)
+            use_cache: Serve products from the Keepa response cache when possible.
+                Pass False to force fresh data (e.g. --force-update)
+            days: Only return the history of the last `days` days (incremental
+                refreshes, see history_merge). None returns the full history
             
-            if not products:
-                logger.warning(f"No se encontró el producto con ASIN: {asin}")
-                return None
+        Returns:
+            ProductBatchResult with parsed products and per-ASIN errors, keyed by ASIN
+        """
+        result = ProductBatchResult()
+        
+        valid_asins = []
+        for asin in asins:
+            asin_clean = str(asin).strip().upper() if asin else ''
+            if len(asin_clean) != 10 or not asin_clean.isalnum():
+                logger.error(f"ASIN inválido: {asin} (debe tener 10 caracteres alfanuméricos)")
+                result.errors[asin_clean or str(asin)] = 'INVALID_ASIN'
+                continue
+            if asin_clean not in valid_asins:
+                valid_asins.append(asin_clean)
+        
+        for start in range(0, len(valid_asins), KEEPA_MAX_BATCH_SIZE):
+            chunk = valid_asins[start:start + KEEPA_MAX_BATCH_SIZE]
+            logger.info(f"Consultando {len(chunk)} productos en Keepa (domain: {domain})")
             
-            product_data = products[0]
+            try:
+                # Historial completo y stats, igual que la consulta individual
+                products = self._fetch_products(
+                    chunk,
+                    domain,
+                    use_cache=use_cache,
+                    history=True,
+                    stats=90,
+                    rating=True,
+                    # Unparsed csv arrays; parse_product_data decodes only the series it needs
+                    raw=True,
+                    days=days,
+                )
+            except Exception as e:
+                error_msg = str(e)
+                logger.error(f"Error consultando lote de {len(chunk)} productos: {error_msg}")
+                self._log_query_error(error_msg, ', '.join(chunk))
+                for asin in chunk:
+                    result.errors[asin] = error_msg
+                continue
             
-            # Verificar si el producto tiene datos válidos
-            # Algunos productos pueden no tener título, pero sí otros datos útiles
-            if not product_data.get('title'):
-                logger.warning(f"Producto encontrado pero sin título: {asin}")
-                # No retornar None, continuar con el parsing
-
-            logger.info(f"Producto encontrado: {product_data.get('title', 'Sin título')}")
-
-            # Guardar datos raw para debugging
-            parsed_data = self.parse_product_data(product_data)
-            parsed_data['raw_data'] = product_data  # Incluir datos raw para debugging
-            return parsed_data
+            for product_data in products or []:
+                asin = str(product_data.get('asin') or '').strip().upper()
+                if asin not in chunk:
+                    logger.warning(f"Keepa devolvió un ASIN no solicitado: '{asin}'")
+                    continue
+                
+                # Algunos productos pueden no tener título, pero sí otros datos útiles
+                if not product_data.get('title'):
+                    logger.warning(f"Producto encontrado pero sin título: {asin}")
+                
+                parsed_data = self.parse_product_data(product_data)
+                if include_raw:
+                    parsed_data['raw_data'] = product_data  # Incluir datos raw para debugging
+                result.products[asin] = parsed_data
+            
+            for asin in chunk:
+                if asin not in result.products and asin not in result.errors:
+                    logger.warning(f"No se encontró el producto con ASIN: {asin}")
+                    result.errors[asin] = 'ASIN_NOT_FOUND'
+        
+        logger.info(
+            f"Consulta en lote completada: {len(result.products)} productos, {len(result.errors)} errores"
+        )
+        return result
+    
+    def refresh_products(self, products: Iterable[Any], domain: str = 'MX', use_cache: bool = False) -> ProductBatchResult:
+        """
+        Refresh stored products, fetching only the recent history when possible
+        
+        Products synced recently are queried with a short `days` window and their new
+        points are appended to the stored histories (history_merge). Products never
+        synced, synced long ago or with a history that cannot be merged get a full
+        query, so the result always matches a full rewrite.
+        
+        Args:
+            products: Product instances to refresh
+            domain: Amazon domain ('MX', 'US', 'UK', etc.). Default: 'MX' (Mexico)
+            use_cache: Serve full queries from the response cache when possible
             
-        except Exception as e:
-            error_msg = str(e)
-            logger.error(f"Error consultando producto {asin}: {error_msg}")
+        Returns:
+            ProductBatchResult with the data to save per ASIN. `history_fields` lists
+            the history fields that changed and `fetched_at` is the value to store in
+            Product.history_synced_at
+        """
+        fetched_at = timezone.now()
+        result = ProductBatchResult(fetched_at=fetched_at)
+        
+        full_asins = []
+        windowed = {}
+        for product in products:
+            days = history_window_days(product, fetched_at)
+            if days is None:
+                full_asins.append(product.asin)
+            else:
+                windowed[product.asin] = (product, days)
+        
+        if windowed:
+            # One query for the whole group; a longer window than needed is still exact
+            days = max(days for _, days in windowed.values())
+            logger.info(f"Refresco incremental de {len(windowed)} productos (últimos {days} días)")
+            window_result = self.query_products(list(windowed), domain=domain, use_cache=False, days=days)
+            result.errors.update(window_result.errors)
+            for asin, product_data in window_result.products.items():
+                merged, changed = merge_product_data(windowed[asin][0], product_data)
+                if merged is None:
+                    logger.warning(f"Historial guardado de {asin} no se puede combinar, consultando historial completo")
+                    full_asins.append(asin)
+                    continue
+                result.products[asin] = merged
+                result.history_fields[asin] = changed
+        
+        if full_asins:
+            full_result = self.query_products(full_asins, domain=domain, use_cache=use_cache)
+            result.errors.update(full_result.errors)
+            for asin, product_data in full_result.products.items():
+                result.products[asin] = product_data
+                result.history_fields[asin] = list(HISTORY_FIELDS)
+        
+        return result
+    
+    def _log_query_error(self, error_msg: str, asins: str) -> None:
+        """
+        Log a more specific message for known Keepa product query errors
+        
+        Args:
+            error_msg: Error message raised by the keepa client
+            asins: ASIN(s) involved in the failed request, for context
+        """
+        if "REQUEST_REJECTED" in error_msg:
+            logger.error("La solicitud fue rechazada por Keepa API. Verifica tu token y suscripción.")
+        elif "INVALID_ASIN" in error_msg:
+            logger.error(f"ASIN inválido: {asins}")
+        elif "ASIN_NOT_FOUND" in error_msg:
+            logger.error(f"ASIN no encontrado en la base de datos de Keepa: {asins}")
+    
+    def query_raw_products(self, asins: List[str], domain: str = 'MX', **query_kwargs) -> List[Dict[str, Any]]:
+        """
+        Run a product query and return the unparsed Keepa payloads
+        
+        Used by the best-seller listings, which only need summary fields and pick
+        their own history/stats options to save tokens. Served from the response
+        cache when the same ASINs were queried with the same options recently.
+        
+        Args:
+            asins: ASINs to query (at most KEEPA_MAX_BATCH_SIZE per Keepa request)
+            domain: Amazon domain ('MX', 'US', 'UK', etc.). Default: 'MX' (Mexico)
+            **query_kwargs: Extra options for keepa's query (history, stats, rating, update...)
             
-            # Proporcionar mensajes más específicos según el tipo de error
-            if "REQUEST_REJECTED" in error_msg:
-                logger.error("La solicitud fue rechazada por Keepa API. Verifica tu token y suscripción.")
-            elif "INVALID_ASIN" in error_msg:
-                logger.error(f"ASIN inválido: {asin}")
-            elif "ASIN_NOT_FOUND" in error_msg:
-                logger.error(f"ASIN no encontrado en la base de datos de Keepa: {asin}")
+        Returns:
+            List of raw product dicts as returned by the keepa client
+        """
+        return self._fetch_products(list(asins), domain, **query_kwargs)
+    
+    def lookup_category(self, category_id: int, domain: str = 'MX') -> Dict[Any, Any]:
+        """
+        Raw category lookup (category_id=0 returns the root categories)
+        
+        Args:
+            category_id: Category ID to look up
+            domain: Amazon domain ('MX', 'US', 'UK', etc.). Default: 'MX' (Mexico)
             
-            return None
+        Returns:
+            Dict keyed by catId as returned by the keepa client
+        """
+        return self._cached_call(
+            'category_lookup',
+            {'category_id': int(category_id)},
+            KEEPA_CALL_COSTS['category_lookup'],
+            self.api.category_lookup,
+            category_id,
+            domain=domain,
+        )
     
     def parse_product_data(self, raw_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -182,7 +497,10 @@ class KeepaService:
             }
             
             # Extraer precios actuales
-            data = raw_data.get('data', {})
+            data = raw_data.get('data')
+            if data is None:
+                # Raw-mode payload: decode the Keepa csv arrays directly
+                data = history_data_from_csv(raw_data.get('csv'))
             if data:
                 # Precios están en centavos, mantenerlos así para el modelo
                 parsed_data['current_price_new'] = self._get_latest_price(data.get('NEW', []))
@@ -228,10 +546,12 @@ class KeepaService:
                 # Extraer datos de reseñas
                 parsed_data['reviews_data'] = self.extract_reviews_data(raw_data)
             else:
-                # Si no hay datos de precios, inicializar con valores por defecto
-                parsed_data['current_price_new'] = None
-                parsed_data['current_price_amazon'] = None
-                parsed_data['current_price_used'] = None
+                # Sin historial (p. ej. páginas de best sellers consultadas con history=False):
+                # precios actuales desde stats.current, indexado por tipo de csv de Keepa y en centavos
+                current = (raw_data.get('stats') or {}).get('current') or []
+                parsed_data['current_price_new'] = self._stats_current_price(current, 1)
+                parsed_data['current_price_amazon'] = self._stats_current_price(current, 0)
+                parsed_data['current_price_used'] = self._stats_current_price(current, 2)
                 parsed_data['price_history'] = {}
             
             return parsed_data
@@ -252,6 +572,21 @@ class KeepaService:
                 'price_history': {},
             }
     
+    def _stats_current_price(self, current, index: int) -> Optional[int]:
+        """
+        Precio actual de stats.current (0 AMAZON, 1 NEW, 2 USED)
+        
+        Args:
+            current: Lista stats.current de Keepa, en centavos (-1 = sin oferta)
+            index: Tipo de csv de Keepa
+            
+        Returns:
+            Precio en centavos o None si no hay oferta
+        """
+        if len(current) <= index or current[index] is None or current[index] <= 0:
+            return None
+        return int(current[index])
+    
     def _get_latest_price(self, price_list) -> Optional[int]:
         """
         Obtiene el precio más reciente de una lista de precios
@@ -265,6 +600,13 @@ class KeepaService:
         if price_list is None:
             return None
         
+        # Arrays de NumPy: buscar el último precio válido sin convertir toda la serie a lista
+        if isinstance(price_list, np.ndarray) and price_list.ndim == 1 and price_list.dtype.kind in 'iuf':
+            valid = price_list[price_list > 0]  # NaN > 0 es False
+            if len(valid) == 0:
+                return None
+            return int(float(valid[-1]) * 100)
+        
         # Convertir a lista si es un array de numpy
         try:
             if hasattr(price_list, 'tolist'):
@@ -399,6 +741,9 @@ class KeepaService:
         """
         Extrae el historial de precios de los datos raw
         
+        Uses the vectorized NumPy parser and falls back to the per-point loop when
+        the arrays are not in the shape it expects.
+        
         Args:
             data: Datos raw de precios de Keepa
             
@@ -406,6 +751,17 @@ class KeepaService:
             Dict con el historial de precios organizado
         """
         price_history = {}
+        for price_type in ['NEW', 'AMAZON', 'USED', 'COLLECTIBLE', 'REFURBISHED']:
+            if price_type in data:
+                series = price_series(data[price_type], data.get(f'{price_type}_time', []))
+                if series is None:
+                    return self._extract_price_history_legacy(data)
+                price_history[price_type] = series
+        return price_history
+    
+    def _extract_price_history_legacy(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Per-point version of extract_price_history, for inputs that are not NumPy arrays"""
+        price_history = {}
         
         # Tipos de precios a extraer
         price_types = ['NEW', 'AMAZON', 'USED', 'COLLECTIBLE', 'REFURBISHED']
@@ -479,6 +835,13 @@ class KeepaService:
         Returns:
             Dict con el historial de calificaciones organizado
         """
+        rating_history = rating_series(data.get('RATING', []), data.get('RATING_time', []))
+        if rating_history is None:
+            return self._extract_rating_history_legacy(data)
+        return rating_history
+    
+    def _extract_rating_history_legacy(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Per-point version of extract_rating_history, for inputs that are not NumPy arrays"""
         rating_history = {}
         
         # Extraer datos de rating
@@ -534,6 +897,13 @@ class KeepaService:
         Returns:
             Dict con el historial de sales rank organizado
         """
+        sales_rank_history = sales_rank_series(data.get('SALES', []), data.get('SALES_time', []))
+        if sales_rank_history is None:
+            return self._extract_sales_rank_history_legacy(data)
+        return sales_rank_history
+    
+    def _extract_sales_rank_history_legacy(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Per-point version of extract_sales_rank_history, for inputs that are not NumPy arrays"""
         sales_rank_history = {}
         
         # Extraer datos de sales rank
@@ -627,7 +997,7 @@ class KeepaService:
         """
         try:
             logger.info(f"Buscando productos con parámetros: {search_params}")
-            asins = self.api.product_finder(search_params)
+            asins = self._call_api(KEEPA_CALL_COSTS['product_finder'], self.api.product_finder, search_params)
             logger.info(f"Encontrados {len(asins)} productos")
             return asins
             
@@ -649,7 +1019,7 @@ class KeepaService:
         """
         try:
             logger.info(f"Obteniendo ofertas para ASIN: {asin} (domain: {domain})")
-            products = self.api.query(asin, offers=offers_count, domain=domain)
+            products = self.query_raw_products([asin], domain=domain, offers=offers_count)
             
             if not products:
                 return []
@@ -701,7 +1071,14 @@ class KeepaService:
                 return []
             
             # Buscar categorías usando la API de Keepa con dominio de México
-            categories = self.api.search_for_categories(query.strip(), domain=domain)
+            categories = self._cached_call(
+                'category_search',
+                {'query': query.strip().lower()},
+                KEEPA_CALL_COSTS['category_search'],
+                self.api.search_for_categories,
+                query.strip(),
+                domain=domain,
+            )
             
             if not categories:
                 logger.info(f"No se encontraron categorías para: {query} en dominio {domain}")
@@ -805,7 +1182,14 @@ class KeepaService:
             # Consultar best sellers usando la API de Keepa
             # El método espera domain como string ('MX', 'US', 'UK', etc.) no como int
             logger.debug(f"Llamando a api.best_sellers_query con category='{category_id_clean}', domain='{domain}'")
-            best_sellers = self.api.best_sellers_query(category_id_clean, domain=domain)
+            best_sellers = self._cached_call(
+                'best_sellers',
+                {'category': category_id_clean},
+                KEEPA_CALL_COSTS['best_sellers'],
+                self.api.best_sellers_query,
+                category_id_clean,
+                domain=domain,
+            )
             
             logger.debug(f"Respuesta de best_sellers_query: tipo={type(best_sellers)}, valor={best_sellers}")
             
@@ -863,7 +1247,7 @@ class KeepaService:
             # Query root categories using category_lookup(0)
             # category_id=0 returns all root categories
             logger.debug(f"Calling api.category_lookup with category_id=0, domain='{domain}'")
-            categories = self.api.category_lookup(0, domain=domain)
+            categories = self.lookup_category(0, domain=domain)
             
             logger.debug(f"Response from category_lookup: type={type(categories)}, count={len(categories) if categories else 0}")
             
@@ -961,7 +1345,7 @@ class KeepaService:
             
             # Query child categories using category_lookup with specific category_id
             logger.debug(f"Calling api.category_lookup with category_id={category_id}, domain='{domain}'")
-            category_response = self.api.category_lookup(category_id, domain=domain)
+            category_response = self.lookup_category(category_id, domain=domain)
             
             logger.debug(f"Response from category_lookup: type={type(category_response)}, count={len(category_response) if category_response else 0}")
             
@@ -994,7 +1378,7 @@ class KeepaService:
                     if not child_data or not isinstance(child_data, dict):
                         # If child not in response, query it separately
                         logger.debug(f"Child category {child_id} not in response, querying separately")
-                        child_response = self.api.category_lookup(child_id, domain=domain)
+                        child_response = self.lookup_category(child_id, domain=domain)
                         if child_response and isinstance(child_response, dict):
                             child_data = child_response.get(child_id)
                         
@@ -0,0 +1,158 @@
+"""
+Keyset (cursor) pagination for long per-user lists.
+
+Django's Paginator runs a COUNT(*) and then reads each page with OFFSET, so deep
+pages scan and discard every earlier row. KeysetPaginator instead filters on
+the sort key of the last row shown ("rows after (last_updated, asin)") and reads
+per_page + 1 rows, so every page costs one indexed range read, however deep.
+Each ordering needs a matching composite index (e.g. (queried_by, last_updated,
+asin) for a user's products).
+
+Pages are addressed by opaque tokens (URL-safe base64 JSON with the direction,
+the sort key values and the page number for display). A token that does not
+decode falls back to the first page. KeysetPage exposes the has_previous /
+has_next / has_other_pages / number API the pagination component uses.
+"""
+import base64
+import binascii
+import json
+from collections.abc import Sequence
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.db.models import Q
+
+# Query parameter that carries the token
+CURSOR_PARAM = 'cursor'
+
+
+def encode_cursor(direction: str, values: List[Any], number: int) -> str:
+    """Opaque token for the page after ('next') or before ('prev') a row"""
+    payload = json.dumps({'d': direction, 'v': values, 'n': number}, separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Inverse of encode_cursor; None for a missing or malformed token"""
+    if not token:
+        return None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        return None
+    if not isinstance(payload, dict) or payload.get('d') not in ('next', 'prev') or not isinstance(payload.get('v'), list):
+        return None
+    return payload
+
+
+class KeysetPage(Sequence):
+    """One page of a KeysetPaginator, usable where templates expect a Paginator page"""
+
+    cursor_param = CURSOR_PARAM
+
+    def __init__(self, object_list: list, number: int, next_token: Optional[str], previous_token: Optional[str]):
+        self.object_list = object_list
+        self.number = number
+        self.next_token = next_token
+        self.previous_token = previous_token
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __len__(self) -> int:
+        return len(self.object_list)
+
+    def __repr__(self) -> str:
+        return f'<KeysetPage {self.number}>'
+
+    def has_next(self) -> bool:
+        return self.next_token is not None
+
+    def has_previous(self) -> bool:
+        return self.previous_token is not None
+
+    def has_other_pages(self) -> bool:
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Paginate a queryset by a unique sort key
+
+    Args:
+        queryset: Rows to paginate (already filtered)
+        ordering: Sort key, e.g. ('-last_updated', '-asin'); the last field must be unique
+        per_page: Rows per page
+    """
+
+    def __init__(self, queryset, ordering: Tuple[str, ...], per_page: int):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self.fields = [name.lstrip('-') for name in self.ordering]
+        self.descending = [name.startswith('-') for name in self.ordering]
+
+    def _reversed_ordering(self) -> List[str]:
+        return [name if descending else f'-{name}' for name, descending in zip(self.fields, self.descending)]
+
+    def _key(self, obj) -> List[Any]:
+        return [getattr(obj, name) for name in self.fields]
+
+    def _parse_key(self, values: List[Any]) -> Optional[List[Any]]:
+        if len(values) != len(self.fields):
+            return None
+        model = self.queryset.model
+        try:
+            return [model._meta.get_field(name).to_python(value) for name, value in zip(self.fields, values)]
+        except Exception:
+            return None
+
+    def _beyond(self, values: List[Any], backwards: bool) -> Q:
+        """Rows after the key in the sort order (before it when backwards)"""
+        condition = Q()
+        for index, name in enumerate(self.fields):
+            # Strictly beyond on this field, equal on all the previous ones
+            forward_lookup = 'lt' if self.descending[index] else 'gt'
+            if backwards:
+                forward_lookup = 'gt' if forward_lookup == 'lt' else 'lt'
+            term = Q(**{f'{name}__{forward_lookup}': values[index]})
+            for previous in range(index):
+                term &= Q(**{self.fields[previous]: values[previous]})
+            condition |= term
+        return condition
+
+    def get_page(self, token: Optional[str] = None) -> KeysetPage:
+        """
+        Page addressed by a token (first page when the token is missing or invalid)
+
+        Args:
+            token: next_token / previous_token of a page returned earlier
+
+        Returns:
+            KeysetPage
+        """
+        cursor = decode_cursor(token)
+        values = self._parse_key(cursor['v']) if cursor else None
+        if values is None:
+            cursor = None
+        backwards = cursor is not None and cursor['d'] == 'prev'
+        number = max(int(cursor.get('n', 1)), 1) if cursor else 1
+
+        queryset = self.queryset
+        if cursor is not None:
+            queryset = queryset.filter(self._beyond(values, backwards))
+        ordering = self._reversed_ordering() if backwards else list(self.ordering)
+        rows = list(queryset.order_by(*ordering)[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if backwards:
+            rows.reverse()
+            has_previous, has_next = has_more, True
+        else:
+            has_previous, has_next = cursor is not None, has_more
+        if not has_previous:
+            number = 1
+
+        next_token = encode_cursor('next', self._key(rows[-1]), number + 1) if has_next and rows else None
+        previous_token = encode_cursor('prev', self._key(rows[0]), number - 1) if has_previous and rows else None
+        return KeysetPage(rows, number, next_token, previous_token)
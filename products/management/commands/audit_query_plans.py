@@ -0,0 +1,69 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from products.query_audit import AUDITED_QUERIES, audit_queries
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta EXPLAIN sobre las consultas de las vistas y comandos y señala las que recorren tablas completas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'queries',
+            nargs='*',
+            help='Nombres de las consultas a revisar (por defecto todas)'
+        )
+        parser.add_argument(
+            '--user',
+            type=str,
+            help='Username cuyo id se usa en los filtros por usuario (por defecto el primero)'
+        )
+        parser.add_argument(
+            '--fail-on-scan',
+            action='store_true',
+            help='Terminar con error si alguna consulta recorre una tabla completa (para CI)'
+        )
+
+    def handle(self, *args, **options):
+        names = options['queries']
+        unknown = set(names) - {query.name for query in AUDITED_QUERIES}
+        if unknown:
+            raise CommandError(f'Consultas desconocidas: {", ".join(sorted(unknown))}')
+
+        if options.get('user'):
+            try:
+                user_id = User.objects.get(username=options['user']).pk
+            except User.DoesNotExist:
+                raise CommandError(f'Usuario "{options["user"]}" no encontrado')
+        else:
+            user_id = User.objects.order_by('id').values_list('id', flat=True).first() or 1
+
+        try:
+            reports = audit_queries(user_id, names)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        flagged = 0
+        for report in reports:
+            label = f'{report.query.name} ({report.query.source})'
+            if report.flagged:
+                flagged += 1
+                self.stdout.write(self.style.ERROR(
+                    f'✗ {label}: recorre completa {", ".join(report.full_scans)}'
+                ))
+            elif report.full_scans:
+                self.stdout.write(self.style.WARNING(
+                    f'~ {label}: recorre completa {", ".join(report.full_scans)} (esperado)'
+                ))
+            else:
+                self.stdout.write(f'✓ {label}')
+            if options['verbosity'] >= 2 or report.flagged:
+                for line in report.plan:
+                    self.stdout.write(f'    {line}')
+
+        summary = f'{len(reports)} consultas revisadas, {flagged} con recorridos completos no esperados'
+        if flagged and options.get('fail_on_scan'):
+            raise CommandError(summary)
+        if flagged:
+            self.stdout.write(self.style.WARNING(summary))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'✓ {summary}'))
@@ -1,13 +1,32 @@
-from django.core.management.base import BaseCommand
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
 from django.utils import timezone
-from django.db import transaction
 import logging
+import queue
+import threading
 from products.models import PriceAlert, Product
+from products.keepa_budget import PRIORITY_BATCH
+from products.keepa_cache import report_cache_stats
 from products.keepa_service import KeepaService
-from products.notifications import send_price_alert_notification
+from products.product_upsert import upsert_product
+from products.alert_events import alert_events_enabled, evaluate_product_alerts, fire_alert
+from products.alert_leases import claim_alert_batch, default_worker_id, release_alert_batch, unleased
+from products.alert_writes import AlertWriteBuffer
 
 logger = logging.getLogger(__name__)
 
+# Columnas que se cargan de cada alerta y de su producto al seleccionar las alertas pendientes
+ALERT_FIELDS = [
+    'id', 'user', 'product', 'target_price', 'price_type', 'frequency', 'is_active',
+    'triggered', 'triggered_at', 'created_at', 'last_checked', 'next_check_at',
+    'lease_owner', 'lease_expires_at',
+]
+ALERT_PRODUCT_FIELDS = [
+    'asin', 'title', 'brand', 'image_url', 'current_price_new', 'current_price_amazon',
+    'current_price_used', 'last_updated',
+]
+
 
 class Command(BaseCommand):
     help = 'Verifica alertas de precio y envía notificaciones cuando se cumplan las condiciones'
@@ -29,36 +48,76 @@ class Command(BaseCommand):
             action='store_true',
             help='Forzar actualización de precios aunque no sea necesario'
         )
+        parser.add_argument(
+            '--worker',
+            action='store_true',
+            help='Modo worker: reservar lotes de productos pendientes (se pueden correr varios en paralelo, en varios hosts)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Productos por lote en modo worker (por defecto 100, una petición a Keepa)'
+        )
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=1,
+            help='Hilos para procesar los productos de cada lote (por defecto 1)'
+        )
+        parser.add_argument(
+            '--lease-seconds',
+            type=int,
+            default=600,
+            help='Duración de la reserva de un lote en modo worker (por defecto 600)'
+        )
+        parser.add_argument(
+            '--retry-minutes',
+            type=int,
+            default=15,
+            help='En modo worker, minutos hasta reintentar las alertas que no se pudieron verificar (por defecto 15)'
+        )
 
     def handle(self, *args, **options):
         frequency = options.get('frequency')
         dry_run = options.get('dry_run', False)
         force_update = options.get('force_update', False)
+        self.threads = options.get('threads', 1)
+        
+        if self.threads < 1 or options['batch_size'] < 1:
+            raise CommandError('--threads y --batch-size deben ser mayores que 0')
         
         self.stdout.write(
             self.style.SUCCESS(f'Iniciando verificación de alertas de precio...')
         )
         
         if dry_run:
+            if options.get('worker'):
+                raise CommandError('--dry-run no es compatible con --worker')
             self.stdout.write(
                 self.style.WARNING('MODO DRY-RUN: No se enviarán notificaciones reales')
             )
         
-        # Obtener alertas activas
-        alerts_query = PriceAlert.objects.filter(
-            is_active=True,
-            triggered=False
-        )
+        if frequency:
+            self.stdout.write(f'Verificando alertas con frecuencia: {frequency} veces al día')
+        
+        if options.get('worker'):
+            self.run_worker(
+                frequency, force_update, options['batch_size'], options['lease_seconds'], options['retry_minutes']
+            )
+            return
+        
+        # Obtener solo las alertas activas pendientes (índice is_active, triggered, next_check_at)
+        # que no tenga reservadas un worker
+        alerts_query = self.alerts_queryset().filter(unleased())
         
         if frequency:
             alerts_query = alerts_query.filter(frequency=frequency)
-            self.stdout.write(f'Verificando alertas con frecuencia: {frequency} veces al día')
         
-        # Filtrar alertas que deben verificarse ahora
-        alerts_to_check = []
-        for alert in alerts_query:
-            if alert.should_check_now() or force_update:
-                alerts_to_check.append(alert)
+        if not force_update:
+            alerts_query = alerts_query.filter(next_check_at__lte=timezone.now())
+        
+        alerts_to_check = list(alerts_query)
         
         if not alerts_to_check:
             self.stdout.write(
@@ -66,6 +125,75 @@ class Command(BaseCommand):
             )
             return
         
+        # Inicializar servicio de Keepa
+        try:
+            keepa_service = KeepaService(priority=PRIORITY_BATCH)
+        except Exception as e:
+            self.stdout.write(
+                self.style.ERROR(f'Error inicializando Keepa service: {e}')
+            )
+            return
+        
+        alerts_triggered, errors = self.check_alerts(alerts_to_check, keepa_service, dry_run, force_update)
+        self.write_summary(len(alerts_to_check), alerts_triggered, errors, dry_run)
+    
+    def alerts_queryset(self):
+        """
+        Alertas activas con su producto y usuario en una consulta. De los productos solo se
+        cargan las columnas de precio; los historiales se cargan únicamente para los
+        productos que hay que actualizar
+        """
+        return PriceAlert.objects.filter(
+            is_active=True,
+            triggered=False
+        ).select_related('product', 'user').only(
+            *ALERT_FIELDS, *[f'product__{name}' for name in ALERT_PRODUCT_FIELDS], 'user__username', 'user__email'
+        ).order_by('next_check_at')
+    
+    def run_worker(self, frequency, force_update, batch_size, lease_seconds, retry_minutes):
+        """Reserva y procesa lotes de productos pendientes hasta que no quede ninguno"""
+        worker_id = default_worker_id()
+        self.stdout.write(f'Worker {worker_id}: lotes de hasta {batch_size} productos, {self.threads} hilo(s)')
+        
+        try:
+            keepa_service = KeepaService(priority=PRIORITY_BATCH)
+        except Exception as e:
+            self.stdout.write(
+                self.style.ERROR(f'Error inicializando Keepa service: {e}')
+            )
+            return
+        
+        checked = 0
+        alerts_triggered = 0
+        errors = 0
+        while True:
+            alert_ids = claim_alert_batch(worker_id, batch_size, lease_seconds, frequency)
+            if not alert_ids:
+                break
+            try:
+                alerts = list(self.alerts_queryset().filter(id__in=alert_ids))
+                batch_triggered, batch_errors = self.check_alerts(alerts, keepa_service, False, force_update)
+                checked += len(alerts)
+                alerts_triggered += batch_triggered
+                errors += batch_errors
+            finally:
+                # Las alertas que no se pudieron verificar se reintentan más tarde, no en este mismo ciclo
+                release_alert_batch(worker_id, alert_ids, retry_delay=timedelta(minutes=retry_minutes))
+        
+        if not checked:
+            self.stdout.write(
+                self.style.WARNING('No hay alertas que necesiten verificación en este momento')
+            )
+            return
+        self.write_summary(checked, alerts_triggered, errors, False)
+    
+    def check_alerts(self, alerts_to_check, keepa_service, dry_run, force_update):
+        """
+        Actualiza los productos de las alertas (una petición batch a Keepa) y evalúa cada alerta
+        
+        Returns:
+            Tupla (alertas disparadas, errores)
+        """
         self.stdout.write(f'Verificando {len(alerts_to_check)} alertas...')
         
         # Agrupar alertas por producto para optimizar llamadas a Keepa
@@ -81,142 +209,225 @@ class Command(BaseCommand):
         
         self.stdout.write(f'Actualizando {len(products_to_update)} productos únicos...')
         
-        # Inicializar servicio de Keepa
-        try:
-            keepa_service = KeepaService()
-        except Exception as e:
-            self.stdout.write(
-                self.style.ERROR(f'Error inicializando Keepa service: {e}')
+        # Determinar qué productos necesitan actualizarse
+        # (actualizar si la última actualización fue hace más de 1 hora)
+        asins_to_update = []
+        for asin, data in products_to_update.items():
+            product = data['product']
+            needs_update = force_update
+            if not needs_update:
+                if product.last_updated:
+                    hours_since_update = (timezone.now() - product.last_updated).total_seconds() / 3600
+                    needs_update = hours_since_update >= 1
+                else:
+                    needs_update = True
+            if needs_update:
+                asins_to_update.append(asin)
+        
+        # Consultar todos los productos desactualizados en lotes de hasta 100 ASINs
+        batch_result = None
+        if asins_to_update:
+            self.stdout.write(f'Consultando Keepa para {len(asins_to_update)} productos desactualizados...')
+            # Cargar completos (con historiales) solo los productos a actualizar, en una consulta
+            full_products = Product.objects.in_bulk(asins_to_update)
+            for asin, product in full_products.items():
+                products_to_update[asin]['product'] = product
+                for alert in products_to_update[asin]['alerts']:
+                    alert.product = product
+            asins_to_update = [asin for asin in asins_to_update if asin in full_products]
+            # Los productos sincronizados recientemente solo piden y añaden los puntos nuevos
+            batch_result = keepa_service.refresh_products(
+                [products_to_update[asin]['product'] for asin in asins_to_update],
+                use_cache=not force_update,
             )
-            return
+            if batch_result.errors:
+                self.stdout.write(
+                    self.style.WARNING(f'  {len(batch_result.errors)} productos no pudieron obtenerse de Keepa')
+                )
+        
+        # Procesar cada producto (en paralelo con --threads; cada hilo usa su propia conexión a la BD).
+        # Los last_checked se acumulan y se escriben en bloque
+        buffer = AlertWriteBuffer()
+        tasks = [
+            (asin, data['product'], data['alerts'], asin in asins_to_update)
+            for asin, data in products_to_update.items()
+        ]
+        try:
+            if self.threads > 1:
+                results = self.map_in_threads(
+                    lambda task: self.check_product(*task, batch_result, dry_run, buffer), tasks,
+                )
+            else:
+                results = [self.check_product(*task, batch_result, dry_run, buffer) for task in tasks]
+        finally:
+            buffer.flush()
         
+        return sum(r[0] for r in results), sum(r[1] for r in results)
+    
+    def map_in_threads(self, func, tasks):
+        """
+        Ejecuta func sobre las tareas en --threads hilos y devuelve los resultados en orden.
+        Cada hilo procesa tareas hasta vaciar la cola y cierra su conexión a la BD una sola vez, al terminar
+        """
+        pending = queue.SimpleQueue()
+        for index, task in enumerate(tasks):
+            pending.put((index, task))
+        results = [None] * len(tasks)
+        failures = []
+        
+        def worker():
+            try:
+                while True:
+                    try:
+                        index, task = pending.get_nowait()
+                    except queue.Empty:
+                        return
+                    try:
+                        results[index] = func(task)
+                    except Exception as e:
+                        failures.append(e)
+            finally:
+                connection.close()
+        
+        threads = [
+            threading.Thread(target=worker, name=f'check-alerts-{index}')
+            for index in range(min(self.threads, len(tasks)))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if failures:
+            raise failures[0]
+        return results
+    
+    def check_product(self, asin, product, alerts, needs_update, batch_result, dry_run, buffer):
+        """
+        Guarda los datos nuevos de un producto y evalúa sus alertas
+        
+        Returns:
+            Tupla (alertas disparadas, errores)
+        """
         alerts_triggered = 0
         errors = 0
+        changed = []
         
-        # Procesar cada producto
-        for asin, data in products_to_update.items():
-            product = data['product']
-            alerts = data['alerts']
-            
-            self.stdout.write(f'Procesando {asin}: {product.title[:50]}...')
-            
-            try:
-                # Verificar si necesitamos actualizar el producto
-                needs_update = force_update
-                if not needs_update:
-                    # Actualizar si la última actualización fue hace más de 1 hora
-                    if product.last_updated:
-                        hours_since_update = (timezone.now() - product.last_updated).total_seconds() / 3600
-                        needs_update = hours_since_update >= 1
-                    else:
-                        needs_update = True
+        self.stdout.write(f'Procesando {asin}: {product.title[:50]}...')
+        
+        try:
+            if needs_update:
+                product_data = batch_result.products.get(asin)
+                
+                if not product_data:
+                    self.stdout.write(
+                        self.style.WARNING(
+                            f'  No se pudo obtener datos actualizados para {asin} '
+                            f'({batch_result.errors.get(asin, "sin datos")})'
+                        )
+                    )
+                    return alerts_triggered, errors
                 
-                if needs_update:
-                    self.stdout.write(f'  Actualizando precio desde Keepa...')
-                    product_data = keepa_service.query_product(asin)
+                # Actualizar solo las columnas del producto que cambiaron; las alertas
+                # de este producto se evalúan abajo, no en el hook de actualización
+                _, _, changed = upsert_product(
+                    product_data,
+                    product=product,
+                    history_synced_at=batch_result.fetched_at,
+                    evaluate_alerts=False,
+                )
+                
+                self.stdout.write(f'  Producto actualizado exitosamente')
+            else:
+                self.stdout.write(f'  Usando precio actual (actualizado hace menos de 1 hora)')
+            
+            # Verificar cada alerta para este producto
+            for alert in alerts:
+                try:
+                    # Obtener precio actual según el tipo de alerta
+                    current_price = None
+                    if alert.price_type == 'new':
+                        current_price = product.current_price_new
+                    elif alert.price_type == 'amazon':
+                        current_price = product.current_price_amazon
+                    elif alert.price_type == 'used':
+                        current_price = product.current_price_used
                     
-                    if not product_data:
+                    if current_price is None:
                         self.stdout.write(
-                            self.style.WARNING(f'  No se pudo obtener datos actualizados para {asin}')
+                            self.style.WARNING(f'  Alerta {alert.id}: No hay precio {alert.price_type} disponible')
                         )
                         continue
                     
-                    # Actualizar producto con nuevos datos
-                    with transaction.atomic():
-                        product.title = product_data['title']
-                        product.brand = product_data.get('brand')
-                        product.image_url = product_data.get('image_url')
-                        product.color = product_data.get('color')
-                        product.binding = product_data.get('binding')
-                        product.availability_amazon = product_data.get('availability_amazon', 0)
-                        product.categories = product_data.get('categories', [])
-                        product.category_tree = product_data.get('category_tree', [])
-                        product.current_price_new = product_data.get('current_price_new')
-                        product.current_price_amazon = product_data.get('current_price_amazon')
-                        product.current_price_used = product_data.get('current_price_used')
-                        product.sales_rank_current = product_data.get('sales_rank_current')
-                        product.rating = product_data.get('rating')
-                        product.review_count = product_data.get('review_count')
-                        product.price_history = product_data.get('price_history', {})
-                        product.rating_history = product_data.get('rating_history', {})
-                        product.sales_rank_history = product_data.get('sales_rank_history', {})
-                        product.reviews_data = product_data.get('reviews_data', {})
-                        product.save()
-                    
-                    self.stdout.write(f'  Producto actualizado exitosamente')
-                else:
-                    self.stdout.write(f'  Usando precio actual (actualizado hace menos de 1 hora)')
-                
-                # Verificar cada alerta para este producto
-                for alert in alerts:
-                    try:
-                        # Obtener precio actual según el tipo de alerta
-                        current_price = None
-                        if alert.price_type == 'new':
-                            current_price = product.current_price_new
-                        elif alert.price_type == 'amazon':
-                            current_price = product.current_price_amazon
-                        elif alert.price_type == 'used':
-                            current_price = product.current_price_used
-                        
-                        if current_price is None:
-                            self.stdout.write(
-                                self.style.WARNING(f'  Alerta {alert.id}: No hay precio {alert.price_type} disponible')
+                    # Verificar si se cumple la condición de la alerta
+                    if current_price <= alert.target_price:
+                        self.stdout.write(
+                            self.style.SUCCESS(
+                                f'  🎯 ALERTA DISPARADA: {alert.user.username} - '
+                                f'Precio actual: ${current_price/100:.2f} <= '
+                                f'Objetivo: ${alert.target_price/100:.2f}'
                             )
-                            continue
+                        )
                         
-                        # Verificar si se cumple la condición de la alerta
-                        if current_price <= alert.target_price:
-                            self.stdout.write(
-                                self.style.SUCCESS(
-                                    f'  🎯 ALERTA DISPARADA: {alert.user.username} - '
-                                    f'Precio actual: ${current_price/100:.2f} <= '
-                                    f'Objetivo: ${alert.target_price/100:.2f}'
-                                )
-                            )
-                            
-                            if not dry_run:
-                                # Enviar notificación
-                                success = send_price_alert_notification(alert, current_price)
-                                if success:
-                                    alerts_triggered += 1
-                                    self.stdout.write(f'    ✅ Notificación enviada')
-                                else:
-                                    errors += 1
-                                    self.stdout.write(f'    ❌ Error enviando notificación')
-                            else:
+                        if not dry_run:
+                            # Reclamar la alerta y escribir su notificación en una transacción: puede
+                            # haberla disparado ya una actualización del producto, y si la escritura
+                            # falla la alerta sigue activa para la próxima verificación
+                            success = fire_alert(alert, current_price)
+                            if success is None:
+                                self.stdout.write(f'    Alerta ya disparada por otro proceso')
+                                continue
+                            if success:
                                 alerts_triggered += 1
-                                self.stdout.write(f'    [DRY-RUN] Notificación se enviaría aquí')
+                                self.stdout.write(f'    ✅ Notificación enviada')
+                            else:
+                                errors += 1
+                                self.stdout.write(f'    ❌ Error enviando notificación')
                         else:
-                            self.stdout.write(
-                                f'  Alerta {alert.id}: Precio actual ${current_price/100:.2f} > '
-                                f'Objetivo ${alert.target_price/100:.2f} (no se dispara)'
-                            )
-                        
-                        # Actualizar timestamp de verificación
-                        alert.last_checked = timezone.now()
-                        alert.save()
-                        
-                    except Exception as e:
+                            alerts_triggered += 1
+                            self.stdout.write(f'    [DRY-RUN] Notificación se enviaría aquí')
+                    else:
                         self.stdout.write(
-                            self.style.ERROR(f'  Error procesando alerta {alert.id}: {e}')
+                            f'  Alerta {alert.id}: Precio actual ${current_price/100:.2f} > '
+                            f'Objetivo ${alert.target_price/100:.2f} (no se dispara)'
                         )
-                        errors += 1
-                        logger.error(f"Error procesando alerta {alert.id}: {e}")
-                
-            except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(f'Error procesando producto {asin}: {e}')
-                )
-                errors += 1
-                logger.error(f"Error procesando producto {asin}: {e}")
+                    
+                    # Actualizar timestamp de verificación (y next_check_at) al vaciar el buffer
+                    buffer.mark_checked(alert)
+                    
+                except Exception as e:
+                    self.stdout.write(
+                        self.style.ERROR(f'  Error procesando alerta {alert.id}: {e}')
+                    )
+                    errors += 1
+                    logger.error(f"Error procesando alerta {alert.id}: {e}")
+            
+            # Las demás alertas activas del producto (no vencidas o de otra frecuencia) también
+            # ven el precio nuevo, como tras cualquier otra actualización del producto
+            if changed and not dry_run and alert_events_enabled():
+                fired = evaluate_product_alerts(product, changed, exclude_ids=[alert.id for alert in alerts])
+                if fired:
+                    alerts_triggered += len(fired)
+                    self.stdout.write(
+                        self.style.SUCCESS(f'  🎯 {len(fired)} alertas más disparadas por el precio nuevo')
+                    )
+            
+        except Exception as e:
+            self.stdout.write(
+                self.style.ERROR(f'Error procesando producto {asin}: {e}')
+            )
+            errors += 1
+            logger.error(f"Error procesando producto {asin}: {e}")
         
+        return alerts_triggered, errors
+    
+    def write_summary(self, alerts_checked, alerts_triggered, errors, dry_run):
         # Resumen final
         self.stdout.write('\n' + '='*50)
         self.stdout.write('RESUMEN DE VERIFICACIÓN:')
-        self.stdout.write(f'  Alertas verificadas: {len(alerts_to_check)}')
+        self.stdout.write(f'  Alertas verificadas: {alerts_checked}')
         self.stdout.write(f'  Alertas disparadas: {alerts_triggered}')
         self.stdout.write(f'  Errores: {errors}')
+        report_cache_stats(lambda line: self.stdout.write(f'  {line}'))
         
         if dry_run:
             self.stdout.write(
@@ -1,7 +1,10 @@
 from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth.models import User
 from products.models import Product
+from products.keepa_budget import PRIORITY_BATCH
+from products.keepa_cache import report_cache_stats
 from products.keepa_service import KeepaService
+from products.product_upsert import upsert_product
 import logging
 
 logger = logging.getLogger(__name__)
@@ -52,16 +55,30 @@ class Command(BaseCommand):
         
         # Inicializar servicio de Keepa
         try:
-            keepa_service = KeepaService()
+            keepa_service = KeepaService(priority=PRIORITY_BATCH)
         except Exception as e:
             raise CommandError(f'Error inicializando Keepa API: {e}')
         
         success_count = 0
         error_count = 0
         
+        # Validar ASINs y resolver los existentes en una sola consulta
+        asins = [asin.strip().upper() for asin in asins]
+        existing_products = Product.objects.in_bulk(
+            [asin for asin in asins if len(asin) == 10 and asin.isalnum()]
+        )
+        asins_to_fetch = [
+            asin for asin in asins
+            if len(asin) == 10 and asin.isalnum() and (force or asin not in existing_products)
+        ]
+        
+        # Consultar todos los productos pendientes en lotes (hasta 100 ASINs por petición)
+        batch_result = None
+        if asins_to_fetch:
+            self.stdout.write(f'Consultando Keepa API para {len(asins_to_fetch)} producto(s)...')
+            batch_result = keepa_service.query_products(asins_to_fetch, use_cache=not force)
+        
         for asin in asins:
-            asin = asin.strip().upper()
-            
             self.stdout.write(f'\n{"-" * 80}')
             self.stdout.write(f'Procesando ASIN: {asin}')
             self.stdout.write(f'{"-" * 80}')
@@ -75,7 +92,7 @@ class Command(BaseCommand):
                 continue
             
             # Verificar si ya existe
-            existing_product = Product.objects.filter(asin=asin).first()
+            existing_product = existing_products.get(asin)
             if existing_product and not force:
                 self.stdout.write(
                     self.style.WARNING(f'  ⚠ Producto ya existe en la base de datos')
@@ -85,14 +102,16 @@ class Command(BaseCommand):
                 self.stdout.write(f'    Usa --force para actualizar')
                 continue
             
-            # Consultar producto
             try:
-                self.stdout.write('  Consultando Keepa API...')
-                product_data = keepa_service.query_product(asin)
+                product_data = batch_result.products.get(asin) if batch_result else None
                 
                 if not product_data:
+                    reason = batch_result.errors.get(asin) if batch_result else None
                     self.stdout.write(
-                        self.style.ERROR(f'  ✗ No se pudo obtener datos del producto')
+                        self.style.ERROR(
+                            f'  ✗ No se pudo obtener datos del producto'
+                            + (f' ({reason})' if reason else '')
+                        )
                     )
                     error_count += 1
                     continue
@@ -123,54 +142,18 @@ class Command(BaseCommand):
                 if categories:
                     self.stdout.write(f'    Categorías: {", ".join(categories[:3])}{"..." if len(categories) > 3 else ""}')
                 
-                # Guardar o actualizar en la base de datos
+                # Guardar o actualizar en la base de datos (solo las columnas que cambiaron)
                 if existing_product:
                     self.stdout.write('  Actualizando producto existente...')
-                    existing_product.title = product_data['title']
-                    existing_product.brand = product_data.get('brand')
-                    existing_product.image_url = product_data.get('image_url')
-                    existing_product.color = product_data.get('color')
-                    existing_product.binding = product_data.get('binding')
-                    existing_product.availability_amazon = product_data.get('availability_amazon', 0)
-                    existing_product.categories = product_data.get('categories', [])
-                    existing_product.category_tree = product_data.get('category_tree', [])
-                    existing_product.current_price_new = product_data.get('current_price_new')
-                    existing_product.current_price_amazon = product_data.get('current_price_amazon')
-                    existing_product.current_price_used = product_data.get('current_price_used')
-                    existing_product.sales_rank_current = product_data.get('sales_rank_current')
-                    existing_product.rating = product_data.get('rating')
-                    existing_product.review_count = product_data.get('review_count')
-                    existing_product.price_history = product_data.get('price_history', {})
-                    existing_product.rating_history = product_data.get('rating_history', {})
-                    existing_product.sales_rank_history = product_data.get('sales_rank_history', {})
-                    existing_product.reviews_data = product_data.get('reviews_data', {})
-                    existing_product.save()
+                    _, _, changed = upsert_product(product_data, user, product=existing_product)
                     
-                    self.stdout.write(self.style.SUCCESS(f'  ✓ Producto actualizado exitosamente'))
+                    if changed:
+                        self.stdout.write(self.style.SUCCESS(f'  ✓ Producto actualizado exitosamente ({", ".join(changed)})'))
+                    else:
+                        self.stdout.write(self.style.SUCCESS(f'  ✓ Producto sin cambios'))
                 else:
                     self.stdout.write('  Guardando en base de datos...')
-                    Product.objects.create(
-                        asin=product_data['asin'],
-                        title=product_data['title'],
-                        brand=product_data.get('brand'),
-                        image_url=product_data.get('image_url'),
-                        color=product_data.get('color'),
-                        binding=product_data.get('binding'),
-                        availability_amazon=product_data.get('availability_amazon', 0),
-                        categories=product_data.get('categories', []),
-                        category_tree=product_data.get('category_tree', []),
-                        current_price_new=product_data.get('current_price_new'),
-                        current_price_amazon=product_data.get('current_price_amazon'),
-                        current_price_used=product_data.get('current_price_used'),
-                        sales_rank_current=product_data.get('sales_rank_current'),
-                        rating=product_data.get('rating'),
-                        review_count=product_data.get('review_count'),
-                        price_history=product_data.get('price_history', {}),
-                        rating_history=product_data.get('rating_history', {}),
-                        sales_rank_history=product_data.get('sales_rank_history', {}),
-                        reviews_data=product_data.get('reviews_data', {}),
-                        queried_by=user
-                    )
+                    existing_products[asin], _, _ = upsert_product(product_data, user)
                     
                     self.stdout.write(self.style.SUCCESS(f'  ✓ Producto guardado exitosamente'))
                 
@@ -191,6 +174,7 @@ class Command(BaseCommand):
         self.stdout.write(self.style.SUCCESS(f'  Exitosos: {success_count}'))
         if error_count > 0:
             self.stdout.write(self.style.ERROR(f'  Errores: {error_count}'))
+        report_cache_stats(lambda line: self.stdout.write(f'  {line}'))
         self.stdout.write('')
         
         if success_count > 0:
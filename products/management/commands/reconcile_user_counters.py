@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from products.models import UserCounters
+from products.user_counters import RECONCILE_BATCH_SIZE, reconcile_user_counters
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los contadores por usuario (notificaciones no leídas, alertas activas) de los badges'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=RECONCILE_BATCH_SIZE,
+            help=f'Usuarios por lote (por defecto {RECONCILE_BATCH_SIZE})'
+        )
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Borrar todos los contadores; se recalculan al mostrar la siguiente página de cada usuario'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size debe ser mayor que 0')
+
+        if options.get('reset'):
+            deleted, _ = UserCounters.objects.all().delete()
+            self.stdout.write(self.style.SUCCESS(f'✓ {deleted} contadores borrados'))
+            return
+
+        total = UserCounters.objects.count()
+        self.stdout.write(f'Verificando los contadores de {total} usuarios...')
+        fixed = reconcile_user_counters(batch_size=batch_size)
+        if fixed:
+            logger.warning(f"[USER_COUNTERS] {fixed} contadores desincronizados corregidos")
+        self.stdout.write(
+            self.style.SUCCESS(f'✓ {fixed} contadores corregidos de {total}')
+        )
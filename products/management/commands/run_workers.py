@@ -0,0 +1,152 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from products.alert_leases import default_worker_id
+from products.jobs import JOB_HANDLERS, job_queue_enabled, run_due_jobs
+from products.keepa_cache import report_cache_stats
+from products.models import Job
+import logging
+import signal
+import subprocess
+import sys
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta los trabajos en segundo plano (Job) con un pool de hilos y, opcionalmente, de procesos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=4,
+            help='Hilos por proceso; cada uno ejecuta un trabajo a la vez (por defecto 4)'
+        )
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=1,
+            help='Procesos worker, cada uno con --threads hilos (por defecto 1)'
+        )
+        parser.add_argument(
+            '--kinds',
+            type=str,
+            help=f'Solo estos tipos de trabajo, separados por comas ({", ".join(sorted(JOB_HANDLERS))})'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Terminar cuando no queden trabajos pendientes (para cron) en lugar de esperar nuevos'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=2.0,
+            help='Segundos entre consultas a la cola cuando está vacía (por defecto 2)'
+        )
+
+    def handle(self, *args, **options):
+        threads = options['threads']
+        processes = options['processes']
+        kinds = [kind.strip() for kind in (options.get('kinds') or '').split(',') if kind.strip()]
+
+        if threads < 1:
+            raise CommandError('--threads debe ser mayor que 0')
+        if processes < 1:
+            raise CommandError('--processes debe ser mayor que 0')
+        unknown = set(kinds) - set(JOB_HANDLERS)
+        if unknown:
+            raise CommandError(f'Tipos de trabajo desconocidos: {", ".join(sorted(unknown))}')
+        if not job_queue_enabled():
+            self.stdout.write(
+                self.style.WARNING('JOB_QUEUE_ENABLED está desactivado; los trabajos se ejecutan en el proceso que los encola')
+            )
+
+        if processes > 1:
+            self.run_processes(processes, options)
+        else:
+            self.run_threads(threads, kinds or None, options['once'], options['poll_interval'])
+
+    def run_processes(self, processes, options):
+        """Lanza --processes copias de este comando con un solo proceso cada una y espera a que terminen"""
+        argv = [sys.executable, sys.argv[0], 'run_workers', '--threads', str(options['threads']),
+                '--poll-interval', str(options['poll_interval'])]
+        if options.get('kinds'):
+            argv += ['--kinds', options['kinds']]
+        if options['once']:
+            argv.append('--once')
+
+        children = [subprocess.Popen(argv) for _ in range(processes)]
+        self.stdout.write(f'{processes} procesos worker iniciados')
+
+        def stop_children(signum, frame):
+            for child in children:
+                child.send_signal(signal.SIGTERM)
+
+        signal.signal(signal.SIGTERM, stop_children)
+        signal.signal(signal.SIGINT, stop_children)
+        failed = sum(1 for child in children if child.wait() != 0)
+        if failed:
+            raise CommandError(f'{failed} procesos worker terminaron con error')
+        self.stdout.write(self.style.SUCCESS('✓ Procesos worker terminados'))
+
+    def run_threads(self, threads, kinds, once, poll_interval):
+        """Ejecuta trabajos en --threads hilos hasta recibir SIGTERM/SIGINT (o vaciar la cola con --once)"""
+        self.stop = threading.Event()
+        self.totals = {'succeeded': 0, 'failed': 0}
+        self.totals_lock = threading.Lock()
+
+        previous_handlers = {}
+        if threading.current_thread() is threading.main_thread():
+            def request_stop(signum, frame):
+                self.stdout.write('Deteniendo workers al terminar los trabajos en curso...')
+                self.stop.set()
+
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                previous_handlers[signum] = signal.signal(signum, request_stop)
+
+        worker_id = default_worker_id()
+        self.stdout.write(f'Worker {worker_id}: {threads} hilo(s)')
+        pool = [
+            threading.Thread(
+                target=self._run_in_thread, args=(f'{worker_id}:{index}', kinds, once, poll_interval),
+                name=f'job-worker-{index}',
+            )
+            for index in range(threads)
+        ]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        for signum, handler in previous_handlers.items():
+            signal.signal(signum, handler)
+
+        pending = Job.objects.filter(status__in=Job.UNFINISHED_STATUSES).count()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'✓ {self.totals["succeeded"]} trabajos completados, {self.totals["failed"]} intentos fallidos'
+            )
+        )
+        self.stdout.write(f'  En cola: {pending} sin terminar')
+        report_cache_stats(lambda line: self.stdout.write(f'  {line}'))
+        if self.totals['failed']:
+            logger.warning(f"[JOBS] {self.totals['failed']} intentos de trabajos fallidos en esta ejecución")
+
+    def _run_in_thread(self, worker_id, kinds, once, poll_interval):
+        """Bucle de un hilo del pool; cierra su conexión a la BD al terminar"""
+        try:
+            while not self.stop.is_set():
+                try:
+                    totals = run_due_jobs(worker_id, kinds)
+                except Exception as e:
+                    logger.error(f"[JOBS] Error en el worker {worker_id}: {e}")
+                    totals = {}
+                with self.totals_lock:
+                    for key, value in totals.items():
+                        self.totals[key] += value
+                if once:
+                    break
+                self.stop.wait(poll_interval)
+        finally:
+            connection.close()
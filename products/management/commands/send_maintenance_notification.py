@@ -0,0 +1,60 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from products.models import Notification
+from products.notifications import MAINTENANCE_BATCH_SIZE, send_system_maintenance_notification
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Crea una notificación del sistema para todos los usuarios activos, en lotes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'message',
+            type=str,
+            help='Mensaje de la notificación'
+        )
+        parser.add_argument(
+            '--title',
+            type=str,
+            default='Mantenimiento del Sistema',
+            help='Título de la notificación (por defecto "Mantenimiento del Sistema")'
+        )
+        parser.add_argument(
+            '--type',
+            type=str,
+            default='system',
+            choices=[choice for choice, _ in Notification.NOTIFICATION_TYPES],
+            help='Tipo de notificación (por defecto system)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=MAINTENANCE_BATCH_SIZE,
+            help=f'Notificaciones por INSERT (por defecto {MAINTENANCE_BATCH_SIZE})'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size debe ser mayor que 0')
+
+        total = User.objects.filter(is_active=True).count()
+        self.stdout.write(f'Notificando a {total} usuarios activos...')
+
+        def progress(created):
+            self.stdout.write(f'  {created}/{total} notificaciones creadas')
+
+        created = send_system_maintenance_notification(
+            options['message'],
+            notification_type=options['type'],
+            title=options['title'],
+            batch_size=batch_size,
+            progress=progress,
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(f'✓ {created} notificaciones creadas')
+        )
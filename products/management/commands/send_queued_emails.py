@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+from products.email_queue import EmailConnectionError, drain_queue, email_queue_enabled
+from products.models import OutboundEmail
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Envía los emails en cola (OutboundEmail) en lotes por una sola conexión, con reintentos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Emails reservados por lote (por defecto 100); todos los lotes usan la misma conexión'
+        )
+        parser.add_argument(
+            '--max-batches',
+            type=int,
+            help='Detenerse tras este número de lotes (por defecto, hasta vaciar la cola)'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        max_batches = options.get('max_batches')
+
+        if batch_size < 1:
+            raise CommandError('--batch-size debe ser mayor que 0')
+        if not email_queue_enabled():
+            self.stdout.write(
+                self.style.WARNING('EMAIL_QUEUE_ENABLED está desactivado; las notificaciones se envían sin pasar por la cola')
+            )
+
+        # Una sola conexión SMTP para todos los lotes de esta ejecución
+        try:
+            totals = drain_queue(batch_size=batch_size, max_batches=max_batches)
+        except EmailConnectionError as e:
+            self.stdout.write(
+                self.style.WARNING(f'Servidor de email no disponible ({e}); la cola se enviará en la próxima ejecución')
+            )
+            logger.warning(f"[EMAIL_QUEUE] Servidor de email no disponible: {e}")
+            return
+
+        pending = OutboundEmail.objects.filter(status=OutboundEmail.STATUS_PENDING).count()
+        failed = OutboundEmail.objects.filter(status=OutboundEmail.STATUS_FAILED).count()
+        self.stdout.write(
+            self.style.SUCCESS(f'✓ {totals["sent"]} emails enviados, {totals["failed"]} intentos fallidos')
+        )
+        self.stdout.write(f'  En cola: {pending} pendientes, {failed} fallidos definitivamente')
+        if totals['requeued']:
+            self.stdout.write(
+                self.style.WARNING(
+                    f'Servidor de email no disponible: {totals["requeued"]} emails devueltos a la cola sin gastar intentos'
+                )
+            )
+        if totals['failed']:
+            logger.warning(f"[EMAIL_QUEUE] {totals['failed']} emails no pudieron enviarse en esta ejecución")
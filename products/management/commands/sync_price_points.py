@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand, CommandError
+from products.models import Product
+from products.price_points import price_points_enabled, rebuild_price_points, sync_price_points
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Sincroniza la tabla normalizada PricePoint con el historial de precios de los productos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'asins',
+            nargs='*',
+            type=str,
+            help='ASIN(s) a sincronizar (por defecto todos los productos)'
+        )
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Borrar y reescribir los puntos de cada producto en lugar de solo añadir los nuevos'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Productos procesados por lote (por defecto 200)'
+        )
+
+    def handle(self, *args, **options):
+        asins = [asin.strip().upper() for asin in options['asins']]
+        rebuild = options.get('rebuild', False)
+        batch_size = options['batch_size']
+
+        if batch_size < 1:
+            raise CommandError('--batch-size debe ser mayor que 0')
+        if not price_points_enabled():
+            self.stdout.write(
+                self.style.WARNING('KEEPA_PRICE_POINTS_ENABLED está desactivado; las vistas no mantendrán la tabla al día')
+            )
+
+        products = Product.objects.only('asin', 'price_history').order_by('asin')
+        if asins:
+            products = products.filter(asin__in=asins)
+
+        total = products.count()
+        self.stdout.write(f'Sincronizando puntos de precio de {total} productos...')
+
+        processed = 0
+        written = 0
+        batch = []
+        # iterator() evita cargar todos los historiales en memoria a la vez
+        for product in products.iterator(chunk_size=batch_size):
+            batch.append(product)
+            if len(batch) >= batch_size:
+                written += rebuild_price_points(batch) if rebuild else sync_price_points(batch)
+                processed += len(batch)
+                batch = []
+                self.stdout.write(f'  {processed}/{total} productos, {written} puntos escritos')
+        if batch:
+            written += rebuild_price_points(batch) if rebuild else sync_price_points(batch)
+            processed += len(batch)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'✓ {processed} productos sincronizados, {written} puntos escritos')
+        )
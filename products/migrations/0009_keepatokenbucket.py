@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:58
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_add_results_count_to_bestsellersearch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KeepaTokenBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Identificador del bucket (uno por API key)', max_length=50, unique=True)),
+                ('tokens', models.FloatField(default=0, help_text='Tokens disponibles estimados')),
+                ('capacity', models.IntegerField(help_text='Máximo de tokens que puede acumular el bucket')),
+                ('refill_rate', models.FloatField(help_text='Tokens que se recargan por minuto')),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now, help_text='Última vez que se recalculó el saldo')),
+                ('synced_at', models.DateTimeField(blank=True, help_text='Última vez que el saldo se sincronizó con el valor reportado por Keepa', null=True)),
+            ],
+            options={
+                'verbose_name': 'Bucket de Tokens Keepa',
+                'verbose_name_plural': 'Buckets de Tokens Keepa',
+            },
+        ),
+    ]
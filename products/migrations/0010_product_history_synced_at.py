@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_keepatokenbucket'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='history_synced_at',
+            field=models.DateTimeField(blank=True, help_text='Inicio de la última consulta a Keepa cuyo historial está guardado (para refrescos incrementales)', null=True),
+        ),
+    ]
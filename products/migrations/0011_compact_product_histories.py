@@ -0,0 +1,95 @@
+from django.db import migrations
+
+import products.fields
+
+HISTORIES = [
+    ('price_history', 'price'),
+    ('rating_history', 'rating'),
+    ('sales_rank_history', 'sales_rank'),
+]
+BATCH_SIZE = 200
+
+
+def encode_histories(apps, schema_editor):
+    """Copy the JSON histories into the compact binary columns"""
+    Product = apps.get_model('products', 'Product')
+    compact_fields = [f'{name}_compact' for name, _ in HISTORIES]
+    batch = []
+    for product in Product.objects.only('pk', *[name for name, _ in HISTORIES]).iterator(chunk_size=BATCH_SIZE):
+        for name, _ in HISTORIES:
+            setattr(product, f'{name}_compact', getattr(product, name) or {})
+        batch.append(product)
+        if len(batch) >= BATCH_SIZE:
+            Product.objects.bulk_update(batch, compact_fields)
+            batch = []
+    if batch:
+        Product.objects.bulk_update(batch, compact_fields)
+
+
+def decode_histories(apps, schema_editor):
+    """Copy the compact binary histories back into the JSON columns"""
+    Product = apps.get_model('products', 'Product')
+    json_fields = [name for name, _ in HISTORIES]
+    batch = []
+    for product in Product.objects.only('pk', *[f'{name}_compact' for name, _ in HISTORIES]).iterator(chunk_size=BATCH_SIZE):
+        for name, _ in HISTORIES:
+            setattr(product, name, getattr(product, f'{name}_compact'))
+        batch.append(product)
+        if len(batch) >= BATCH_SIZE:
+            Product.objects.bulk_update(batch, json_fields)
+            batch = []
+    if batch:
+        Product.objects.bulk_update(batch, json_fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0010_product_history_synced_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='price_history_compact',
+            field=products.fields.CompactHistoryField(kind='price', help_text='Historial completo de precios (series binarias comprimidas)'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_history_compact',
+            field=products.fields.CompactHistoryField(kind='rating', help_text='Historial de calificaciones (series binarias comprimidas)'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='sales_rank_history_compact',
+            field=products.fields.CompactHistoryField(kind='sales_rank', help_text='Historial de sales rank (series binarias comprimidas)'),
+        ),
+        migrations.RunPython(encode_histories, decode_histories),
+        migrations.RemoveField(
+            model_name='product',
+            name='price_history',
+        ),
+        migrations.RemoveField(
+            model_name='product',
+            name='rating_history',
+        ),
+        migrations.RemoveField(
+            model_name='product',
+            name='sales_rank_history',
+        ),
+        migrations.RenameField(
+            model_name='product',
+            old_name='price_history_compact',
+            new_name='price_history',
+        ),
+        migrations.RenameField(
+            model_name='product',
+            old_name='rating_history_compact',
+            new_name='rating_history',
+        ),
+        migrations.RenameField(
+            model_name='product',
+            old_name='sales_rank_history_compact',
+            new_name='sales_rank_history',
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_compact_product_histories'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PricePoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('series_type', models.CharField(choices=[('NEW', 'Nuevo'), ('AMAZON', 'Amazon'), ('USED', 'Usado'), ('COLLECTIBLE', 'Coleccionable'), ('REFURBISHED', 'Reacondicionado')], help_text='Tipo de precio de la serie', max_length=12)),
+                ('ts', models.DateTimeField(help_text='Momento del cambio de precio (UTC)')),
+                ('price', models.IntegerField(help_text='Precio en centavos')),
+                ('product', models.ForeignKey(help_text='Producto al que pertenece el punto', on_delete=django.db.models.deletion.CASCADE, related_name='price_points', to='products.product')),
+            ],
+            options={
+                'verbose_name': 'Punto de Precio',
+                'verbose_name_plural': 'Puntos de Precio',
+                'ordering': ['product', 'series_type', 'ts'],
+                'indexes': [models.Index(fields=['series_type', 'ts'], name='products_pr_series__b80a40_idx')],
+                'unique_together': {('product', 'series_type', 'ts')},
+            },
+        ),
+    ]
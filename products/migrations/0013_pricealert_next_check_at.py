@@ -0,0 +1,42 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:17
+
+from datetime import timedelta
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+# Same as PriceAlert.CHECK_INTERVAL_HOURS
+CHECK_INTERVAL_HOURS = {4: 6, 2: 12, 1: 24}
+
+
+def schedule_existing_alerts(apps, schema_editor):
+    """Set next_check_at from last_checked and the frequency, in one UPDATE per frequency"""
+    PriceAlert = apps.get_model('products', 'PriceAlert')
+    PriceAlert.objects.filter(last_checked__isnull=True).update(next_check_at=F('created_at'))
+    for frequency, hours in CHECK_INTERVAL_HOURS.items():
+        PriceAlert.objects.filter(last_checked__isnull=False, frequency=frequency).update(
+            next_check_at=F('last_checked') + timedelta(hours=hours)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0012_pricepoint'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pricealert',
+            name='next_check_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='Próxima vez que la alerta debe verificarse (se recalcula al guardar)'),
+        ),
+        migrations.RunPython(schedule_existing_alerts, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='pricealert',
+            index=models.Index(fields=['is_active', 'triggered', 'next_check_at'], name='products_pr_is_acti_db3219_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0013_pricealert_next_check_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pricealert',
+            index=models.Index(fields=['product', 'price_type', 'is_active', 'triggered', 'target_price'], name='products_pr_product_017dab_idx'),
+        ),
+    ]
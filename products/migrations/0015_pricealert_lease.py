@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0014_pricealert_product_price_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pricealert',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, help_text='Fin de la reserva; después otro worker puede tomar la alerta', null=True),
+        ),
+        migrations.AddField(
+            model_name='pricealert',
+            name='lease_owner',
+            field=models.CharField(blank=True, default='', help_text='Worker de check_price_alerts que tiene reservada la alerta', max_length=100),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:24
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0015_pricealert_lease'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboundEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('to_email', models.EmailField(help_text='Dirección de destino', max_length=254)),
+                ('subject', models.CharField(help_text='Asunto del email', max_length=255)),
+                ('body_text', models.TextField(help_text='Contenido en texto plano')),
+                ('body_html', models.TextField(blank=True, default='', help_text='Contenido HTML (opcional)')),
+                ('status', models.CharField(choices=[('pending', 'Pendiente'), ('sending', 'Enviando'), ('sent', 'Enviado'), ('failed', 'Fallido')], default='pending', help_text='Estado de entrega', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0, help_text='Intentos de envío fallidos')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, help_text='Cuándo puede (re)intentarse el envío')),
+                ('last_error', models.TextField(blank=True, default='', help_text='Último error de envío')),
+                ('created_at', models.DateTimeField(auto_now_add=True, help_text='Fecha en que se encoló el email')),
+                ('sent_at', models.DateTimeField(blank=True, help_text='Fecha de envío', null=True)),
+                ('user', models.ForeignKey(blank=True, help_text='Usuario destinatario (si aplica)', null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Email saliente',
+                'verbose_name_plural': 'Emails salientes',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='products_ou_status_ee6f11_idx')],
+            },
+        ),
+    ]
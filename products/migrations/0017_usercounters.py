@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('products', '0016_outboundemail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserCounters',
+            fields=[
+                ('user', models.OneToOneField(help_text='Usuario', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counters', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('unread_notifications', models.PositiveIntegerField(default=0, help_text='Notificaciones no leídas')),
+                ('active_alerts', models.PositiveIntegerField(default=0, help_text='Alertas de precio activas')),
+                ('updated_at', models.DateTimeField(auto_now=True, help_text='Última vez que se recalcularon los contadores')),
+            ],
+            options={
+                'verbose_name': 'Contadores de usuario',
+                'verbose_name_plural': 'Contadores de usuarios',
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:28
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('products', '0017_usercounters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardSnapshot',
+            fields=[
+                ('user', models.OneToOneField(help_text='Usuario', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='dashboard_snapshot', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('stats', models.JSONField(default=dict, help_text='Contadores y distribuciones que muestra el dashboard')),
+                ('computed_at', models.DateTimeField(default=django.utils.timezone.now, help_text='Cuándo se calcularon las estadísticas')),
+            ],
+            options={
+                'verbose_name': 'Estadísticas del dashboard',
+                'verbose_name_plural': 'Estadísticas del dashboard',
+            },
+        ),
+    ]
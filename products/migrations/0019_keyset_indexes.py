@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0018_dashboardsnapshot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='products_no_user_id_6079e3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['queried_by', 'last_updated', 'asin'], name='products_pr_queried_ac4748_idx'),
+        ),
+    ]
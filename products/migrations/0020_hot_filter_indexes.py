@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:33
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0019_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'is_read', 'created_at'], name='products_no_user_id_3b184a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pricealert',
+            index=models.Index(fields=['user', 'is_active'], name='products_pr_user_id_1f5959_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['queried_by', 'rating', 'review_count'], name='products_pr_queried_2be61b_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0020_hot_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FetchLease',
+            fields=[
+                ('key', models.CharField(help_text="Clave de la consulta, p. ej. 'product:B07X6C9RMF'", max_length=100, primary_key=True, serialize=False)),
+                ('owner', models.CharField(help_text='Proceso e hilo que está ejecutando la consulta', max_length=150)),
+                ('expires_at', models.DateTimeField(help_text='Fin de la reserva; después otro proceso puede tomarla')),
+            ],
+            options={
+                'verbose_name': 'Reserva de Consulta',
+                'verbose_name_plural': 'Reservas de Consulta',
+            },
+        ),
+    ]
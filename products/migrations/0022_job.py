@@ -0,0 +1,43 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:38
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0021_fetchlease'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(help_text='Tipo de trabajo (ver products/job_handlers.py)', max_length=50)),
+                ('key', models.CharField(blank=True, default='', help_text='Clave de deduplicación: no se encola otro trabajo con la misma clave mientras este no termine', max_length=150)),
+                ('payload', models.JSONField(blank=True, default=dict, help_text='Argumentos del trabajo')),
+                ('status', models.CharField(choices=[('pending', 'Pendiente'), ('running', 'En ejecución'), ('succeeded', 'Completado'), ('failed', 'Fallido')], default='pending', help_text='Estado del trabajo', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0, help_text='Intentos ejecutados')),
+                ('max_attempts', models.PositiveIntegerField(default=3, help_text='Intentos antes de marcar el trabajo como fallido')),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now, help_text='Cuándo puede ejecutarse; en ejecución, fin de la reserva del worker')),
+                ('worker', models.CharField(blank=True, default='', help_text='Último worker que tomó el trabajo', max_length=150)),
+                ('result', models.JSONField(blank=True, help_text='Resultado del trabajo (para la API de estado)', null=True)),
+                ('last_error', models.TextField(blank=True, default='', help_text='Último error')),
+                ('created_at', models.DateTimeField(auto_now_add=True, help_text='Fecha en que se encoló el trabajo')),
+                ('started_at', models.DateTimeField(blank=True, help_text='Inicio del último intento', null=True)),
+                ('finished_at', models.DateTimeField(blank=True, help_text='Fecha en que terminó (completado o fallido)', null=True)),
+                ('user', models.ForeignKey(blank=True, help_text='Usuario que encoló el trabajo (si aplica)', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Trabajo',
+                'verbose_name_plural': 'Trabajos',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'run_at'], name='products_jo_status_eb5978_idx'), models.Index(fields=['key', 'status'], name='products_jo_key_54627d_idx')],
+            },
+        ),
+    ]
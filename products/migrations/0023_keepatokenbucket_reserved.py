@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0022_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='keepatokenbucket',
+            name='reserved',
+            field=models.FloatField(default=0, help_text='Tokens reservados por llamadas en curso que Keepa aún no ha descontado'),
+        ),
+        migrations.AddField(
+            model_name='keepatokenbucket',
+            name='reserved_at',
+            field=models.DateTimeField(blank=True, help_text='Última reserva de tokens', null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 04:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0023_keepatokenbucket_reserved'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fetchlease',
+            name='empty',
+            field=models.BooleanField(default=False, help_text='La consulta no devolvió nada; hasta expires_at se responde lo mismo sin repetirla'),
+        ),
+    ]
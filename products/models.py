@@ -1,7 +1,36 @@
 from django.db import models
+from django.db.models import Count, Max, Min, OuterRef, Subquery
 from django.contrib.auth.models import User
+from datetime import timedelta
 from decimal import Decimal
 from django.utils import timezone
+from .fields import CompactHistoryField
+
+
+# Columnas grandes de Product que los listados no muestran (historiales, reseñas, resumen IA)
+PRODUCT_HEAVY_FIELDS = (
+    'price_history', 'rating_history', 'sales_rank_history', 'reviews_data', 'ai_summary',
+)
+
+
+def product_heavy_fields(prefix=''):
+    """Columnas pesadas de Product, con el prefijo de la relación si se cargan por join (ej. 'product__')"""
+    return [f'{prefix}{name}' for name in PRODUCT_HEAVY_FIELDS]
+
+
+class ProductQuerySet(models.QuerySet):
+    """Consultas de productos; summary() es la proyección ligera para listados"""
+    
+    def summary(self):
+        """Difiere las columnas pesadas (se cargan solo si se accede a ellas)"""
+        return self.defer(*PRODUCT_HEAVY_FIELDS)
+
+
+class ProductSummaryManager(models.Manager.from_queryset(ProductQuerySet)):
+    """Manager que devuelve los productos sin las columnas pesadas"""
+    
+    def get_queryset(self):
+        return super().get_queryset().summary()
 
 
 class Product(models.Model):
@@ -91,22 +120,27 @@ class Product(models.Model):
         blank=True,
         help_text="Número total de reseñas"
     )
-    price_history = models.JSONField(
-        default=dict,
-        help_text="Historial completo de precios en formato JSON"
+    price_history = CompactHistoryField(
+        kind='price',
+        help_text="Historial completo de precios (series binarias comprimidas)"
     )
-    rating_history = models.JSONField(
-        default=dict,
-        help_text="Historial de calificaciones en formato JSON"
+    rating_history = CompactHistoryField(
+        kind='rating',
+        help_text="Historial de calificaciones (series binarias comprimidas)"
     )
-    sales_rank_history = models.JSONField(
-        default=dict,
-        help_text="Historial de sales rank en formato JSON"
+    sales_rank_history = CompactHistoryField(
+        kind='sales_rank',
+        help_text="Historial de sales rank (series binarias comprimidas)"
     )
     reviews_data = models.JSONField(
         default=dict,
         help_text="Datos de reseñas en formato JSON"
     )
+    history_synced_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Inicio de la última consulta a Keepa cuyo historial está guardado (para refrescos incrementales)"
+    )
     ai_summary = models.TextField(
         null=True,
         blank=True,
@@ -131,10 +165,20 @@ class Product(models.Model):
         help_text="Usuario que consultó el producto"
     )
     
+    objects = ProductQuerySet.as_manager()
+    # Para listados: Product.summaries.filter(...) no carga historiales ni reseñas
+    summaries = ProductSummaryManager()
+    
     class Meta:
         ordering = ['-last_updated']
         verbose_name = "Producto"
         verbose_name_plural = "Productos"
+        indexes = [
+            # Lista de productos del usuario paginada por cursor (last_updated, asin)
+            models.Index(fields=['queried_by', 'last_updated', 'asin']),
+            # Mejor calificados del dashboard (rating, review_count)
+            models.Index(fields=['queried_by', 'rating', 'review_count']),
+        ]
     
     def __str__(self):
         return f"{self.asin} - {self.title[:50]}..."
@@ -176,6 +220,14 @@ class Product(models.Model):
         return reverse('products:delete', kwargs={'asin': self.asin})
 
 
+class PriceAlertQuerySet(models.QuerySet):
+    """Consultas de alertas de precio"""
+    
+    def with_product_summary(self):
+        """Carga el producto de cada alerta en el mismo join, sin sus columnas pesadas"""
+        return self.select_related('product').defer(*product_heavy_fields('product__'))
+
+
 class PriceAlert(models.Model):
     """Modelo para alertas de precio configuradas por usuarios"""
     
@@ -239,12 +291,40 @@ class PriceAlert(models.Model):
         blank=True,
         help_text="Última vez que se verificó esta alerta"
     )
+    next_check_at = models.DateTimeField(
+        default=timezone.now,
+        help_text="Próxima vez que la alerta debe verificarse (se recalcula al guardar)"
+    )
+    lease_owner = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        help_text="Worker de check_price_alerts que tiene reservada la alerta"
+    )
+    lease_expires_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Fin de la reserva; después otro worker puede tomar la alerta"
+    )
+    
+    # Horas entre verificaciones según la frecuencia
+    CHECK_INTERVAL_HOURS = {4: 6, 2: 12, 1: 24}
+    
+    objects = PriceAlertQuerySet.as_manager()
     
     class Meta:
         ordering = ['-created_at']
         verbose_name = "Alerta de Precio"
         verbose_name_plural = "Alertas de Precio"
         unique_together = ['user', 'product', 'price_type', 'target_price']
+        indexes = [
+            # check_price_alerts selecciona solo las alertas pendientes por este índice
+            models.Index(fields=['is_active', 'triggered', 'next_check_at']),
+            # Evaluación inmediata al cambiar un precio: alertas activas de un producto con target_price >= precio
+            models.Index(fields=['product', 'price_type', 'is_active', 'triggered', 'target_price']),
+            # Alertas activas de un usuario (lista de alertas, dashboard, contadores)
+            models.Index(fields=['user', 'is_active']),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.product.asin} - ${self.get_target_price_display()}"
@@ -261,22 +341,30 @@ class PriceAlert(models.Model):
         """Obtiene el display de la frecuencia"""
         return dict(self.FREQUENCY_CHOICES)[self.frequency]
     
+    def get_next_check_at(self):
+        """Calcula cuándo debe volver a verificarse la alerta según last_checked y la frecuencia"""
+        if not self.last_checked:
+            # Nunca verificada: pendiente desde su creación
+            return self.created_at or timezone.now()
+        hours = self.CHECK_INTERVAL_HOURS.get(self.frequency)
+        if hours is None:
+            return None
+        return self.last_checked + timedelta(hours=hours)
+    
+    def save(self, *args, **kwargs):
+        """Mantiene next_check_at al día cada vez que se verifica o edita la alerta"""
+        next_check_at = self.get_next_check_at()
+        if next_check_at is not None:
+            self.next_check_at = next_check_at
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'next_check_at' not in update_fields:
+            kwargs['update_fields'] = list(update_fields) + ['next_check_at']
+        super().save(*args, **kwargs)
+    
     def should_check_now(self):
         """Determina si la alerta debe verificarse ahora basado en su frecuencia"""
-        if not self.last_checked:
-            return True
-        
-        now = timezone.now()
-        hours_since_last_check = (now - self.last_checked).total_seconds() / 3600
-        
-        if self.frequency == 4:  # Cada 6 horas
-            return hours_since_last_check >= 6
-        elif self.frequency == 2:  # Cada 12 horas
-            return hours_since_last_check >= 12
-        elif self.frequency == 1:  # Cada 24 horas
-            return hours_since_last_check >= 24
-        
-        return False
+        next_check_at = self.get_next_check_at()
+        return next_check_at is not None and next_check_at <= timezone.now()
 
 
 class Notification(models.Model):
@@ -327,6 +415,12 @@ class Notification(models.Model):
         ordering = ['-created_at']
         verbose_name = "Notificación"
         verbose_name_plural = "Notificaciones"
+        indexes = [
+            # Centro de notificaciones paginado por cursor (created_at, id)
+            models.Index(fields=['user', 'created_at', 'id']),
+            # No leídas de un usuario (contadores, marcar todas como leídas)
+            models.Index(fields=['user', 'is_read', 'created_at']),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.title}"
@@ -346,6 +440,142 @@ class Notification(models.Model):
         return icons.get(self.notification_type, '📢')
 
 
+class UserCounters(models.Model):
+    """Contadores por usuario que muestran los badges de todas las páginas (ver products/user_counters.py)"""
+    
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='counters',
+        help_text="Usuario"
+    )
+    unread_notifications = models.PositiveIntegerField(
+        default=0,
+        help_text="Notificaciones no leídas"
+    )
+    active_alerts = models.PositiveIntegerField(
+        default=0,
+        help_text="Alertas de precio activas"
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        help_text="Última vez que se recalcularon los contadores"
+    )
+    
+    class Meta:
+        verbose_name = "Contadores de usuario"
+        verbose_name_plural = "Contadores de usuarios"
+    
+    def __str__(self):
+        return f"{self.user_id}: {self.unread_notifications} no leídas, {self.active_alerts} alertas activas"
+
+
+class DashboardSnapshot(models.Model):
+    """Estadísticas precalculadas del dashboard de un usuario (ver products/dashboard_stats.py)"""
+    
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='dashboard_snapshot',
+        help_text="Usuario"
+    )
+    stats = models.JSONField(
+        default=dict,
+        help_text="Contadores y distribuciones que muestra el dashboard"
+    )
+    computed_at = models.DateTimeField(
+        default=timezone.now,
+        help_text="Cuándo se calcularon las estadísticas"
+    )
+    
+    class Meta:
+        verbose_name = "Estadísticas del dashboard"
+        verbose_name_plural = "Estadísticas del dashboard"
+    
+    def __str__(self):
+        return f"{self.user_id} ({self.computed_at:%Y-%m-%d %H:%M})"
+
+
+class OutboundEmail(models.Model):
+    """Email en cola; el comando send_queued_emails los envía en lotes por una sola conexión"""
+    
+    STATUS_PENDING = 'pending'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pendiente'),
+        (STATUS_SENDING, 'Enviando'),
+        (STATUS_SENT, 'Enviado'),
+        (STATUS_FAILED, 'Fallido'),
+    ]
+    
+    user = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        help_text="Usuario destinatario (si aplica)"
+    )
+    to_email = models.EmailField(
+        help_text="Dirección de destino"
+    )
+    subject = models.CharField(
+        max_length=255,
+        help_text="Asunto del email"
+    )
+    body_text = models.TextField(
+        help_text="Contenido en texto plano"
+    )
+    body_html = models.TextField(
+        blank=True,
+        default='',
+        help_text="Contenido HTML (opcional)"
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        help_text="Estado de entrega"
+    )
+    attempts = models.PositiveIntegerField(
+        default=0,
+        help_text="Intentos de envío fallidos"
+    )
+    next_attempt_at = models.DateTimeField(
+        default=timezone.now,
+        help_text="Cuándo puede (re)intentarse el envío"
+    )
+    last_error = models.TextField(
+        blank=True,
+        default='',
+        help_text="Último error de envío"
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        help_text="Fecha en que se encoló el email"
+    )
+    sent_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Fecha de envío"
+    )
+    
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "Email saliente"
+        verbose_name_plural = "Emails salientes"
+        indexes = [
+            # Emails pendientes por orden de envío (send_queued_emails)
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.to_email} - {self.subject} ({self.get_status_display()})"
+
+
 class BestSellerSearch(models.Model):
     """Modelo para guardar el historial de búsquedas de best sellers"""
     
@@ -399,4 +629,268 @@ class BestSellerSearch(models.Model):
             'category_id': self.category_id,
             'category_search': self.category_search
         }
-        return f"{reverse('products:best_sellers')}?{urlencode(params)}"
\ No newline at end of file
+        return f"{reverse('products:best_sellers')}?{urlencode(params)}"
+
+class KeepaTokenBucket(models.Model):
+    """Token bucket compartido entre procesos para el presupuesto de tokens de Keepa"""
+    
+    name = models.CharField(
+        max_length=50,
+        unique=True,
+        help_text="Identificador del bucket (uno por API key)"
+    )
+    tokens = models.FloatField(
+        default=0,
+        help_text="Tokens disponibles estimados"
+    )
+    reserved = models.FloatField(
+        default=0,
+        help_text="Tokens reservados por llamadas en curso que Keepa aún no ha descontado"
+    )
+    reserved_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Última reserva de tokens"
+    )
+    capacity = models.IntegerField(
+        help_text="Máximo de tokens que puede acumular el bucket"
+    )
+    refill_rate = models.FloatField(
+        help_text="Tokens que se recargan por minuto"
+    )
+    updated_at = models.DateTimeField(
+        default=timezone.now,
+        help_text="Última vez que se recalculó el saldo"
+    )
+    synced_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Última vez que el saldo se sincronizó con el valor reportado por Keepa"
+    )
+    
+    class Meta:
+        verbose_name = "Bucket de Tokens Keepa"
+        verbose_name_plural = "Buckets de Tokens Keepa"
+    
+    def __str__(self):
+        return f"{self.name} - {self.tokens:.0f}/{self.capacity} tokens"
+    
+    def refill(self, now=None):
+        """Agrega los tokens recargados desde la última actualización (sin guardar)"""
+        now = now or timezone.now()
+        elapsed_minutes = max((now - self.updated_at).total_seconds() / 60, 0)
+        self.tokens = min(self.capacity, self.tokens + elapsed_minutes * self.refill_rate)
+        self.updated_at = now
+
+
+class FetchLease(models.Model):
+    """Reserva entre procesos de una consulta en curso (p. ej. el fetch de Keepa de un ASIN)"""
+    
+    key = models.CharField(
+        max_length=100,
+        primary_key=True,
+        help_text="Clave de la consulta, p. ej. 'product:B07X6C9RMF'"
+    )
+    owner = models.CharField(
+        max_length=150,
+        help_text="Proceso e hilo que está ejecutando la consulta"
+    )
+    expires_at = models.DateTimeField(
+        help_text="Fin de la reserva; después otro proceso puede tomarla"
+    )
+    empty = models.BooleanField(
+        default=False,
+        help_text="La consulta no devolvió nada; hasta expires_at se responde lo mismo sin repetirla"
+    )
+    
+    class Meta:
+        verbose_name = "Reserva de Consulta"
+        verbose_name_plural = "Reservas de Consulta"
+    
+    def __str__(self):
+        return f"{self.key} - {self.owner}"
+
+
+class Job(models.Model):
+    """Trabajo en segundo plano (consultas a Keepa, OpenAI); el comando run_workers los ejecuta"""
+    
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pendiente'),
+        (STATUS_RUNNING, 'En ejecución'),
+        (STATUS_SUCCEEDED, 'Completado'),
+        (STATUS_FAILED, 'Fallido'),
+    ]
+    UNFINISHED_STATUSES = [STATUS_PENDING, STATUS_RUNNING]
+    
+    kind = models.CharField(
+        max_length=50,
+        help_text="Tipo de trabajo (ver products/job_handlers.py)"
+    )
+    key = models.CharField(
+        max_length=150,
+        blank=True,
+        default='',
+        help_text="Clave de deduplicación: no se encola otro trabajo con la misma clave mientras este no termine"
+    )
+    payload = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Argumentos del trabajo"
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='jobs',
+        help_text="Usuario que encoló el trabajo (si aplica)"
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        help_text="Estado del trabajo"
+    )
+    attempts = models.PositiveIntegerField(
+        default=0,
+        help_text="Intentos ejecutados"
+    )
+    max_attempts = models.PositiveIntegerField(
+        default=3,
+        help_text="Intentos antes de marcar el trabajo como fallido"
+    )
+    run_at = models.DateTimeField(
+        default=timezone.now,
+        help_text="Cuándo puede ejecutarse; en ejecución, fin de la reserva del worker"
+    )
+    worker = models.CharField(
+        max_length=150,
+        blank=True,
+        default='',
+        help_text="Último worker que tomó el trabajo"
+    )
+    result = models.JSONField(
+        null=True,
+        blank=True,
+        help_text="Resultado del trabajo (para la API de estado)"
+    )
+    last_error = models.TextField(
+        blank=True,
+        default='',
+        help_text="Último error"
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        help_text="Fecha en que se encoló el trabajo"
+    )
+    started_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Inicio del último intento"
+    )
+    finished_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Fecha en que terminó (completado o fallido)"
+    )
+    
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "Trabajo"
+        verbose_name_plural = "Trabajos"
+        indexes = [
+            # Trabajos listos por orden de ejecución (run_workers)
+            models.Index(fields=['status', 'run_at']),
+            # Trabajo sin terminar con la misma clave (deduplicación)
+            models.Index(fields=['key', 'status']),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.get_status_display()})"
+
+
+class PricePointQuerySet(models.QuerySet):
+    """Consultas de rango, mínimos/máximos y último valor sobre PricePoint (resueltas en SQL)"""
+    
+    def series(self, *series_types):
+        """Filtra por tipo de serie ('NEW', 'AMAZON', ...)"""
+        return self.filter(series_type__in=series_types)
+    
+    def between(self, start=None, end=None):
+        """Filtra los puntos con start <= ts < end (cualquiera de los dos puede omitirse)"""
+        queryset = self
+        if start is not None:
+            queryset = queryset.filter(ts__gte=start)
+        if end is not None:
+            queryset = queryset.filter(ts__lt=end)
+        return queryset
+    
+    def for_user(self, user):
+        """Filtra los puntos de los productos consultados por un usuario"""
+        return self.filter(product__queried_by=user)
+    
+    def price_range(self):
+        """Precio mínimo, máximo y número de puntos por producto y serie (en centavos)"""
+        return self.values('product_id', 'series_type').annotate(
+            min_price=Min('price'),
+            max_price=Max('price'),
+            points=Count('id'),
+        ).order_by('product_id', 'series_type')
+    
+    def last_values(self):
+        """Último punto de cada producto y serie dentro del queryset actual"""
+        last_ts = self.filter(
+            product=OuterRef('product'),
+            series_type=OuterRef('series_type'),
+        ).order_by('-ts').values('ts')[:1]
+        return self.filter(ts=Subquery(last_ts))
+
+
+class PricePoint(models.Model):
+    """Punto del historial de precios normalizado (una fila por producto, serie y timestamp)"""
+    
+    SERIES_CHOICES = [
+        ('NEW', 'Nuevo'),
+        ('AMAZON', 'Amazon'),
+        ('USED', 'Usado'),
+        ('COLLECTIBLE', 'Coleccionable'),
+        ('REFURBISHED', 'Reacondicionado'),
+    ]
+    
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='price_points',
+        help_text="Producto al que pertenece el punto"
+    )
+    series_type = models.CharField(
+        max_length=12,
+        choices=SERIES_CHOICES,
+        help_text="Tipo de precio de la serie"
+    )
+    ts = models.DateTimeField(
+        help_text="Momento del cambio de precio (UTC)"
+    )
+    price = models.IntegerField(
+        help_text="Precio en centavos"
+    )
+    
+    objects = PricePointQuerySet.as_manager()
+    
+    class Meta:
+        verbose_name = "Punto de Precio"
+        verbose_name_plural = "Puntos de Precio"
+        ordering = ['product', 'series_type', 'ts']
+        # El índice único (product, series_type, ts) sirve las consultas por producto;
+        # (series_type, ts) las del catálogo completo por rango de fechas
+        unique_together = ['product', 'series_type', 'ts']
+        indexes = [
+            models.Index(fields=['series_type', 'ts']),
+        ]
+    
+    def __str__(self):
+        return f"{self.product_id} - {self.series_type} - {self.ts:%Y-%m-%d %H:%M} - {self.price}"
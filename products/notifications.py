@@ -3,10 +3,15 @@ from django.core.mail import send_mail, EmailMultiAlternatives
 from django.template.loader import render_to_string
 from django.conf import settings
 from django.utils import timezone
+from .email_queue import build_email, email_queue_enabled, queue_email
 from .models import PriceAlert, Notification
+from .user_counters import increment_counters, invalidate_user_counters
 
 logger = logging.getLogger(__name__)
 
+# Notificaciones por INSERT al notificar a todos los usuarios
+MAINTENANCE_BATCH_SIZE = 2000
+
 
 def create_system_notification(user, title, message, notification_type='info', alert=None):
     """
@@ -37,18 +42,21 @@ def create_system_notification(user, title, message, notification_type='info', a
         return None
 
 
-def send_email_notification(user, subject, html_content, text_content=None):
+def send_email_notification(user, subject, html_content, text_content=None, buffer=None):
     """
     Envía una notificación por email
     
+    Con EMAIL_QUEUE_ENABLED el email solo se encola; lo envía el comando send_queued_emails.
+    
     Args:
         user: Usuario destinatario
         subject: Asunto del email
         html_content: Contenido HTML del email
         text_content: Contenido texto plano (opcional)
+        buffer: AlertWriteBuffer opcional donde acumular el email encolado
     
     Returns:
-        bool: True si se envió correctamente
+        bool: True si se envió (o encoló) correctamente
     """
     try:
         if text_content is None:
@@ -57,6 +65,14 @@ def send_email_notification(user, subject, html_content, text_content=None):
             text_content = re.sub(r'<[^>]+>', '', html_content)
             text_content = re.sub(r'\s+', ' ', text_content).strip()
         
+        if email_queue_enabled():
+            if buffer is not None:
+                buffer.add_email(build_email(user.email, subject, text_content, html_content, user=user))
+            else:
+                queue_email(user.email, subject, text_content, html_content, user=user)
+            logger.info(f"Email encolado para {user.email}: {subject}")
+            return True
+        
         msg = EmailMultiAlternatives(
             subject=subject,
             body=text_content,
@@ -74,13 +90,15 @@ def send_email_notification(user, subject, html_content, text_content=None):
         return False
 
 
-def send_price_alert_notification(alert, current_price):
+def send_price_alert_notification(alert, current_price, buffer=None):
     """
     Envía notificación de alerta de precio (email + sistema)
     
     Args:
         alert: Objeto PriceAlert
         current_price: Precio actual en centavos
+        buffer: AlertWriteBuffer opcional; la notificación del sistema y el email se
+            acumulan en él en lugar de insertarse al momento (check_price_alerts)
     
     Returns:
         bool: True si se envió correctamente
@@ -105,13 +123,22 @@ def send_price_alert_notification(alert, current_price):
         title = f"¡Alerta de Precio! {alert.product.title[:50]}..."
         message = f"El precio de {alert.product.title} bajó a {context['current_price_display']} (objetivo: {context['target_price_display']})"
         
-        notification = create_system_notification(
-            user=alert.user,
-            title=title,
-            message=message,
-            notification_type='price_alert',
-            alert=alert
-        )
+        if buffer is not None:
+            buffer.add_notification(Notification(
+                user=alert.user,
+                alert=alert,
+                notification_type='price_alert',
+                title=title,
+                message=message
+            ))
+        else:
+            create_system_notification(
+                user=alert.user,
+                title=title,
+                message=message,
+                notification_type='price_alert',
+                alert=alert
+            )
         
         # Enviar email
         subject = f"💰 {context['site_name']} - Alerta de Precio: {alert.product.title[:50]}..."
@@ -123,14 +150,16 @@ def send_price_alert_notification(alert, current_price):
             user=alert.user,
             subject=subject,
             html_content=html_content,
-            text_content=text_content
+            text_content=text_content,
+            buffer=buffer
         )
         
-        # Marcar alerta como disparada
-        alert.triggered = True
-        alert.triggered_at = timezone.now()
-        alert.is_active = False  # Desactivar alerta después de disparar
-        alert.save()
+        # Marcar alerta como disparada (si quien llama no la reclamó ya con claim_alert)
+        if not alert.triggered:
+            alert.triggered = True
+            alert.triggered_at = timezone.now()
+            alert.is_active = False  # Desactivar alerta después de disparar
+            alert.save(update_fields=['triggered', 'triggered_at', 'is_active'])
         
         logger.info(f"Alerta disparada para {alert.user.username} - {alert.product.asin}")
         return True
@@ -158,27 +187,57 @@ def send_welcome_notification(user):
     )
 
 
-def send_system_maintenance_notification(message, notification_type='system'):
+def send_system_maintenance_notification(message, notification_type='system', title="Mantenimiento del Sistema",
+                                         batch_size=MAINTENANCE_BATCH_SIZE, progress=None):
     """
     Envía notificación de mantenimiento a todos los usuarios
     
+    Recorre los IDs de los usuarios activos con iterator() y crea las notificaciones
+    con bulk_create en lotes, sin cargar los usuarios ni guardar una fila por consulta.
+    
     Args:
         message: Mensaje de mantenimiento
         notification_type: Tipo de notificación
+        title: Título de la notificación
+        batch_size: Notificaciones por INSERT
+        progress: Callable opcional que recibe el número de notificaciones creadas tras cada lote
+    
+    Returns:
+        int: Número de notificaciones creadas
     """
     from django.contrib.auth.models import User
     
-    users = User.objects.filter(is_active=True)
+    user_ids = User.objects.filter(is_active=True).order_by('id').values_list('id', flat=True)
     
-    for user in users:
-        create_system_notification(
-            user=user,
-            title="Mantenimiento del Sistema",
+    created = 0
+    batch = []
+    for user_id in user_ids.iterator(chunk_size=batch_size):
+        batch.append(Notification(
+            user_id=user_id,
+            title=title,
             message=message,
             notification_type=notification_type
-        )
+        ))
+        if len(batch) >= batch_size:
+            _create_maintenance_batch(batch)
+            created += len(batch)
+            batch = []
+            if progress:
+                progress(created)
+    if batch:
+        _create_maintenance_batch(batch)
+        created += len(batch)
+        if progress:
+            progress(created)
     
-    logger.info(f"Notificación de mantenimiento enviada a {users.count()} usuarios")
+    logger.info(f"Notificación de mantenimiento enviada a {created} usuarios")
+    return created
+
+
+def _create_maintenance_batch(notifications):
+    Notification.objects.bulk_create(notifications)
+    # bulk_create no dispara las señales que mantienen los contadores de los badges
+    increment_counters([notification.user_id for notification in notifications], 'unread_notifications')
 
 
 def get_user_unread_notifications_count(user):
@@ -228,6 +287,7 @@ def mark_all_notifications_as_read(user):
         user=user, 
         is_read=False
     ).update(is_read=True)
+    invalidate_user_counters([user.pk])
     
     logger.info(f"Marcadas {updated_count} notificaciones como leídas para {user.username}")
     return updated_count
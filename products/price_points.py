@@ -0,0 +1,142 @@
+"""
+Normalized copy of Product.price_history in the PricePoint table.
+
+price_history is a compressed blob per product, so any question that spans the
+catalog ("lowest NEW price in the last 90 days across my products") would have to
+load and decode every blob. The ingestion paths also write each price point as a
+PricePoint row keyed by (product, series_type, ts), so those questions become
+indexed SQL range and aggregate queries (see PricePointQuerySet).
+
+Histories only grow (full queries return a superset of the stored points and
+incremental refreshes append), so syncing inserts the points newer than the last
+stored one of each series. rebuild_price_points rewrites a product's rows from
+scratch, for backfills or after manual edits.
+"""
+import logging
+from datetime import datetime, timezone as dt_timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .history_merge import PRICE_TYPES
+from .models import PricePoint, Product
+
+logger = logging.getLogger(__name__)
+
+# Rows per INSERT statement
+PRICE_POINT_BATCH_SIZE = 2000
+
+
+def price_points_enabled() -> bool:
+    """Whether the ingestion paths keep the PricePoint table in sync"""
+    return getattr(settings, 'KEEPA_PRICE_POINTS_ENABLED', True)
+
+
+def _parse_time(value: str) -> datetime:
+    """Stored price times are naive UTC 'YYYY-MM-DDTHH:MM:SS' strings"""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=dt_timezone.utc)
+    return parsed
+
+
+def _format_time(value: datetime) -> str:
+    """Inverse of _parse_time, so stored times can be compared as strings"""
+    return timezone.make_naive(value, dt_timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def price_points_from_history(
+    product: Product,
+    price_history: Dict[str, Any],
+    after: Optional[Dict[str, str]] = None,
+) -> List[PricePoint]:
+    """
+    Build the PricePoint rows of a price history
+
+    Args:
+        product: Product the history belongs to
+        price_history: Product.price_history dict
+        after: Optional {series_type: time string}; only later points are returned
+
+    Returns:
+        Unsaved PricePoint instances
+    """
+    after = after or {}
+    points = []
+    for series_type in PRICE_TYPES:
+        series = (price_history or {}).get(series_type)
+        if not isinstance(series, dict):
+            continue
+        cutoff = after.get(series_type)
+        for price, time in zip(series.get('prices', []), series.get('times', [])):
+            if cutoff is not None and time <= cutoff:
+                continue
+            points.append(PricePoint(product=product, series_type=series_type, ts=_parse_time(time), price=price))
+    return points
+
+
+def _last_stored_times(asins: List[str]) -> Dict[Tuple[str, str], str]:
+    """Time of the last stored point per (asin, series_type), as price history strings"""
+    rows = (
+        PricePoint.objects.filter(product_id__in=asins)
+        .values('product_id', 'series_type')
+        .annotate(last_ts=Max('ts'))
+        .order_by()
+    )
+    return {(row['product_id'], row['series_type']): _format_time(row['last_ts']) for row in rows}
+
+
+def sync_price_points(products: Iterable[Product]) -> int:
+    """
+    Insert the price history points of the products that are not stored yet
+
+    Args:
+        products: Saved Product instances with their current price_history
+
+    Returns:
+        Number of points written
+    """
+    if not price_points_enabled():
+        return 0
+    products = [product for product in products if product.price_history]
+    if not products:
+        return 0
+
+    last_times = _last_stored_times([product.asin for product in products])
+    points = []
+    for product in products:
+        after = {
+            series_type: last_times[(product.asin, series_type)]
+            for series_type in PRICE_TYPES
+            if (product.asin, series_type) in last_times
+        }
+        points.extend(price_points_from_history(product, product.price_history, after))
+
+    # ignore_conflicts keeps concurrent syncs of the same product from failing
+    PricePoint.objects.bulk_create(points, batch_size=PRICE_POINT_BATCH_SIZE, ignore_conflicts=True)
+    if points:
+        logger.debug(f"[PRICE_POINTS] {len(points)} puntos nuevos para {len(products)} productos")
+    return len(points)
+
+
+def rebuild_price_points(products: Iterable[Product]) -> int:
+    """
+    Replace the stored PricePoint rows of the products with their full price history
+
+    Args:
+        products: Saved Product instances
+
+    Returns:
+        Number of points written
+    """
+    products = list(products)
+    points = []
+    for product in products:
+        points.extend(price_points_from_history(product, product.price_history))
+    with transaction.atomic():
+        PricePoint.objects.filter(product__in=products).delete()
+        PricePoint.objects.bulk_create(points, batch_size=PRICE_POINT_BATCH_SIZE, ignore_conflicts=True)
+    return len(points)
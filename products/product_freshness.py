@@ -0,0 +1,113 @@
+"""
+Stale-while-revalidate serving of stored products.
+
+product_detail_view renders the stored row right away. When the row is older
+than PRODUCT_FRESHNESS_TTL, schedule_refresh() queues a background job (the
+same incremental Keepa refresh as refresh_product_view) and the page polls
+product_freshness_view until the new data is stored, then reloads.
+
+The job is queued with the key 'refresh:<ASIN>', so a product viewed by many
+users at once is refreshed once, and the poll endpoint can tell the page that a
+refresh is still in progress while that job is unfinished.
+"""
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+from .jobs import enqueue_job, is_abandoned
+from .keepa_service import KeepaService
+from .models import Job, Product
+from .product_upsert import upsert_product
+
+logger = logging.getLogger(__name__)
+
+# Job kind of the background refresh (handler in job_handlers.py)
+REFRESH_JOB = 'refresh_product'
+
+
+def product_freshness_ttl() -> int:
+    """Seconds a stored product is served without scheduling a refresh"""
+    return getattr(settings, 'PRODUCT_FRESHNESS_TTL', 6 * 3600)
+
+
+def refresh_key(asin: str) -> str:
+    return f'refresh:{asin}'
+
+
+def synced_at(product: Product) -> datetime:
+    """Time the product's Keepa data was last fetched"""
+    return product.history_synced_at or product.last_updated
+
+
+def is_stale(product: Product, now: Optional[datetime] = None) -> bool:
+    """Whether the stored data is older than PRODUCT_FRESHNESS_TTL"""
+    now = now or timezone.now()
+    return (now - synced_at(product)).total_seconds() > product_freshness_ttl()
+
+
+def is_refreshing(asin: str) -> bool:
+    """Whether a background refresh of the product is in progress"""
+    job = Job.objects.filter(key=refresh_key(asin), status__in=Job.UNFINISHED_STATUSES).first()
+    return job is not None and not is_abandoned(job)
+
+
+def product_freshness(product: Product, refreshing: Optional[bool] = None) -> Dict[str, Any]:
+    """
+    Freshness of a stored product, for the detail page and the poll endpoint
+
+    Args:
+        product: Stored product
+        refreshing: Known refresh state (looked up otherwise)
+
+    Returns:
+        Dict with 'synced_at' (ISO), 'age_seconds', 'stale' and 'refreshing'
+    """
+    now = timezone.now()
+    fetched_at = synced_at(product)
+    return {
+        'synced_at': fetched_at.isoformat(),
+        'age_seconds': int((now - fetched_at).total_seconds()),
+        'stale': is_stale(product, now),
+        'refreshing': is_refreshing(product.asin) if refreshing is None else refreshing,
+    }
+
+
+def schedule_refresh(product: Product) -> bool:
+    """
+    Queue a background refresh of a stale product unless one is already pending
+
+    Args:
+        product: Stored product
+
+    Returns:
+        True (a refresh of the product is queued or running)
+    """
+    # A single attempt: the next visit to a still-stale page queues another one
+    enqueue_job(REFRESH_JOB, {'asin': product.asin}, key=refresh_key(product.asin), max_attempts=1)
+    return True
+
+
+def refresh_product(asin: str) -> Optional[Product]:
+    """
+    Refresh a stored product from Keepa (incremental history when possible)
+
+    Args:
+        asin: Product ASIN
+
+    Returns:
+        Refreshed product, or None if the product is gone or Keepa returned no data
+    """
+    product = Product.objects.filter(asin=asin).first()
+    if product is None:
+        return None
+    refresh = KeepaService().refresh_products([product])
+    product_data = refresh.products.get(asin)
+    if not product_data:
+        logger.warning(f"[FRESHNESS] Keepa no devolvió datos para refrescar {asin}")
+        return None
+    product, _, _ = upsert_product(product_data, product=product, history_synced_at=refresh.fetched_at)
+    return product
+
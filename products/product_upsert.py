@@ -0,0 +1,298 @@
+"""
+Create-or-update of products from parsed Keepa data.
+
+Every path that stores Keepa data (search, detail, refresh, best sellers, the
+commands) goes through upsert_product or its batch variant bulk_upsert_products.
+Both diff the parsed values against the stored row and write only the columns
+that changed (save(update_fields=...) / bulk_update), skipping the write when
+nothing did, so refreshes no longer rewrite the large history columns.
+
+A page of products is written with one SELECT, one INSERT for the new products
+and one UPDATE per distinct set of changed columns for the existing ones. Rows
+another request created between the SELECT and the INSERT are read back and
+diffed like the existing ones.
+
+History fields are compared in their encoded form, so existing rows never have
+their histories decoded just to find out nothing changed. Columns the instance
+was loaded without (summary() or only()) are read in one query before the diff,
+instead of counting as changed or being loaded one by one.
+"""
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .alert_events import schedule_alert_evaluation
+from .dashboard_stats import invalidate_dashboard_stats
+from .fields import CompactHistoryField, EncodedHistory
+from .models import Product
+from .price_points import sync_price_points
+from .series_codec import encode_history
+
+logger = logging.getLogger(__name__)
+
+# Product fields filled from KeepaService.parse_product_data, with the value used
+# when the parsed data does not include them (callables for mutable defaults)
+PRODUCT_DATA_FIELDS = {
+    'title': None,
+    'brand': None,
+    'image_url': None,
+    'color': None,
+    'binding': None,
+    'availability_amazon': 0,
+    'categories': list,
+    'category_tree': list,
+    'current_price_new': None,
+    'current_price_amazon': None,
+    'current_price_used': None,
+    'sales_rank_current': None,
+    'rating': None,
+    'review_count': None,
+    'price_history': dict,
+    'rating_history': dict,
+    'sales_rank_history': dict,
+    'reviews_data': dict,
+}
+
+
+@dataclass
+class ProductUpsertResult:
+    """Result of an upsert, with the ASINs grouped by what happened to them"""
+    products: Dict[str, Product] = field(default_factory=dict)
+    created: List[str] = field(default_factory=list)
+    updated: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+
+    @property
+    def created_count(self) -> int:
+        return len(self.created)
+
+    @property
+    def updated_count(self) -> int:
+        return len(self.updated)
+
+
+def product_values(product_data: Dict[str, Any], fields: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """
+    Model values for a parsed product, with the defaults of PRODUCT_DATA_FIELDS
+
+    Args:
+        product_data: Result of KeepaService.parse_product_data
+        fields: Fields to include (defaults to every field in PRODUCT_DATA_FIELDS)
+
+    Returns:
+        Dict of field name to value
+    """
+    values = {}
+    for name in fields or PRODUCT_DATA_FIELDS:
+        default = PRODUCT_DATA_FIELDS[name]
+        value = product_data.get(name)
+        if value is None:
+            value = default() if callable(default) else default
+        values[name] = value
+    return values
+
+
+def apply_changes(product: Product, values: Dict[str, Any]) -> List[str]:
+    """
+    Set the values that differ from the stored ones on a product (without saving)
+
+    Args:
+        product: Product instance loaded from the database (deferred fields among the
+            values are loaded in one query)
+        values: Dict of field name to new value
+
+    Returns:
+        Names of the fields that changed
+    """
+    deferred = product.get_deferred_fields()
+    missing = [name for name in values if Product._meta.get_field(name).attname in deferred]
+    if missing and not product._state.adding:
+        product.refresh_from_db(fields=missing)
+    changed = []
+    for name, value in values.items():
+        model_field = Product._meta.get_field(name)
+        if isinstance(model_field, CompactHistoryField):
+            stored = product.__dict__.get(model_field.attname)
+            if isinstance(stored, EncodedHistory):
+                # Compare and store the encoded bytes; the attribute decodes lazily if read
+                value = EncodedHistory(encode_history(model_field.kind, value))
+            if value == stored:
+                continue
+        else:
+            if value is not None:
+                value = model_field.to_python(value)
+            if value == getattr(product, model_field.attname):
+                continue
+        setattr(product, model_field.attname, value)
+        changed.append(name)
+    return changed
+
+
+def upsert_product(
+    product_data: Dict[str, Any],
+    user=None,
+    product: Optional[Product] = None,
+    history_synced_at: Optional[datetime] = None,
+    evaluate_alerts: bool = True,
+) -> Tuple[Product, bool, List[str]]:
+    """
+    Create a product or write the columns of the stored one that changed
+
+    Args:
+        product_data: Parsed product (KeepaService.parse_product_data), with 'asin' and 'title'
+        user: User stored as queried_by if the product is created
+        product: Stored product, if the caller already loaded it (looked up by ASIN otherwise)
+        history_synced_at: Start of the Keepa fetch the histories come from (refresh paths)
+        evaluate_alerts: Fire the product's satisfied alerts after commit when a price
+            changed (check_price_alerts evaluates the product's alerts itself and disables it)
+
+    Returns:
+        Tuple (product, created, names of the fields written)
+    """
+    asin = product_data['asin'].strip().upper()
+    values = product_values(product_data)
+    if history_synced_at is not None:
+        values['history_synced_at'] = history_synced_at
+
+    if product is None:
+        product = Product.objects.filter(asin=asin).first()
+    if product is None:
+        try:
+            with transaction.atomic():
+                product = Product.objects.create(asin=asin, queried_by=user, **values)
+                sync_price_points([product])
+                invalidate_dashboard_stats([product.queried_by_id])
+            return product, True, list(values)
+        except IntegrityError:
+            # Created by a concurrent request since the lookup: update it instead
+            product = Product.objects.get(asin=asin)
+
+    changed = apply_changes(product, values)
+    if changed:
+        with transaction.atomic():
+            product.save(update_fields=changed + ['last_updated'])
+            if 'price_history' in changed:
+                sync_price_points([product])
+            if evaluate_alerts:
+                schedule_alert_evaluation(product, changed)
+    return product, False, changed
+
+
+def _stage_changes(
+    result: ProductUpsertResult,
+    changes_by_fields: Dict[tuple, List[Product]],
+    product: Product,
+    product_data: Dict[str, Any],
+    compare_fields: List[str],
+    update_fields: Optional[List[str]],
+    now: datetime,
+) -> None:
+    """Diff a stored product and group it by its changed columns for bulk_update"""
+    values = product_values(product_data, compare_fields)
+    if update_fields:
+        values = {name: value for name, value in values.items() if product_data.get(name) is not None}
+    changed = apply_changes(product, values)
+    result.products[product.asin] = product
+    if not changed:
+        result.unchanged.append(product.asin)
+        return
+    product.last_updated = now
+    changes_by_fields.setdefault(tuple(sorted(changed)), []).append(product)
+    result.updated.append(product.asin)
+
+
+def _create_products(products: List[Product]) -> Tuple[List[Product], List[str]]:
+    """
+    Insert new products, setting aside the ones a concurrent request created first
+
+    Returns:
+        Tuple (inserted products, ASINs that already existed)
+    """
+    taken: List[str] = []
+    while products:
+        try:
+            with transaction.atomic():
+                Product.objects.bulk_create(products)
+            break
+        except IntegrityError:
+            existing = set(Product.objects.filter(asin__in=[product.asin for product in products]).values_list('asin', flat=True))
+            if not existing:
+                raise
+            taken.extend(product.asin for product in products if product.asin in existing)
+            products = [product for product in products if product.asin not in existing]
+    return products, taken
+
+
+def bulk_upsert_products(
+    products_data: Iterable[Dict[str, Any]],
+    user,
+    update_fields: Optional[List[str]] = None,
+    evaluate_alerts: bool = True,
+) -> ProductUpsertResult:
+    """
+    Create the new products and update the changed columns of the existing ones
+
+    Args:
+        products_data: Parsed products (KeepaService.parse_product_data), with 'asin' and 'title'
+        user: User stored as queried_by for the new products
+        update_fields: Fields that may be updated on existing products. When given, the
+            data is treated as a partial listing and None values keep the stored value
+            (best-seller pages have no history or current prices, for example)
+        evaluate_alerts: Fire the satisfied alerts of products whose prices changed
+
+    Returns:
+        ProductUpsertResult
+    """
+    result = ProductUpsertResult()
+    data_by_asin = {}
+    for product_data in products_data:
+        asin = (product_data.get('asin') or '').strip().upper()
+        if asin:
+            data_by_asin[asin] = product_data
+    if not data_by_asin:
+        return result
+
+    compare_fields = update_fields or list(PRODUCT_DATA_FIELDS)
+    existing = Product.objects.only('asin', *compare_fields).in_bulk(list(data_by_asin))
+
+    to_create = []
+    changes_by_fields: Dict[tuple, List[Product]] = {}
+    now = timezone.now()
+    for asin, product_data in data_by_asin.items():
+        product = existing.get(asin)
+        if product is None:
+            to_create.append(Product(asin=asin, queried_by=user, **product_values(product_data)))
+        else:
+            _stage_changes(result, changes_by_fields, product, product_data, compare_fields, update_fields, now)
+
+    with transaction.atomic():
+        if to_create:
+            created, taken = _create_products(to_create)
+            if created:
+                sync_price_points(created)
+                invalidate_dashboard_stats([getattr(user, 'pk', None)])
+                for product in created:
+                    result.products[product.asin] = product
+                    result.created.append(product.asin)
+            if taken:
+                # Created by a concurrent request since the SELECT: diff them like the existing ones
+                raced = Product.objects.only('asin', *compare_fields).in_bulk(taken)
+                for asin, product in raced.items():
+                    _stage_changes(result, changes_by_fields, product, data_by_asin[asin], compare_fields, update_fields, now)
+        for changed, products in changes_by_fields.items():
+            Product.objects.bulk_update(products, list(changed) + ['last_updated'])
+            if 'price_history' in changed:
+                sync_price_points(products)
+            if evaluate_alerts:
+                for product in products:
+                    schedule_alert_evaluation(product, changed)
+
+    logger.info(
+        f"[PRODUCT_UPSERT] {result.created_count} creados, {result.updated_count} actualizados, "
+        f"{len(result.unchanged)} sin cambios"
+    )
+    return result
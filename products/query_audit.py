@@ -0,0 +1,236 @@
+"""
+Query-plan audit of the ORM queries behind the views and management commands.
+
+AUDITED_QUERIES lists the filters each hot path runs, built the same way the
+code builds them. audit_queries() runs the database's EXPLAIN on every one
+and reports the tables it reads in full, so a change that drops an index or a
+new filter that has none shows up before it reaches production (see the
+audit_query_plans command).
+
+Queries that read a whole table by design (fan-out over every user, a full
+resync, substring search on titles) are marked full_scan_expected and reported
+without being flagged.
+
+Planners pick full scans on tiny tables even when an index fits, so the audit is
+meaningful on a database with realistic data (e.g. a staging copy of the MySQL
+database). On SQLite, Django writes boolean filters as bare columns
+("is_active", "NOT triggered"), which SQLite cannot match against an index, so
+queries led by boolean columns (due_alerts) show up as scans there only.
+"""
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Q, QuerySet
+from django.utils import timezone
+
+from .alert_leases import due_alerts
+from .models import (
+    BestSellerSearch,
+    DashboardSnapshot,
+    Job,
+    Notification,
+    OutboundEmail,
+    PriceAlert,
+    Product,
+    UserCounters,
+)
+
+# SQLite: "SCAN products_product" (older versions: "SCAN TABLE products_product")
+SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(.*)$')
+POSTGRES_SCAN = re.compile(r'Seq Scan on (\w+)')
+
+
+@dataclass
+class AuditedQuery:
+    """An ORM query run by a view or command"""
+    name: str
+    source: str
+    build: Callable[[int, datetime], QuerySet]
+    full_scan_expected: bool = False
+
+
+@dataclass
+class PlanReport:
+    """EXPLAIN output of an audited query"""
+    query: AuditedQuery
+    plan: List[str]
+    full_scans: List[str]
+
+    @property
+    def flagged(self) -> bool:
+        return bool(self.full_scans) and not self.query.full_scan_expected
+
+
+AUDITED_QUERIES = [
+    # Views
+    AuditedQuery(
+        'product_list', 'products.views.product_list_view',
+        lambda user_id, now: Product.summaries.filter(queried_by_id=user_id).order_by('-last_updated', '-asin')[:11],
+    ),
+    AuditedQuery(
+        'product_list_next_page', 'products.views.product_list_view',
+        lambda user_id, now: Product.summaries.filter(queried_by_id=user_id).filter(
+            Q(last_updated__lt=now) | Q(last_updated=now, asin__lt='B000000000')
+        ).order_by('-last_updated', '-asin')[:11],
+    ),
+    AuditedQuery(
+        'product_search_by_title', 'products.views.find_product_by_name',
+        lambda user_id, now: Product.summaries.filter(title__icontains='auriculares').order_by('-last_updated')[:10],
+        full_scan_expected=True,
+    ),
+    AuditedQuery(
+        'alerts_list', 'products.views.list_alerts_view',
+        lambda user_id, now: PriceAlert.objects.filter(user_id=user_id).with_product_summary().order_by('-created_at'),
+    ),
+    AuditedQuery(
+        'alerts_list_active', 'products.views.list_alerts_view',
+        lambda user_id, now: PriceAlert.objects.filter(user_id=user_id, is_active=True),
+    ),
+    AuditedQuery(
+        'notifications_list', 'products.views.notifications_view',
+        lambda user_id, now: Notification.objects.filter(user_id=user_id).select_related('alert__product')
+        .order_by('-created_at', '-id')[:16],
+    ),
+    AuditedQuery(
+        'notifications_unread', 'products.notifications.mark_all_notifications_as_read',
+        lambda user_id, now: Notification.objects.filter(user_id=user_id, is_read=False),
+    ),
+    AuditedQuery(
+        'dashboard_snapshot', 'products.dashboard_stats.get_dashboard_stats',
+        lambda user_id, now: DashboardSnapshot.objects.filter(user_id=user_id),
+    ),
+    AuditedQuery(
+        'dashboard_top_rated', 'products.dashboard_stats.compute_dashboard_stats',
+        lambda user_id, now: Product.objects.filter(queried_by_id=user_id, rating__isnull=False)
+        .order_by('-rating', '-review_count').values_list('asin', flat=True)[:3],
+    ),
+    AuditedQuery(
+        'dashboard_recent_alerts', 'accounts.views.dashboard_view',
+        lambda user_id, now: PriceAlert.objects.filter(user_id=user_id, is_active=True)
+        .with_product_summary().order_by('-created_at')[:5],
+    ),
+    AuditedQuery(
+        'dashboard_recent_notifications', 'accounts.views.dashboard_view',
+        lambda user_id, now: Notification.objects.filter(user_id=user_id).order_by('-created_at')[:5],
+    ),
+    AuditedQuery(
+        'user_counters_active_alerts', 'products.user_counters.get_user_counters',
+        lambda user_id, now: PriceAlert.objects.filter(user_id__in=[user_id], is_active=True),
+    ),
+    AuditedQuery(
+        'best_seller_history', 'products.views.best_sellers_view',
+        lambda user_id, now: BestSellerSearch.objects.filter(user_id=user_id).order_by('-created_at')[:10],
+    ),
+    # Commands and background jobs
+    AuditedQuery(
+        'due_alerts', 'products.alert_leases.claim_alert_batch',
+        lambda user_id, now: due_alerts(now).order_by('next_check_at').values_list('product_id', flat=True)[:100],
+    ),
+    AuditedQuery(
+        'leased_alerts', 'products.alert_leases.claim_alert_batch',
+        lambda user_id, now: PriceAlert.objects.filter(
+            product_id__in=['B000000000'], lease_owner='worker', lease_expires_at=now,
+        ).values_list('id', flat=True),
+    ),
+    AuditedQuery(
+        'alerts_for_price_change', 'products.alert_events.evaluate_product_alerts',
+        lambda user_id, now: PriceAlert.objects.filter(
+            product_id='B000000000', price_type='new', is_active=True, triggered=False, target_price__gte=1000,
+        ).select_related('user'),
+    ),
+    AuditedQuery(
+        'queued_emails', 'products.email_queue.claim_batch',
+        lambda user_id, now: OutboundEmail.objects.filter(
+            status__in=[OutboundEmail.STATUS_PENDING, OutboundEmail.STATUS_SENDING], next_attempt_at__lte=now,
+        ).order_by('next_attempt_at').values_list('id', flat=True)[:100],
+    ),
+    AuditedQuery(
+        'due_jobs', 'products.jobs.claim_jobs',
+        lambda user_id, now: Job.objects.filter(status__in=Job.UNFINISHED_STATUSES, run_at__lte=now)
+        .order_by('run_at').values_list('id', flat=True)[:1],
+    ),
+    AuditedQuery(
+        'unfinished_job_by_key', 'products.jobs.enqueue_job',
+        lambda user_id, now: Job.objects.filter(key='refresh:B000000000', status__in=Job.UNFINISHED_STATUSES),
+    ),
+    AuditedQuery(
+        'maintenance_recipients', 'products.notifications.send_system_maintenance_notification',
+        lambda user_id, now: User.objects.filter(is_active=True).order_by('id').values_list('id', flat=True),
+        full_scan_expected=True,
+    ),
+    AuditedQuery(
+        'reconcile_user_counters', 'products.user_counters.reconcile_user_counters',
+        lambda user_id, now: UserCounters.objects.order_by('user_id').values_list('user_id', flat=True),
+        full_scan_expected=True,
+    ),
+    AuditedQuery(
+        'sync_price_points', 'products.management.commands.sync_price_points',
+        lambda user_id, now: Product.objects.only('asin', 'price_history').order_by('asin'),
+        full_scan_expected=True,
+    ),
+]
+
+
+def explain_queryset(queryset: QuerySet) -> Tuple[List[str], List[str]]:
+    """
+    Run EXPLAIN on a queryset
+
+    Args:
+        queryset: Query to explain (it is not executed)
+
+    Returns:
+        Tuple (plan lines, tables read with a full scan)
+    """
+    sql, params = queryset.query.sql_with_params()
+    vendor = connection.vendor
+    plan, full_scans = [], []
+    with connection.cursor() as cursor:
+        if vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            for row in cursor.fetchall():
+                detail = row[-1]
+                plan.append(detail)
+                match = SQLITE_SCAN.match(detail)
+                if match and 'USING' not in match.group(2):
+                    full_scans.append(match.group(1))
+        elif vendor == 'mysql':
+            cursor.execute(f'EXPLAIN {sql}', params)
+            columns = [column[0] for column in cursor.description]
+            for row in cursor.fetchall():
+                values = dict(zip(columns, row))
+                plan.append(', '.join(f'{key}={value}' for key, value in values.items()))
+                if values.get('type') == 'ALL':
+                    full_scans.append(values['table'])
+        elif vendor == 'postgresql':
+            cursor.execute(f'EXPLAIN {sql}', params)
+            for (line,) in cursor.fetchall():
+                plan.append(line)
+                full_scans.extend(POSTGRES_SCAN.findall(line))
+        else:
+            raise ValueError(f'EXPLAIN no soportado para la base de datos {vendor}')
+    return plan, full_scans
+
+
+def audit_queries(user_id: int, names: Optional[List[str]] = None) -> List[PlanReport]:
+    """
+    Explain the audited queries
+
+    Args:
+        user_id: User whose id fills the per-user filters
+        names: Only audit these queries (all by default)
+
+    Returns:
+        One PlanReport per query, in AUDITED_QUERIES order
+    """
+    now = timezone.now()
+    reports = []
+    for query in AUDITED_QUERIES:
+        if names and query.name not in names:
+            continue
+        plan, full_scans = explain_queryset(query.build(user_id, now))
+        reports.append(PlanReport(query, plan, full_scans))
+    return reports
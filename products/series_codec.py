@@ -0,0 +1,223 @@
+"""
+Compact binary codec for the product history blobs.
+
+The JSON histories repeat every point several times (cents plus two timestamp
+strings for prices, a list of dicts plus parallel arrays for rating and sales
+rank). The codec keeps one timestamp per point, as delta-encoded int32 minutes
+since the Keepa epoch, plus one int32 value, and compresses the result with zlib.
+Decoding rebuilds the exact dict the extractors produce.
+
+Every encoded value starts with a format byte:
+    FORMAT_JSON    zlib-compressed JSON, for histories the series layout cannot
+                   reproduce exactly (legacy or hand-edited data, empty dicts)
+    FORMAT_SERIES  header + int32 arrays, zlib-compressed
+
+encode_history only uses FORMAT_SERIES after checking that decoding gives back
+an identical dict, so the round trip is always lossless.
+"""
+import json
+import struct
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .keepa_history import KEEPA_EPOCH
+
+FORMAT_JSON = 0
+FORMAT_SERIES = 1
+
+HISTORY_KINDS = ('price', 'rating', 'sales_rank')
+
+_INT32 = np.dtype('<i4')
+_INT32_MIN = np.iinfo(np.int32).min
+_INT32_MAX = np.iinfo(np.int32).max
+
+# Keys of each history layout, in the order the extractors produce them
+_PRICE_KEYS = ('prices', 'times', 'formatted_times')
+_DATED_KEYS = {
+    'rating': ('ratings', 'formatted_times', 'values'),
+    'sales_rank': ('sales_ranks', 'formatted_times', 'values'),
+}
+_POINT_VALUE_KEY = {'rating': 'rating', 'sales_rank': 'salesRank'}
+
+
+def _fits_int32(values: np.ndarray) -> bool:
+    return not len(values) or (values.min() >= _INT32_MIN and values.max() <= _INT32_MAX)
+
+
+def _parse_minutes(times: List[str]) -> Optional[np.ndarray]:
+    """Parse 'YYYY-MM-DD[T ]HH:MM:SS' strings into Keepa minutes (None if not possible)"""
+    if not all(isinstance(t, str) for t in times):
+        return None
+    try:
+        seconds = np.array(times, dtype='datetime64[s]')
+    except ValueError:
+        return None
+    if np.isnat(seconds).any():
+        return None
+    minutes = seconds.astype('datetime64[m]')
+    if np.any(minutes.astype('datetime64[s]') != seconds):
+        return None
+    return (minutes - KEEPA_EPOCH).astype(np.int64)
+
+
+def _format_minutes(minutes: np.ndarray, separator: str) -> List[str]:
+    """Format Keepa minutes as 'YYYY-MM-DD<separator>HH:MM:SS'"""
+    formatted = np.datetime_as_string(KEEPA_EPOCH + minutes.astype('timedelta64[m]'), unit='s').tolist()
+    if separator != 'T':
+        formatted = [value.replace('T', separator) for value in formatted]
+    return formatted
+
+
+# ----- per-kind layouts: dict <-> list of (name, minutes, int values) -----
+
+def _split_price(history: Dict[str, Any]) -> Optional[List[Tuple[str, np.ndarray, np.ndarray]]]:
+    series = []
+    for name, entry in history.items():
+        if not isinstance(entry, dict) or set(entry) != set(_PRICE_KEYS):
+            return None
+        prices = entry['prices']
+        if not all(type(p) is int for p in prices):
+            return None
+        minutes = _parse_minutes(entry['times'])
+        if minutes is None or len(minutes) != len(prices):
+            return None
+        series.append((name, minutes, np.array(prices, dtype=np.int64)))
+    return series
+
+
+def _join_price(series: List[Tuple[str, np.ndarray, np.ndarray]]) -> Dict[str, Any]:
+    history = {}
+    for name, minutes, values in series:
+        times = _format_minutes(minutes, 'T')
+        history[name] = {
+            'prices': values.tolist(),
+            'times': times,
+            'formatted_times': [t[:16].replace('T', ' ') for t in times],
+        }
+    return history
+
+
+def _rating_values(raw: np.ndarray) -> List[Any]:
+    """Rating values as the extractor computes them from Keepa's 0-50 rating"""
+    values = (((raw.astype(np.float64) / 100) * 10) / 10).tolist()
+    for index in np.flatnonzero(raw <= 0):
+        values[index] = 0
+    return values
+
+
+def _split_dated(kind: str, history: Dict[str, Any]) -> Optional[List[Tuple[str, np.ndarray, np.ndarray]]]:
+    if set(history) != set(_DATED_KEYS[kind]):
+        return None
+    values = history['values']
+    minutes = _parse_minutes(history['formatted_times'])
+    if minutes is None or len(minutes) != len(values):
+        return None
+
+    if kind == 'rating':
+        if not all((type(v) is float and v > 0) or (type(v) is int and v == 0) for v in values):
+            return None
+        raw = np.rint(np.array(values, dtype=np.float64) * 100).astype(np.int64)
+    else:
+        if not all(type(v) is int for v in values):
+            return None
+        raw = np.array(values, dtype=np.int64)
+    return [('', minutes, raw)]
+
+
+def _join_dated(kind: str, series: List[Tuple[str, np.ndarray, np.ndarray]]) -> Dict[str, Any]:
+    _, minutes, raw = series[0]
+    dates = _format_minutes(minutes, ' ')
+    values = _rating_values(raw) if kind == 'rating' else raw.tolist()
+    points_key, _, _ = _DATED_KEYS[kind]
+    value_key = _POINT_VALUE_KEY[kind]
+    return {
+        points_key: [{"date": date, value_key: value} for date, value in zip(dates, values)],
+        'formatted_times': dates,
+        'values': values,
+    }
+
+
+# ----- binary framing -----
+
+def _pack(series: List[Tuple[str, np.ndarray, np.ndarray]]) -> Optional[bytes]:
+    header = []
+    chunks = []
+    for name, minutes, values in series:
+        deltas = np.diff(minutes, prepend=0)
+        if not _fits_int32(deltas) or not _fits_int32(values):
+            return None
+        header.append([name, len(values)])
+        chunks.append(deltas.astype(_INT32).tobytes())
+        chunks.append(values.astype(_INT32).tobytes())
+    header_bytes = json.dumps(header, separators=(',', ':')).encode()
+    payload = struct.pack('<I', len(header_bytes)) + header_bytes + b''.join(chunks)
+    return bytes([FORMAT_SERIES]) + zlib.compress(payload, 6)
+
+
+def _unpack(data: bytes) -> List[Tuple[str, np.ndarray, np.ndarray]]:
+    payload = zlib.decompress(data[1:])
+    (header_length,) = struct.unpack_from('<I', payload)
+    header = json.loads(payload[4:4 + header_length])
+    offset = 4 + header_length
+    series = []
+    for name, count in header:
+        deltas = np.frombuffer(payload, dtype=_INT32, count=count, offset=offset)
+        offset += count * _INT32.itemsize
+        values = np.frombuffer(payload, dtype=_INT32, count=count, offset=offset).astype(np.int64)
+        offset += count * _INT32.itemsize
+        series.append((name, np.cumsum(deltas, dtype=np.int64), values))
+    return series
+
+
+def _decode_series(kind: str, data: bytes) -> Dict[str, Any]:
+    series = _unpack(data)
+    if kind == 'price':
+        return _join_price(series)
+    return _join_dated(kind, series)
+
+
+def encode_history(kind: str, history: Optional[Dict[str, Any]]) -> bytes:
+    """
+    Encode a history dict for storage
+
+    Args:
+        kind: 'price', 'rating' or 'sales_rank'
+        history: History dict as produced by KeepaService (None is stored as {})
+
+    Returns:
+        Encoded bytes (FORMAT_SERIES when lossless, FORMAT_JSON otherwise)
+    """
+    history = history or {}
+    if history:
+        series = _split_price(history) if kind == 'price' else _split_dated(kind, history)
+        packed = _pack(series) if series is not None else None
+        if packed is not None and _decode_series(kind, packed) == history:
+            return packed
+
+    return bytes([FORMAT_JSON]) + zlib.compress(json.dumps(history, separators=(',', ':')).encode(), 6)
+
+
+def decode_history(kind: str, data: Optional[bytes]) -> Dict[str, Any]:
+    """
+    Decode a stored history
+
+    Args:
+        kind: 'price', 'rating' or 'sales_rank'
+        data: Bytes produced by encode_history (None or empty gives {})
+
+    Returns:
+        History dict
+
+    Raises:
+        ValueError: If the data uses an unknown format
+    """
+    if not data:
+        return {}
+    data = bytes(data)
+    if data[0] == FORMAT_SERIES:
+        return _decode_series(kind, data)
+    if data[0] == FORMAT_JSON:
+        return json.loads(zlib.decompress(data[1:]))
+    raise ValueError(f"Formato de historial desconocido: {data[0]}")
@@ -0,0 +1,185 @@
+"""
+Single-flight coalescing of concurrent fetches for the same key.
+
+When several requests need the same missing product at once, each one used to
+run its own Keepa query (spending tokens) and then race the others to insert
+the row. single_flight() lets one caller per key do the work:
+
+- Inside a process, callers of the same key share one in-flight call and wait
+  for its result (or exception).
+- Across processes, the caller that runs the work first takes a FetchLease row
+  for the key. Callers in other processes poll load() until the leader stores
+  its result, or until the lease is released or expires without one. In that
+  case they take the lease and do the work themselves.
+- When fetch() returns None (e.g. an ASIN Keepa does not know), the leader keeps
+  the lease for EMPTY_RESULT_SECONDS marked as empty instead of releasing it.
+  Waiting and newly arriving callers return None at once, so a burst of requests
+  for an invalid key still costs one fetch.
+
+The lease lives in the database, like the alert and email leases, so it holds
+across web workers and hosts without a shared cache.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+from typing import Callable, Dict, Optional, TypeVar
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import FetchLease
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# Longest a fetch may hold its lease; a leader that dies only blocks its key this long
+LEASE_SECONDS = 60
+
+# Longest a caller waits for another process before fetching by itself
+WAIT_SECONDS = 30
+
+# Seconds between load() polls while another process holds the lease
+POLL_INTERVAL = 0.5
+
+# Seconds an empty result (fetch() returned None) is reused before fetching again
+EMPTY_RESULT_SECONDS = 30
+
+
+class _Flight:
+    """An in-process call in progress"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+_flights: Dict[str, _Flight] = {}
+_flights_lock = threading.Lock()
+
+
+def lease_owner() -> str:
+    """Owner id of the calling thread (host:pid:thread)"""
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def acquire_lease(key: str, owner: str, seconds: int = LEASE_SECONDS) -> bool:
+    """
+    Take the lease of a key if it is free or expired
+
+    Args:
+        key: Fetch key
+        owner: Caller id (lease_owner())
+        seconds: Lease duration
+
+    Returns:
+        True if the caller now holds the lease
+    """
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=seconds)
+    if FetchLease.objects.filter(key=key, expires_at__lte=now).update(owner=owner, expires_at=expires_at, empty=False):
+        return True
+    try:
+        with transaction.atomic():
+            FetchLease.objects.create(key=key, owner=owner, expires_at=expires_at)
+        return True
+    except IntegrityError:
+        return False
+
+
+def release_lease(key: str, owner: str) -> None:
+    """Release a lease held by the caller"""
+    FetchLease.objects.filter(key=key, owner=owner).delete()
+
+
+def record_empty_result(key: str, owner: str, seconds: int = EMPTY_RESULT_SECONDS) -> None:
+    """Keep a lease held by the caller as the empty result of its key for a few seconds"""
+    FetchLease.objects.filter(key=key, owner=owner).update(
+        empty=True, expires_at=timezone.now() + timedelta(seconds=seconds),
+    )
+
+
+def has_empty_result(key: str) -> bool:
+    """Whether a recent fetch of the key returned nothing"""
+    return FetchLease.objects.filter(key=key, empty=True, expires_at__gt=timezone.now()).exists()
+
+
+def single_flight(
+    key: str,
+    fetch: Callable[[], T],
+    load: Callable[[], Optional[T]],
+    wait_seconds: float = WAIT_SECONDS,
+) -> T:
+    """
+    Run fetch() once for all concurrent callers of a key
+
+    Args:
+        key: Fetch key, e.g. 'product:B07X6C9RMF'
+        fetch: Does the work and stores its result (e.g. query Keepa and upsert the product)
+        load: Returns the stored result, or None while it is not there yet
+        wait_seconds: Longest wait for another process before fetching anyway
+
+    Returns:
+        Result of fetch(), or of load() when another process did the work (None
+        while a recent fetch of the key returned None)
+    """
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+
+    if not leader:
+        if not flight.done.wait(wait_seconds):
+            logger.warning(f"[SINGLE_FLIGHT] Tiempo de espera agotado para {key}; consultando sin coalescer")
+            return fetch()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    try:
+        flight.result = _fetch_across_processes(key, fetch, load, wait_seconds)
+        return flight.result
+    except BaseException as e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            _flights.pop(key, None)
+        flight.done.set()
+
+
+def _fetch_across_processes(key: str, fetch: Callable[[], T], load: Callable[[], Optional[T]], wait_seconds: float) -> T:
+    owner = lease_owner()
+    deadline = time.monotonic() + wait_seconds
+    while True:
+        if acquire_lease(key, owner):
+            try:
+                # The previous holder may have stored the result just before releasing
+                result = load()
+                if result is None:
+                    result = fetch()
+            except BaseException:
+                release_lease(key, owner)
+                raise
+            if result is None:
+                record_empty_result(key, owner)
+            else:
+                release_lease(key, owner)
+            return result
+
+        result = load()
+        if result is not None:
+            logger.info(f"[SINGLE_FLIGHT] {key} obtenido por otro proceso")
+            return result
+        if has_empty_result(key):
+            logger.info(f"[SINGLE_FLIGHT] {key} sin resultado en otro proceso; no se repite la consulta")
+            return None
+        if time.monotonic() >= deadline:
+            logger.warning(f"[SINGLE_FLIGHT] {key} sigue reservado tras {wait_seconds}s; consultando sin coalescer")
+            return fetch()
+        time.sleep(POLL_INTERVAL)
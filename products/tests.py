@@ -1,3 +1,1319 @@
-from django.test import TestCase
+import json
+import smtplib
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import QuerySet
+from django.core import mail
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from keepa.interface import parse_csv
+
+from .alert_leases import claim_alert_batch, release_alert_batch
+from .email_queue import MAX_ATTEMPTS, EmailConnectionError, claim_batch, drain_queue, queue_email, send_batch
+from .dashboard_stats import get_dashboard_stats
+from .history_merge import HISTORY_FIELDS, history_window_days, merge_product_data
+from .jobs import JOB_HANDLERS, PermanentJobError, claim_jobs, enqueue_job, run_job
+from .keepa_budget import PRIORITY_BATCH, KeepaTokenBudget, TokenBudgetExceeded
+from .keepa_cache import KeepaResponseCache, report_cache_stats
+from .keepa_client import PooledKeepa, get_keepa_client, reset_keepa_clients
+from .keyset import KeysetPaginator
+from .keepa_service import KEEPA_MAX_BATCH_SIZE, KeepaService
+from .models import FetchLease, Job, KeepaTokenBucket, Notification, OutboundEmail, PriceAlert, PricePoint, Product, UserCounters
+from .price_points import sync_price_points
+from .notifications import send_email_notification, send_system_maintenance_notification
+from .product_upsert import bulk_upsert_products, upsert_product
+from .query_audit import audit_queries, explain_queryset
+from .series_codec import FORMAT_JSON, FORMAT_SERIES, decode_history, encode_history
+from .single_flight import single_flight
+from .user_counters import get_user_counters, reconcile_user_counters
+from .views import BEST_SELLER_UPDATE_FIELDS
+
+
+def _keepa_csv(rng: np.random.Generator, points: int, low: int, high: int, missing_ratio: float = 0.2):
+    """Build one Keepa csv history ([time, value, time, value, ...]) with some -1 gaps"""
+    times = np.cumsum(rng.integers(1, 60 * 24 * 3, size=points)) + 4_000_000
+    values = rng.integers(low, high, size=points)
+    values[rng.random(points) < missing_ratio] = -1
+    return np.column_stack([times, values]).ravel().tolist()
+
+
+class KeepaTokenBudgetTests(TestCase):
+    """Reservations are accounted in the shared bucket and synced only to this call's status"""
+
+    def setUp(self):
+        self.interactive = KeepaTokenBudget(api_key='clave-prueba')
+        self.batch = KeepaTokenBudget(priority=PRIORITY_BATCH, api_key='clave-prueba')
+        # 20 tokens/min: capacidad 1200, reserva interactiva del 20% (240)
+        self.interactive.reserve(0)
+        self.set_tokens(1000)
+
+    def set_tokens(self, tokens):
+        KeepaTokenBucket.objects.filter(name=self.interactive.bucket_name).update(tokens=tokens, updated_at=timezone.now())
+
+    def bucket(self):
+        return KeepaTokenBucket.objects.get(name=self.interactive.bucket_name)
+
+    def test_commit_syncs_to_this_call_minus_other_reservations(self):
+        mine = self.interactive.reserve(10)
+        others = self.batch.reserve(5)
+        bucket = self.bucket()
+        self.assertAlmostEqual(bucket.tokens, 985, delta=0.5)
+        self.assertEqual(bucket.reserved, 5 + 10)
+
+        api = SimpleNamespace(pop_request_status=lambda: {'tokens_consumed': 8, 'tokens_left': 700, 'refill_rate': 20})
+        self.interactive.commit(mine, api)
+        bucket = self.bucket()
+        # Keepa aún no ha descontado los 5 tokens reservados por la otra llamada
+        self.assertAlmostEqual(bucket.tokens, 695, delta=0.5)
+        self.assertEqual(bucket.reserved, 5)
+
+        # Sin petición propia (caché, error antes de enviar) el estado compartido del cliente no cuenta
+        stale = SimpleNamespace(pop_request_status=lambda: None, status={'tokensLeft': 0})
+        self.batch.commit(others, stale)
+        bucket = self.bucket()
+        self.assertAlmostEqual(bucket.tokens, 700, delta=0.5)
+        self.assertEqual(bucket.reserved, 0)
+
+    def test_batch_callers_leave_the_interactive_reserve(self):
+        self.set_tokens(250)
+        with mock.patch('products.keepa_budget.time.sleep') as sleep:
+            # Dentro de una transacción no se espera con el bucket bloqueado
+            with self.assertRaises(TokenBudgetExceeded):
+                self.batch.reserve(20)
+            sleep.assert_not_called()
+        self.assertIsNotNone(self.interactive.reserve(20))
+        self.assertAlmostEqual(self.bucket().tokens, 230, delta=0.5)
+
+    def test_abandoned_reservations_expire(self):
+        self.interactive.reserve(10)
+        KeepaTokenBucket.objects.filter(name=self.interactive.bucket_name).update(
+            reserved_at=timezone.now() - timedelta(hours=1)
+        )
+        api = SimpleNamespace(pop_request_status=lambda: {'tokens_consumed': 1, 'tokens_left': 500, 'refill_rate': None})
+        self.interactive.commit(self.interactive.reserve(1), api)
+        self.assertEqual(self.bucket().reserved, 0)
+        self.assertAlmostEqual(self.bucket().tokens, 500, delta=0.5)
+
+
+class KeepaTokenBudgetWaitTests(TransactionTestCase):
+    """Outside a transaction, batch reservations wait for the refill up to their max wait"""
+
+    def setUp(self):
+        self.budget = KeepaTokenBudget(priority=PRIORITY_BATCH, api_key='clave-espera')
+        self.budget.reserve(0)
+        self.bucket = KeepaTokenBucket.objects.filter(name=self.budget.bucket_name)
+        self.bucket.update(tokens=250, updated_at=timezone.now())
+
+    def test_waits_for_refill(self):
+        refill = lambda seconds: self.bucket.update(tokens=400, updated_at=timezone.now())
+        with mock.patch('products.keepa_budget.time.sleep', side_effect=refill) as sleep:
+            reservation = self.budget.reserve(20)
+        self.assertEqual(sleep.call_count, 1)
+        # Faltaban 10 tokens sobre la reserva interactiva: 30 s a 20 tokens/min
+        self.assertAlmostEqual(sleep.call_args[0][0], 30, delta=0.5)
+        self.assertEqual(reservation.tokens, 20)
+
+    @override_settings(KEEPA_BATCH_MAX_WAIT=0)
+    def test_gives_up_after_max_wait(self):
+        with mock.patch('products.keepa_budget.time.sleep') as sleep:
+            with self.assertRaises(TokenBudgetExceeded):
+                self.budget.reserve(20)
+        sleep.assert_not_called()
+
+
+class KeepaClientTests(SimpleTestCase):
+    """One pooled client per process and API key, with per-thread token status"""
+
+    def tearDown(self):
+        reset_keepa_clients()
+
+    def test_registry_returns_one_client_per_key(self):
+        first = get_keepa_client('clave-a')
+        self.assertIs(get_keepa_client('clave-a'), first)
+        self.assertIsNot(get_keepa_client('clave-b'), first)
+        # Un worker creado con fork no reutiliza las conexiones del proceso padre
+        with mock.patch('products.keepa_client.os.getpid', return_value=-1):
+            self.assertIsNot(get_keepa_client('clave-a'), first)
+
+    def test_request_reuses_session_and_reports_status_to_the_thread(self):
+        client = PooledKeepa('clave-a')
+        responses = [
+            {'status_code': 429, 'json': {'tokensLeft': -5, 'refillIn': 1000, 'refillRate': 20, 'timestamp': 0, 'tokensConsumed': 0}},
+            {'status_code': 200, 'json': {'tokensLeft': 95, 'refillRate': 20, 'tokensConsumed': 3, 'products': []}},
+            {'status_code': 200, 'json': {'tokensLeft': 90, 'tokensConsumed': 5, 'products': []}},
+        ]
+        client._session = mock.Mock()
+        client._session.get.side_effect = [
+            SimpleNamespace(status_code=r['status_code'], json=lambda r=r: r['json']) for r in responses
+        ]
+        with mock.patch('products.keepa_client.time.sleep') as sleep:
+            self.assertEqual(client._request('product', {'asin': 'B1'})['tokensLeft'], 95)
+            client._request('product', {'asin': 'B2'})
+        sleep.assert_called_once()
+        self.assertEqual(client._session.get.call_count, 3)
+        self.assertEqual(client.pop_request_status(), {'tokens_consumed': 8, 'tokens_left': 90, 'refill_rate': 20})
+        self.assertIsNone(client.pop_request_status())
+
+        # Otro hilo no ve el estado de las peticiones de este
+        seen = []
+        client._session.get.side_effect = [SimpleNamespace(status_code=200, json=lambda: {'tokensLeft': 80})]
+        client._request('product', {'asin': 'B3'})
+        thread = threading.Thread(target=lambda: seen.append(client.pop_request_status()))
+        thread.start()
+        thread.join()
+        self.assertEqual(seen, [None])
+
+
+@override_settings(KEEPA_API_KEY='test', KEEPA_TOKEN_BUDGET_ENABLED=False, KEEPA_CACHE_ENABLED=False)
+class KeepaBatchQueryTests(SimpleTestCase):
+    """query_products packs up to 100 ASINs per request and keeps partial results"""
+
+    def test_chunks_and_partial_failures(self):
+        asins = [f'B{i:09d}' for i in range(250)]
+        failing = asins[150]
+        missing = asins[240]
+        calls = []
+
+        def query(chunk, domain, **kwargs):
+            calls.append(list(chunk))
+            if failing in chunk:
+                raise RuntimeError('REQUEST_REJECTED')
+            products = [{'asin': asin, 'title': asin} for asin in chunk if asin != missing]
+            return [SimpleNamespace(json=lambda: {'products': products})]
+
+        api = mock.Mock(query=mock.Mock(side_effect=query))
+        with mock.patch('products.keepa_service.get_keepa_client', return_value=api), \
+                mock.patch.object(KeepaService, 'parse_product_data', side_effect=lambda data: {'asin': data['asin']}), \
+                mock.patch.object(KeepaService, '_log_query_error'):
+            result = KeepaService().query_products(asins + [asins[0], 'corto'])
+
+        self.assertEqual([len(chunk) for chunk in calls], [KEEPA_MAX_BATCH_SIZE, KEEPA_MAX_BATCH_SIZE, 50])
+        self.assertEqual(len(result.products), 100 + 49)
+        self.assertEqual(result.errors[failing], 'REQUEST_REJECTED')
+        self.assertEqual(sum(1 for error in result.errors.values() if error == 'REQUEST_REJECTED'), 100)
+        self.assertEqual(result.errors[missing], 'ASIN_NOT_FOUND')
+        self.assertEqual(result.errors['CORTO'], 'INVALID_ASIN')
+        self.assertIn(asins[0], result.products)
+
+
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'default'},
+    'keepa': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'keepa-pruebas'},
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES, KEEPA_CACHE_TTLS={'product': 60, 'best_sellers': 600, 'category_lookup': 0})
+class KeepaResponseCacheTests(SimpleTestCase):
+    """Two-tier response cache: per-type TTLs, LRU eviction, shared tier and private copies"""
+
+    def test_ttl_depends_on_call_type(self):
+        cache = KeepaResponseCache(alias=None)
+        with mock.patch('products.keepa_cache.time.time', return_value=1000):
+            cache.set('product', 'MX', {'asin': 'B1'}, {'title': 'A'})
+            cache.set('best_sellers', 'MX', {'category': 1}, ['B1'])
+            cache.set('category_lookup', 'MX', {'category': 1}, {'name': 'C'})
+        with mock.patch('products.keepa_cache.time.time', return_value=1000 + 120):
+            self.assertEqual(cache.get('product', 'MX', {'asin': 'B1'}), (False, None))
+            self.assertEqual(cache.get('best_sellers', 'MX', {'category': 1}), (True, ['B1']))
+            # TTL 0: el tipo no se guarda
+            self.assertEqual(cache.get('category_lookup', 'MX', {'category': 1}), (False, None))
+        self.assertEqual(cache.stats()['product'], {'memory_hits': 0, 'persistent_hits': 0, 'misses': 1})
+
+    def test_lru_evicts_least_recently_used(self):
+        cache = KeepaResponseCache(max_entries=2, alias=None)
+        for asin in ('B1', 'B2'):
+            cache.set('product', 'MX', {'asin': asin}, {'asin': asin})
+        cache.get('product', 'MX', {'asin': 'B1'})
+        cache.set('product', 'MX', {'asin': 'B3'}, {'asin': 'B3'})
+        self.assertTrue(cache.get('product', 'MX', {'asin': 'B1'})[0])
+        self.assertFalse(cache.get('product', 'MX', {'asin': 'B2'})[0])
+        self.assertTrue(cache.get('product', 'MX', {'asin': 'B3'})[0])
+
+    def test_persistent_tier_is_shared_between_processes(self):
+        writer, reader = KeepaResponseCache(alias='keepa'), KeepaResponseCache(alias='keepa')
+        writer.set('product', 'US', {'asin': 'B1'}, None)
+        writer.set('best_sellers', 'US', {'category': 2}, ['B1', 'B2'])
+        # Las respuestas vacías también se guardan y se distinguen de un fallo
+        self.assertEqual(reader.get('product', 'US', {'asin': 'B1'}), (True, None))
+        self.assertEqual(reader.get('best_sellers', 'US', {'category': 2}), (True, ['B1', 'B2']))
+        self.assertEqual(reader.get('best_sellers', 'US', {'category': 2}), (True, ['B1', 'B2']))
+        self.assertEqual(reader.stats()['best_sellers'], {'memory_hits': 1, 'persistent_hits': 1, 'misses': 0})
+
+    def test_callers_get_private_copies(self):
+        cache = KeepaResponseCache(alias=None)
+        value = {'asin': 'B1', 'data': {'NEW': [1, 2]}}
+        cache.set('product', 'MX', {'asin': 'B1'}, value)
+        value['data']['NEW'].append(3)
+        cached = cache.get('product', 'MX', {'asin': 'B1'})[1]
+        cached['title'] = 'Modificado'
+        self.assertEqual(cache.get('product', 'MX', {'asin': 'B1'})[1], {'asin': 'B1', 'data': {'NEW': [1, 2]}})
+
+    def test_commands_report_counters(self):
+        cache = KeepaResponseCache(alias=None)
+        cache.set('product', 'MX', {'asin': 'B1'}, {'asin': 'B1'})
+        cache.get('product', 'MX', {'asin': 'B1'})
+        cache.get('product', 'MX', {'asin': 'B2'})
+        lines = []
+        with mock.patch('products.keepa_cache.get_keepa_cache', return_value=cache):
+            report_cache_stats(lines.append)
+        self.assertEqual(lines, ['Caché Keepa product: 1 aciertos en memoria, 0 en disco, 1 fallos (50% aciertos)'])
+
+
+class HistoryExtractionEquivalenceTests(SimpleTestCase):
+    """The vectorized history extractors must produce the exact JSON of the per-point loops"""
+
+    def setUp(self):
+        # The extractors do not touch the API client, so skip __init__
+        self.service = KeepaService.__new__(KeepaService)
+
+    def _csv(self, seed: int, points: int):
+        rng = np.random.default_rng(seed)
+        csv = [None] * 32
+        csv[0] = _keepa_csv(rng, points, 100, 500_000)   # AMAZON
+        csv[1] = _keepa_csv(rng, points, 100, 500_000)   # NEW
+        csv[2] = _keepa_csv(rng, points, 100, 500_000)   # USED
+        csv[3] = _keepa_csv(rng, points, 1, 2_000_000)   # SALES
+        csv[16] = _keepa_csv(rng, points, 0, 51)          # RATING
+        # Prices whose float value truncates when converted back to cents
+        csv[1][1], csv[1][3], csv[1][5] = 2999, 1999, 58
+        csv[17] = _keepa_csv(rng, points, 0, 5_000, missing_ratio=0)  # COUNT_REVIEWS
+        return csv
+
+    def _parsed_data(self, seed: int, points: int, to_datetime: bool = False):
+        return parse_csv(self._csv(seed, points), to_datetime=to_datetime)
+
+    def assertSameJson(self, vectorized, legacy):
+        self.assertEqual(json.dumps(vectorized, sort_keys=True), json.dumps(legacy, sort_keys=True))
+
+    def test_price_history_matches_legacy(self):
+        for seed, to_datetime in zip(range(6), [False, True] * 3):
+            data = self._parsed_data(seed, points=500, to_datetime=to_datetime)
+            self.assertSameJson(
+                self.service.extract_price_history(data),
+                self.service._extract_price_history_legacy(data),
+            )
+
+    def test_rating_history_matches_legacy(self):
+        for seed, to_datetime in zip(range(6), [False, True] * 3):
+            data = self._parsed_data(seed, points=500, to_datetime=to_datetime)
+            self.assertSameJson(
+                self.service.extract_rating_history(data),
+                self.service._extract_rating_history_legacy(data),
+            )
+
+    def test_sales_rank_history_matches_legacy(self):
+        for seed, to_datetime in zip(range(6), [False, True] * 3):
+            data = self._parsed_data(seed, points=500, to_datetime=to_datetime)
+            self.assertSameJson(
+                self.service.extract_sales_rank_history(data),
+                self.service._extract_sales_rank_history_legacy(data),
+            )
+
+    def test_empty_and_list_inputs_match_legacy(self):
+        for data in [{}, {'NEW': [], 'NEW_time': []}, {'RATING': [45], 'RATING_time': [100]}]:
+            self.assertSameJson(
+                self.service.extract_price_history(data),
+                self.service._extract_price_history_legacy(data),
+            )
+            self.assertSameJson(
+                self.service.extract_rating_history(data),
+                self.service._extract_rating_history_legacy(data),
+            )
+            self.assertSameJson(
+                self.service.extract_sales_rank_history(data),
+                self.service._extract_sales_rank_history_legacy(data),
+            )
+
+    def test_raw_csv_product_matches_keepa_parsed_product(self):
+        for seed in range(3):
+            csv = self._csv(seed, points=500)
+            raw_product = {'asin': 'B000000000', 'title': 'Producto', 'csv': csv}
+            parsed_product = {**raw_product, 'data': parse_csv(csv)}
+            self.assertSameJson(
+                self.service.parse_product_data(raw_product),
+                self.service.parse_product_data(parsed_product),
+            )
+
+
+class IncrementalHistoryMergeTests(SimpleTestCase):
+    """Merging a windowed refresh into the stored history must equal a full rewrite"""
+
+    def setUp(self):
+        self.service = KeepaService.__new__(KeepaService)
+
+    @staticmethod
+    def _slice_csv(csv, start_minute=None, end_minute=None):
+        """Keep the csv points in [start_minute, end_minute], adding Keepa's value at the window start"""
+        sliced = []
+        for series in csv:
+            if not series:
+                sliced.append(series)
+                continue
+            pairs = list(zip(series[::2], series[1::2]))
+            kept = [
+                (t, v) for t, v in pairs
+                if (start_minute is None or t >= start_minute) and (end_minute is None or t <= end_minute)
+            ]
+            if start_minute is not None:
+                before = [(t, v) for t, v in pairs if t < start_minute]
+                if before:
+                    kept.insert(0, (start_minute, before[-1][1]))
+            sliced.append([x for pair in kept for x in pair])
+        return sliced
+
+    @staticmethod
+    def _minute_to_datetime(minute: int) -> datetime:
+        return datetime(2011, 1, 1, tzinfo=dt_timezone.utc) + timedelta(minutes=int(minute))
+
+    def test_windowed_merge_matches_full_rewrite(self):
+        equivalence = HistoryExtractionEquivalenceTests()
+        for seed in range(4):
+            csv = equivalence._csv(seed, points=300)
+            last_minute = max(series[-2] for series in csv if series)
+            now_minute = last_minute + 60
+            synced_minute = now_minute - 60 * 24 * (seed + 1)
+
+            stored = self.service.parse_product_data(
+                {'asin': 'B000000000', 'title': 'Producto', 'csv': self._slice_csv(csv, end_minute=synced_minute)}
+            )
+            product = SimpleNamespace(history_synced_at=self._minute_to_datetime(synced_minute), **stored)
+            days = history_window_days(product, now=self._minute_to_datetime(now_minute))
+            self.assertIsNotNone(days)
+
+            window_start = now_minute - days * 24 * 60
+            windowed = self.service.parse_product_data(
+                {'asin': 'B000000000', 'title': 'Producto', 'csv': self._slice_csv(csv, start_minute=window_start)}
+            )
+            merged, changed = merge_product_data(product, windowed)
+            full = self.service.parse_product_data({'asin': 'B000000000', 'title': 'Producto', 'csv': csv})
+
+            for field_name in HISTORY_FIELDS + ['current_price_new', 'current_price_amazon', 'current_price_used']:
+                self.assertEqual(
+                    json.dumps(merged[field_name], sort_keys=True),
+                    json.dumps(full[field_name], sort_keys=True),
+                    field_name,
+                )
+            self.assertEqual(
+                changed,
+                [name for name in HISTORY_FIELDS if full[name] != stored[name]],
+            )
+
+    def test_products_never_synced_need_full_history(self):
+        product = SimpleNamespace(history_synced_at=None, price_history={'NEW': {}})
+        self.assertIsNone(history_window_days(product))
+
+
+class CompactHistoryCodecTests(SimpleTestCase):
+    """Encoded histories must decode to exactly the dict that was stored"""
+
+    def test_extracted_histories_round_trip_as_series(self):
+        equivalence = HistoryExtractionEquivalenceTests()
+        service = KeepaService.__new__(KeepaService)
+        for seed in range(3):
+            product = service.parse_product_data(
+                {'asin': 'B000000000', 'title': 'Producto', 'csv': equivalence._csv(seed, points=500)}
+            )
+            for kind in ['price', 'rating', 'sales_rank']:
+                history = product[f'{kind}_history']
+                encoded = encode_history(kind, history)
+                self.assertEqual(encoded[0], FORMAT_SERIES)
+                self.assertEqual(
+                    json.dumps(decode_history(kind, encoded), sort_keys=True),
+                    json.dumps(history, sort_keys=True),
+                )
+
+    def test_irregular_histories_fall_back_to_json(self):
+        for kind, history in [('price', {'NEW': {'prices': [1.5]}}), ('rating', {}), ('sales_rank', {'values': [3]})]:
+            encoded = encode_history(kind, history)
+            self.assertEqual(encoded[0], FORMAT_JSON)
+            self.assertEqual(decode_history(kind, encoded), history)
+
+
+class PricePointSyncTests(TestCase):
+    """The PricePoint table must mirror price_history and answer range queries in SQL"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='analista')
+        self.product = Product.objects.create(
+            asin='B000000001',
+            title='Producto',
+            queried_by=self.user,
+            price_history={
+                'NEW': {
+                    'prices': [3000, 2500],
+                    'times': ['2025-01-01T10:00:00', '2025-02-01T10:00:00'],
+                    'formatted_times': ['2025-01-01 10:00', '2025-02-01 10:00'],
+                },
+            },
+        )
+
+    def test_sync_only_inserts_new_points(self):
+        self.assertEqual(sync_price_points([self.product]), 2)
+
+        self.product.price_history['NEW']['prices'].append(2000)
+        self.product.price_history['NEW']['times'].append('2025-03-01T10:00:00')
+        self.product.price_history['NEW']['formatted_times'].append('2025-03-01 10:00')
+        self.assertEqual(sync_price_points([self.product]), 1)
+        self.assertEqual(sync_price_points([self.product]), 0)
+
+        self.assertEqual(
+            list(PricePoint.objects.filter(product=self.product).values_list('price', flat=True)),
+            [3000, 2500, 2000],
+        )
+
+    def test_range_and_last_value_queries(self):
+        sync_price_points([self.product])
+        since = datetime(2025, 1, 15, tzinfo=dt_timezone.utc)
+
+        price_range = list(PricePoint.objects.for_user(self.user).series('NEW').between(start=since).price_range())
+        self.assertEqual(price_range[0]['min_price'], 2500)
+        self.assertEqual(price_range[0]['points'], 1)
+
+        last = PricePoint.objects.series('NEW').last_values().get()
+        self.assertEqual(last.price, 2500)
+
+
+class BulkProductUpsertTests(TestCase):
+    """A best-seller page is written in a fixed number of statements"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='comprador')
+        Product.objects.create(asin='B000000001', title='Igual', rating=4.5, queried_by=self.user,
+                               price_history={'NEW': {'prices': [100], 'times': ['2025-01-01T00:00:00'],
+                                                      'formatted_times': ['2025-01-01 00:00']}})
+        Product.objects.create(asin='B000000002', title='Viejo', rating=4.0, queried_by=self.user)
+
+    def test_page_upsert_counts_and_statements(self):
+        page = [
+            {'asin': 'B000000001', 'title': 'Igual', 'rating': 4.5, 'current_price_new': None},
+            {'asin': 'B000000002', 'title': 'Nuevo título', 'rating': 4.3},
+        ] + [{'asin': f'B00000010{i}', 'title': f'Producto {i}', 'rating': 4.1} for i in range(5)]
+
+        with CaptureQueriesContext(connection) as queries:
+            result = bulk_upsert_products(page, self.user, update_fields=['title', 'rating', 'current_price_new'])
+        statements = [q['sql'] for q in queries.captured_queries if not q['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+
+        self.assertEqual(result.created_count, 5)
+        self.assertEqual(result.updated, ['B000000002'])
+        self.assertEqual(result.unchanged, ['B000000001'])
+        # SELECT existing + INSERT new + UPDATE changed (+ PricePoint lookup for new rows)
+        self.assertLessEqual(len(statements), 4)
+
+        product = Product.objects.get(asin='B000000002')
+        self.assertEqual(product.title, 'Nuevo título')
+        self.assertEqual(str(product.rating), '4.30')
+        # Partial listings never clear stored histories
+        self.assertTrue(Product.objects.get(asin='B000000001').price_history)
+
+
+    def test_rows_created_concurrently_are_diffed_not_reported_as_created(self):
+        other = User.objects.create(username='otro-proceso')
+        in_bulk = QuerySet.in_bulk
+        calls = []
+
+        def in_bulk_then_race(queryset, *args, **kwargs):
+            found = in_bulk(queryset, *args, **kwargs)
+            if not calls:
+                # Otra petición crea el producto entre el SELECT y el INSERT
+                Product.objects.create(asin='B000000201', title='Otro proceso', queried_by=other)
+            calls.append(args)
+            return found
+
+        page = [{'asin': 'B000000200', 'title': 'Nuevo'}, {'asin': 'B000000201', 'title': 'Nuestro título'}]
+        with mock.patch.object(QuerySet, 'in_bulk', in_bulk_then_race):
+            result = bulk_upsert_products(page, self.user, update_fields=['title'])
+
+        self.assertEqual(result.created, ['B000000200'])
+        self.assertEqual(result.updated, ['B000000201'])
+        raced = Product.objects.get(asin='B000000201')
+        self.assertEqual((raced.title, raced.queried_by_id), ('Nuestro título', other.pk))
+        self.assertFalse(result.products['B000000201']._state.adding)
+
+
+class ProductUpsertTests(TestCase):
+    """upsert_product writes only the columns that changed"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='comprador')
+        csv = HistoryExtractionEquivalenceTests()._csv(1, points=200)
+        self.product_data = KeepaService.__new__(KeepaService).parse_product_data(
+            {'asin': 'B000000009', 'title': 'Producto', 'csv': csv}
+        )
+
+    def test_unchanged_data_is_not_written(self):
+        product, created, _ = upsert_product(self.product_data, self.user)
+        self.assertTrue(created)
+
+        stored = Product.objects.get(asin='B000000009')
+        with CaptureQueriesContext(connection) as queries:
+            _, created, changed = upsert_product(self.product_data, product=stored)
+        self.assertFalse(created)
+        self.assertEqual(changed, [])
+        self.assertEqual(len(queries.captured_queries), 0)
+
+    def test_deferred_histories_are_compared_not_rewritten(self):
+        upsert_product(self.product_data, self.user)
+        summary = Product.summaries.get(asin='B000000009')
+        with CaptureQueriesContext(connection) as queries:
+            _, _, changed = upsert_product(self.product_data, product=summary)
+        self.assertEqual(changed, [])
+        # Una sola consulta para las columnas diferidas, sin UPDATE
+        self.assertEqual(len(queries.captured_queries), 1)
+
+        summary = Product.summaries.get(asin='B000000009')
+        history = {**self.product_data['price_history'], 'USED': {'prices': [1000], 'times': ['2024-01-01T00:00:00']}}
+        _, _, changed = upsert_product({**self.product_data, 'price_history': history}, product=summary)
+        self.assertEqual(changed, ['price_history'])
+
+    def test_only_changed_columns_are_written(self):
+        upsert_product(self.product_data, self.user)
+        stored = Product.objects.get(asin='B000000009')
+        with CaptureQueriesContext(connection) as queries:
+            _, _, changed = upsert_product({**self.product_data, 'current_price_new': 1234}, product=stored)
+        self.assertEqual(changed, ['current_price_new'])
+        update = next(q['sql'] for q in queries.captured_queries if q['sql'].startswith('UPDATE'))
+        self.assertNotIn('price_history', update)
+        self.assertEqual(Product.objects.get(asin='B000000009').current_price_new, 1234)
+
+
+class AlertSchedulingTests(TestCase):
+    """next_check_at follows last_checked and the frequency, so due alerts are selected in SQL"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='vigilante')
+        self.product = Product.objects.create(asin='B000000001', title='Producto', queried_by=self.user)
+
+    def _alert(self, target_price, frequency, last_checked=None):
+        return PriceAlert.objects.create(
+            user=self.user, product=self.product, target_price=target_price,
+            frequency=frequency, last_checked=last_checked,
+        )
+
+    def test_next_check_at_is_maintained_on_check_and_edit(self):
+        checked = timezone.now() - timedelta(hours=3)
+        alert = self._alert(1000, frequency=4, last_checked=checked)
+        self.assertEqual(alert.next_check_at, checked + timedelta(hours=6))
+        self.assertFalse(alert.should_check_now())
+
+        alert.frequency = 1
+        alert.save(update_fields=['frequency'])
+        alert.refresh_from_db()
+        self.assertEqual(alert.next_check_at, checked + timedelta(hours=24))
+
+    def test_due_alerts_query(self):
+        now = timezone.now()
+        never_checked = self._alert(1000, frequency=2)
+        overdue = self._alert(1100, frequency=4, last_checked=now - timedelta(hours=7))
+        self._alert(1200, frequency=2, last_checked=now - timedelta(hours=7))
+
+        due = PriceAlert.objects.filter(is_active=True, triggered=False, next_check_at__lte=timezone.now())
+        self.assertEqual(set(due), {never_checked, overdue})
+        self.assertEqual(set(due), {a for a in PriceAlert.objects.all() if a.should_check_now()})
+
+
+@override_settings(EMAIL_QUEUE_ENABLED=True)
+class AlertEventTests(TestCase):
+    """A price update fires the satisfied alerts of the product once it commits"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='cazador', email='cazador@example.com')
+        self.product = Product.objects.create(
+            asin='B000000001', title='Producto', current_price_new=5000, queried_by=self.user,
+        )
+        self.cheap = PriceAlert.objects.create(user=self.user, product=self.product, target_price=4000)
+        self.cheaper = PriceAlert.objects.create(user=self.user, product=self.product, target_price=3000)
+        self.used = PriceAlert.objects.create(user=self.user, product=self.product, target_price=4000, price_type='used')
+
+    def test_price_drop_fires_matching_alerts_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            upsert_product({'asin': 'B000000001', 'title': 'Producto', 'current_price_new': 3500}, product=self.product)
+
+        self.cheap.refresh_from_db()
+        self.cheaper.refresh_from_db()
+        self.used.refresh_from_db()
+        self.assertTrue(self.cheap.triggered)
+        self.assertFalse(self.cheaper.triggered)
+        self.assertFalse(self.used.triggered)
+        self.assertEqual(OutboundEmail.objects.count(), 1)
+
+        # A second update at the same price must not notify again
+        with self.captureOnCommitCallbacks(execute=True):
+            upsert_product({'asin': 'B000000001', 'title': 'Producto', 'current_price_new': 3400}, product=self.product)
+        self.assertEqual(OutboundEmail.objects.count(), 1)
+
+    def test_cron_refresh_fires_alerts_that_are_not_due(self):
+        Product.objects.filter(asin='B000000001').update(last_updated=timezone.now() - timedelta(hours=2))
+        PriceAlert.objects.update(next_check_at=timezone.now() + timedelta(hours=6))
+        PriceAlert.objects.filter(pk=self.cheaper.pk).update(next_check_at=timezone.now() - timedelta(minutes=1))
+        refresh = SimpleNamespace(
+            products={'B000000001': {'asin': 'B000000001', 'title': 'Producto', 'current_price_new': 3500}},
+            errors={}, fetched_at=timezone.now(),
+        )
+        with mock.patch('products.management.commands.check_price_alerts.KeepaService') as keepa_service:
+            keepa_service.return_value.refresh_products.return_value = refresh
+            call_command('check_price_alerts', stdout=StringIO())
+
+        # Solo la alerta vencida estaba en el lote, pero el precio nuevo dispara también la otra
+        self.cheap.refresh_from_db()
+        self.cheaper.refresh_from_db()
+        self.used.refresh_from_db()
+        self.assertTrue(self.cheap.triggered)
+        self.assertFalse(self.cheaper.triggered)
+        self.assertIsNotNone(self.cheaper.last_checked)
+        self.assertFalse(self.used.triggered)
+        self.assertEqual(OutboundEmail.objects.count(), 1)
+
+    @override_settings(KEEPA_API_KEY='test')
+    def test_best_seller_page_fires_alerts(self):
+        Product.objects.filter(asin='B000000001').update(current_price_amazon=6000)
+        # Página de best sellers: sin historial, precios actuales en stats.current (AMAZON, NEW, USED)
+        raw = {'asin': 'B000000001', 'title': 'Producto', 'stats': {'current': [-1, 3500, 4500]}}
+        with mock.patch('products.keepa_service.get_keepa_client'):
+            parsed = KeepaService().parse_product_data(raw)
+        self.assertEqual(
+            (parsed['current_price_new'], parsed['current_price_amazon'], parsed['current_price_used']), (3500, None, 4500)
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_upsert_products([parsed], self.user, update_fields=BEST_SELLER_UPDATE_FIELDS)
+
+        self.cheap.refresh_from_db()
+        self.used.refresh_from_db()
+        self.assertTrue(self.cheap.triggered)
+        self.assertFalse(self.used.triggered)
+        self.product.refresh_from_db()
+        # Sin precio de Amazon en la página: se conserva el guardado
+        self.assertEqual(self.product.current_price_amazon, 6000)
+
+
+class AlertLeaseTests(TestCase):
+    """Workers lease the due alerts of whole products and release them when done"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='worker', email='worker@example.com')
+        past = timezone.now() - timedelta(hours=1)
+        self.alerts = []
+        for index in range(3):
+            product = Product.objects.create(asin=f'B00000000{index}', title=f'Producto {index}', queried_by=self.user)
+            alert = PriceAlert.objects.create(user=self.user, product=product, target_price=1000)
+            self.alerts.append(alert)
+        # Second alert on the first product: leased together with the first one
+        self.alerts.append(PriceAlert.objects.create(user=self.user, product=self.alerts[0].product, target_price=900))
+        PriceAlert.objects.update(next_check_at=past)
+
+    def test_batches_do_not_overlap(self):
+        first = claim_alert_batch('host-a:1', max_products=2, lease_seconds=600)
+        second = claim_alert_batch('host-b:1', max_products=2, lease_seconds=600)
+        self.assertEqual(len(first) + len(second), 4)
+        self.assertFalse(set(first) & set(second))
+        self.assertEqual(claim_alert_batch('host-c:1', max_products=2, lease_seconds=600), [])
+        self.assertEqual(
+            len({alert.product_id for alert in PriceAlert.objects.filter(id__in=first)}), 2
+        )
+
+    def test_release_postpones_unchecked_alerts(self):
+        leased = claim_alert_batch('host-a:1', max_products=10, lease_seconds=600)
+        checked = PriceAlert.objects.get(id=leased[0])
+        checked.last_checked = timezone.now()
+        checked.save(update_fields=['last_checked'])
+
+        release_alert_batch('host-a:1', leased, retry_delay=timedelta(minutes=15))
+
+        self.assertFalse(PriceAlert.objects.exclude(lease_owner='').exists())
+        self.assertEqual(claim_alert_batch('host-a:1', max_products=10, lease_seconds=600), [])
+        unchecked = PriceAlert.objects.exclude(id=checked.id)
+        self.assertTrue(all(alert.next_check_at > timezone.now() for alert in unchecked))
+
+
+@override_settings(EMAIL_QUEUE_ENABLED=True)
+class AlertWriteBufferTests(TestCase):
+    """check_price_alerts writes notifications and last_checked in bulk"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='lotes', email='lotes@example.com')
+        for index in range(3):
+            product = Product.objects.create(
+                asin=f'B00000001{index}', title=f'Producto {index}', current_price_new=5000, queried_by=self.user,
+            )
+            for target_price in (1000, 2000, 3000, 6000):
+                PriceAlert.objects.create(user=self.user, product=product, target_price=target_price)
+        PriceAlert.objects.update(next_check_at=timezone.now() - timedelta(hours=1))
+
+    def test_bookkeeping_statements_do_not_grow_with_alerts(self):
+        with mock.patch('products.management.commands.check_price_alerts.KeepaService'), \
+                CaptureQueriesContext(connection) as queries:
+            call_command('check_price_alerts', stdout=StringIO())
+
+        statements = [query['sql'].split()[0] for query in queries.captured_queries]
+        # Each fired alert writes its claim, notification and email together; the
+        # last_checked of the twelve checked alerts is one bulk UPDATE
+        self.assertEqual(statements.count('INSERT'), 3 * 2)
+        self.assertEqual(statements.count('UPDATE'), 3 + 1)
+        self.assertEqual(Notification.objects.filter(notification_type='price_alert').count(), 3)
+        self.assertEqual(OutboundEmail.objects.count(), 3)
+        self.assertEqual(PriceAlert.objects.filter(triggered=True).count(), 3)
+        for alert in PriceAlert.objects.filter(triggered=False):
+            self.assertEqual(alert.next_check_at, alert.last_checked + timedelta(hours=12))
+
+
+    def test_failed_notification_write_keeps_the_alert_active(self):
+        with mock.patch('products.management.commands.check_price_alerts.KeepaService'), \
+                mock.patch('products.alert_writes.Notification.objects.bulk_create', side_effect=RuntimeError('BD caída')):
+            call_command('check_price_alerts', stdout=StringIO())
+        # El claim se deshizo con la notificación: la próxima verificación lo reintenta
+        self.assertFalse(PriceAlert.objects.filter(triggered=True).exists())
+        self.assertEqual(PriceAlert.objects.filter(is_active=True).count(), 12)
+        self.assertFalse(OutboundEmail.objects.exists())
+
+    def test_threads_close_their_connection_once(self):
+        with mock.patch('products.management.commands.check_price_alerts.KeepaService'), \
+                mock.patch('threading.Thread', InlineThread), \
+                mock.patch('products.management.commands.check_price_alerts.connection') as thread_connection:
+            call_command('check_price_alerts', '--threads', '2', stdout=StringIO())
+        # Tres productos en dos hilos: una conexión por hilo, no por producto
+        self.assertEqual(thread_connection.close.call_count, 2)
+        self.assertEqual(PriceAlert.objects.filter(triggered=True).count(), 3)
+
+
+class FakeEmailConnection:
+    """Stand-in for an email backend connection; sending to a recipient in errors raises that error"""
+
+    def __init__(self, errors=None, open_error=None):
+        self.errors = errors or {}
+        self.open_error = open_error
+        self.opened = self.closed = self.calls = 0
+        self.sent = []
+
+    def open(self):
+        self.opened += 1
+        if self.open_error is not None:
+            raise self.open_error
+
+    def close(self):
+        self.closed += 1
+
+    def send_messages(self, messages):
+        # Como los backends de Django: en orden, parando en el primer error
+        self.calls += 1
+        count = 0
+        for message in messages:
+            if message.to[0] in self.errors:
+                raise self.errors[message.to[0]]
+            self.sent.append(message.to[0])
+            count += 1
+        return count
+
+
+class EmailQueueTests(TestCase):
+    """Queued emails are sent in batches and failures are retried with backoff"""
+
+    def setUp(self):
+        for index in range(3):
+            queue_email(f'cliente{index}@example.com', f'Asunto {index}', 'Texto', '<p>Texto</p>')
+
+    def test_drain_sends_everything(self):
+        totals = drain_queue(batch_size=2)
+
+        self.assertEqual(totals, {'sent': 3, 'failed': 0, 'requeued': 0})
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertFalse(OutboundEmail.objects.exclude(status=OutboundEmail.STATUS_SENT).exists())
+        self.assertEqual(claim_batch(10), [])
+
+    def test_drain_reuses_one_connection_and_sends_each_batch_at_once(self):
+        connection = FakeEmailConnection()
+        with mock.patch('products.email_queue.get_connection', return_value=connection):
+            call_command('send_queued_emails', '--batch-size', '2', stdout=StringIO())
+
+        self.assertEqual((connection.opened, connection.closed), (1, 1))
+        self.assertEqual(connection.calls, 2)
+        self.assertEqual(len(connection.sent), 3)
+
+    def test_emails_are_sent_inline_unless_the_queue_is_enabled(self):
+        user = User.objects.create(username='directo', email='directo@example.com')
+
+        self.assertTrue(send_email_notification(user, 'Asunto', '<p>Hola</p>'))
+        self.assertEqual(mail.outbox[0].to, ['directo@example.com'])
+        self.assertFalse(OutboundEmail.objects.filter(user=user).exists())
+
+        with override_settings(EMAIL_QUEUE_ENABLED=True):
+            self.assertTrue(send_email_notification(user, 'Asunto', '<p>Hola</p>'))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertTrue(OutboundEmail.objects.filter(user=user).exists())
+
+    def test_failed_recipient_is_retried_later(self):
+        connection = FakeEmailConnection(errors={'cliente1@example.com': OSError('buzón no disponible')})
+        self.assertEqual(send_batch(claim_batch(10), connection), 2)
+        # El lote sigue tras el destinatario rechazado
+        self.assertEqual(connection.sent, ['cliente0@example.com', 'cliente2@example.com'])
+        self.assertEqual(connection.calls, 2)
+
+        failed = OutboundEmail.objects.get(to_email='cliente1@example.com')
+        self.assertEqual(failed.status, OutboundEmail.STATUS_PENDING)
+        self.assertEqual(failed.attempts, 1)
+        self.assertGreater(failed.next_attempt_at, timezone.now())
+        self.assertEqual(claim_batch(10), [])
+
+        # After the last attempt the email stays failed
+        failed.attempts = MAX_ATTEMPTS - 1
+        failed.next_attempt_at = timezone.now()
+        failed.save()
+        send_batch(claim_batch(10), connection)
+        failed.refresh_from_db()
+        self.assertEqual(failed.status, OutboundEmail.STATUS_FAILED)
+
+    def test_admin_retry_skips_emails_being_sent(self):
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'clave-segura-123')
+        sending = claim_batch(1)[0]
+        OutboundEmail.objects.exclude(pk=sending.pk).update(status=OutboundEmail.STATUS_FAILED, attempts=MAX_ATTEMPTS)
+        self.client.force_login(admin_user)
+
+        self.client.post(reverse('admin:products_outboundemail_changelist'), {
+            'action': 'retry_now', '_selected_action': list(OutboundEmail.objects.values_list('pk', flat=True)),
+        })
+
+        sending.refresh_from_db()
+        self.assertEqual(sending.status, OutboundEmail.STATUS_SENDING)
+        self.assertEqual(
+            set(OutboundEmail.objects.exclude(pk=sending.pk).values_list('status', 'attempts')),
+            {(OutboundEmail.STATUS_PENDING, 0)},
+        )
+
+    def test_unreachable_server_requeues_without_spending_attempts(self):
+        down = FakeEmailConnection(open_error=ConnectionRefusedError('servidor caído'))
+        with mock.patch('products.email_queue.get_connection', return_value=down):
+            # Más caídas que intentos: ningún email llega a fallar definitivamente
+            for _ in range(MAX_ATTEMPTS + 1):
+                OutboundEmail.objects.update(next_attempt_at=timezone.now())
+                with self.assertRaises(EmailConnectionError) as raised:
+                    send_batch(claim_batch(10))
+                self.assertEqual(raised.exception.requeued, 3)
+
+            for email in OutboundEmail.objects.all():
+                self.assertEqual(email.status, OutboundEmail.STATUS_PENDING)
+                self.assertEqual(email.attempts, 0)
+                self.assertGreater(email.next_attempt_at, timezone.now())
+
+            # drain_queue abre la conexión antes de reservar nada
+            OutboundEmail.objects.update(next_attempt_at=timezone.now())
+            with self.assertRaises(EmailConnectionError):
+                drain_queue(batch_size=2)
+            out = StringIO()
+            call_command('send_queued_emails', stdout=out)
+        self.assertIn('Servidor de email no disponible', out.getvalue())
+        self.assertFalse(OutboundEmail.objects.exclude(status=OutboundEmail.STATUS_PENDING).exists())
+
+    def test_dropped_connection_requeues_the_unsent_emails(self):
+        connection = FakeEmailConnection(errors={'cliente1@example.com': smtplib.SMTPServerDisconnected('conexión cerrada')})
+        with self.assertRaises(EmailConnectionError) as raised:
+            send_batch(claim_batch(10), connection)
+        self.assertEqual((raised.exception.sent, raised.exception.requeued), (1, 2))
+
+        statuses = dict(OutboundEmail.objects.values_list('to_email', 'status'))
+        self.assertEqual(statuses['cliente0@example.com'], OutboundEmail.STATUS_SENT)
+        self.assertEqual(statuses['cliente2@example.com'], OutboundEmail.STATUS_PENDING)
+        self.assertFalse(OutboundEmail.objects.filter(attempts__gt=0).exists())
+
+
+class MaintenanceFanOutTests(TestCase):
+    """Maintenance notifications are inserted in batches for every active user"""
+
+    def test_notifications_are_created_in_batches(self):
+        for index in range(5):
+            User.objects.create(username=f'usuario{index}')
+        User.objects.create(username='inactivo', is_active=False)
+
+        with CaptureQueriesContext(connection) as queries:
+            call_command('send_maintenance_notification', 'Parada programada', '--batch-size=2', stdout=StringIO())
+
+        inserts = [query for query in queries.captured_queries if query['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(Notification.objects.filter(notification_type='system').count(), 5)
+        self.assertFalse(Notification.objects.filter(user__username='inactivo').exists())
+
+
+class UserCountersTests(TestCase):
+    """The badge counters follow notification and alert changes"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='contador', email='contador@example.com')
+        self.product = Product.objects.create(asin='B000000020', title='Producto', queried_by=self.user)
+
+    def assertCounters(self, unread, active):
+        counters = get_user_counters(self.user)
+        self.assertEqual((counters.unread_notifications, counters.active_alerts), (unread, active))
+
+    def test_counters_follow_changes(self):
+        self.assertCounters(0, 0)
+        alert = PriceAlert.objects.create(user=self.user, product=self.product, target_price=1000)
+        notification = Notification.objects.create(user=self.user, title='Hola', message='Mensaje')
+        with self.assertNumQueries(1):
+            self.assertCounters(1, 1)
+
+        notification.is_read = True
+        notification.save()
+        alert.is_active = False
+        alert.save()
+        self.assertCounters(0, 0)
+
+        send_system_maintenance_notification('Mantenimiento')
+        self.assertCounters(1, 0)
+
+    def test_reconcile_fixes_drift(self):
+        Notification.objects.create(user=self.user, title='Hola', message='Mensaje')
+        self.assertCounters(1, 0)
+        UserCounters.objects.filter(user=self.user).update(unread_notifications=7)
+
+        self.assertEqual(reconcile_user_counters(), 1)
+        self.assertCounters(1, 0)
+
+
+class DashboardStatsTests(TestCase):
+    """The dashboard reads a per-user snapshot that the user's changes invalidate"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='panel', email='panel@example.com', password='clave-segura-123')
+        for index, rating in enumerate([4.5, 3.0, 4.9, None]):
+            Product.objects.create(
+                asin=f'B00000003{index}', title=f'Producto {index}', rating=rating,
+                current_price_new=1000 * (index + 1), queried_by=self.user,
+            )
+        PriceAlert.objects.create(user=self.user, product_id='B000000030', target_price=500, price_type='used')
+
+    def test_snapshot_is_reused_until_invalidated(self):
+        stats = get_dashboard_stats(self.user)
+        self.assertEqual(stats['total_products'], 4)
+        self.assertEqual(stats['avg_price'], 25.0)
+        self.assertEqual(stats['top_rated_asins'], ['B000000032', 'B000000030', 'B000000031'])
+        self.assertEqual(stats['alerts_by_type']['used'], 1)
+        self.assertEqual(stats['active_alerts'], 1)
+
+        with self.assertNumQueries(1):
+            get_dashboard_stats(self.user)
+
+        Notification.objects.create(user=self.user, title='Hola', message='Mensaje', notification_type='info')
+        stats = get_dashboard_stats(self.user)
+        self.assertEqual((stats['total_notifications'], stats['unread_notifications']), (1, 1))
+        self.assertEqual(stats['notif_by_type']['info'], 1)
+
+    def test_deleted_product_leaves_the_total(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('products:list')).context['total_products'], 4)
+
+        self.client.post(reverse('products:delete', args=['B000000033']))
+
+        self.assertEqual(self.client.get(reverse('products:list')).context['total_products'], 3)
+
+    def test_dashboard_renders_from_snapshot(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_products'], 4)
+        self.assertEqual([product.asin for product in response.context['top_rated_products']],
+                         ['B000000032', 'B000000030', 'B000000031'])
+
+
+class SummaryProjectionTests(TestCase):
+    """List pages load products without their heavy columns"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='lista', email='lista@example.com', password='clave-segura-123')
+        self.product = Product.objects.create(
+            asin='B000000040', title='Producto', queried_by=self.user,
+            price_history={'NEW': {'prices': [1000], 'times': ['2024-01-01T00:00:00']}},
+        )
+        PriceAlert.objects.create(user=self.user, product=self.product, target_price=500)
+
+    def test_list_views_do_not_select_heavy_columns(self):
+        self.client.force_login(self.user)
+        for url in (reverse('products:list'), reverse('products:alerts_list'), reverse('products:notifications')):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            for query in queries.captured_queries:
+                self.assertNotIn('price_history', query['sql'], url)
+
+    def test_deferred_columns_still_load_on_access(self):
+        product = Product.summaries.get(asin='B000000040')
+        self.assertEqual(product.price_history['NEW']['prices'], [1000])
+
+
+class KeysetPaginationTests(TestCase):
+    """Product and notification lists page by cursor instead of COUNT + OFFSET"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='cursor', email='cursor@example.com', password='clave-segura-123')
+        base = timezone.now()
+        for index in range(25):
+            Product.objects.create(asin=f'B0000001{index:02d}', title=f'Producto {index}', queried_by=self.user)
+            # Dos productos por instante: el ASIN desempata
+            Product.objects.filter(asin=f'B0000001{index:02d}').update(last_updated=base - timedelta(minutes=index // 2))
+
+    def test_pages_cover_every_row_once_in_both_directions(self):
+        paginator = KeysetPaginator(Product.objects.filter(queried_by=self.user), ('-last_updated', '-asin'), 10)
+        expected = list(Product.objects.filter(queried_by=self.user).order_by('-last_updated', '-asin')
+                        .values_list('asin', flat=True))
+
+        pages = [paginator.get_page()]
+        while pages[-1].has_next():
+            pages.append(paginator.get_page(pages[-1].next_token))
+        self.assertEqual([page.number for page in pages], [1, 2, 3])
+        self.assertEqual([product.asin for page in pages for product in page], expected)
+
+        back = paginator.get_page(pages[-1].previous_token)
+        self.assertEqual([product.asin for product in back], expected[10:20])
+        self.assertEqual(back.number, 2)
+        first = paginator.get_page(back.previous_token)
+        self.assertEqual([product.asin for product in first], expected[:10])
+        self.assertFalse(first.has_previous())
+
+    def test_invalid_token_falls_back_to_first_page(self):
+        paginator = KeysetPaginator(Product.objects.filter(queried_by=self.user), ('-last_updated', '-asin'), 10)
+        self.assertEqual(paginator.get_page('no-es-un-cursor').number, 1)
+        self.assertEqual(len(paginator.get_page('no-es-un-cursor')), 10)
+
+    def test_list_view_runs_no_count_or_offset(self):
+        self.client.force_login(self.user)
+        first = self.client.get(reverse('products:list'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('products:list'), {'cursor': first.context['page_obj'].next_token})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['page_obj'].number, 2)
+        product_queries = [query['sql'] for query in queries.captured_queries if 'products_product' in query['sql']]
+        self.assertTrue(product_queries)
+        for sql in product_queries:
+            self.assertNotIn('OFFSET', sql)
+
+
+class QueryPlanAuditTests(TestCase):
+    """EXPLAIN audit of the hot filters"""
+
+    def test_user_scoped_queries_use_indexes(self):
+        user = User.objects.create_user(username='plan', email='plan@example.com', password='clave-segura-123')
+        names = ['product_list', 'product_list_next_page', 'alerts_list_active', 'notifications_list',
+                 'notifications_unread', 'dashboard_top_rated', 'leased_alerts', 'alerts_for_price_change']
+        reports = audit_queries(user.pk, names)
+        self.assertEqual([report.query.name for report in reports], names)
+        for report in reports:
+            self.assertEqual(report.full_scans, [], f'{report.query.name}: {report.plan}')
+
+    def test_unindexed_filter_is_reported(self):
+        plan, full_scans = explain_queryset(Product.objects.filter(title='Producto'))
+        self.assertEqual(full_scans, ['products_product'])
+
+        out = StringIO()
+        call_command('audit_query_plans', 'product_search_by_title', '--fail-on-scan', stdout=out)
+        self.assertIn('(esperado)', out.getvalue())
+
+
+class SingleFlightTests(TestCase):
+    """Concurrent fetches of the same key run once"""
+
+    def test_concurrent_callers_share_one_fetch(self):
+        started, release = threading.Event(), threading.Event()
+        calls, results = [], []
+
+        def fetch():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'producto'
+
+        def caller():
+            results.append(single_flight('product:B000000050', fetch, lambda: None))
+
+        # Sin base de datos: los hilos solo comparten la llamada en curso del proceso
+        with mock.patch('products.single_flight._fetch_across_processes', lambda key, fetch, load, wait: fetch()):
+            leader = threading.Thread(target=caller)
+            leader.start()
+            started.wait(5)
+            followers = [threading.Thread(target=caller) for _ in range(3)]
+            for thread in followers:
+                thread.start()
+            time.sleep(0.1)
+            release.set()
+            for thread in [leader] + followers:
+                thread.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['producto'] * 4)
+
+    def test_waits_for_the_process_holding_the_lease(self):
+        FetchLease.objects.create(key='product:B000000051', owner='otro', expires_at=timezone.now() + timedelta(minutes=1))
+        fetch = mock.Mock(return_value='propio')
+        load = mock.Mock(side_effect=[None, 'del otro proceso'])
+        with mock.patch('products.single_flight.POLL_INTERVAL', 0):
+            self.assertEqual(single_flight('product:B000000051', fetch, load), 'del otro proceso')
+        fetch.assert_not_called()
+
+    def test_expired_lease_is_taken_over(self):
+        FetchLease.objects.create(key='product:B000000052', owner='otro', expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(single_flight('product:B000000052', lambda: 'propio', lambda: None), 'propio')
+        self.assertFalse(FetchLease.objects.filter(key='product:B000000052').exists())
+
+    def test_empty_result_is_shared_for_a_while(self):
+        fetch = mock.Mock(return_value=None)
+        self.assertIsNone(single_flight('product:B000000053', fetch, lambda: None))
+        # Otro proceso pide el mismo ASIN inválido: recibe la respuesta vacía sin consultar
+        with mock.patch('products.single_flight.lease_owner', return_value='otro'):
+            self.assertIsNone(single_flight('product:B000000053', fetch, lambda: None))
+        self.assertEqual(fetch.call_count, 1)
+
+        FetchLease.objects.filter(key='product:B000000053').update(expires_at=timezone.now())
+        fetch.return_value = 'producto'
+        self.assertEqual(single_flight('product:B000000053', fetch, lambda: None), 'producto')
+        self.assertFalse(FetchLease.objects.filter(key='product:B000000053').exists())
+
+
+@override_settings(JOB_QUEUE_ENABLED=True)
+class ProductFreshnessTests(TestCase):
+    """Detail pages serve stored data and refresh stale products in the background"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='fresco', email='fresco@example.com', password='clave-segura-123')
+        self.product = Product.objects.create(asin='B000000060', title='Producto', queried_by=self.user)
+        self.client.force_login(self.user)
+
+    def test_fresh_product_is_not_refreshed(self):
+        response = self.client.get(reverse('products:detail', args=['B000000060']))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context['freshness']['stale'])
+        self.assertFalse(Job.objects.exists())
+
+    def test_stale_product_is_served_and_refreshed_once(self):
+        Product.objects.filter(asin='B000000060').update(history_synced_at=timezone.now() - timedelta(days=2))
+        with mock.patch('products.views.KeepaService') as keepa_service:
+            response = self.client.get(reverse('products:detail', args=['B000000060']))
+            self.client.get(reverse('products:detail', args=['B000000060']))
+        self.assertEqual(response.status_code, 200)
+        keepa_service.assert_not_called()
+        self.assertEqual(response.context['freshness']['refreshing'], True)
+        # La segunda visita encuentra el refresco pendiente
+        self.assertEqual(Job.objects.filter(kind='refresh_product', payload={'asin': 'B000000060'}).count(), 1)
+
+        poll = self.client.get(reverse('products:freshness', args=['B000000060'])).json()
+        self.assertEqual((poll['stale'], poll['refreshing']), (True, True))
+
+    @override_settings(JOB_QUEUE_ENABLED=False)
+    def test_refresh_abandoned_by_its_thread_runs_again(self):
+        Product.objects.filter(asin='B000000060').update(history_synced_at=timezone.now() - timedelta(days=2))
+        # Hilo muerto a mitad del trabajo (reciclado de gunicorn): la reserva ya venció
+        job = Job.objects.create(
+            kind='refresh_product', key='refresh:B000000060', payload={'asin': 'B000000060'}, max_attempts=1,
+            status=Job.STATUS_RUNNING, run_at=timezone.now() - timedelta(seconds=1), worker='inline:1',
+        )
+        poll = self.client.get(reverse('products:freshness', args=['B000000060'])).json()
+        self.assertFalse(poll['refreshing'])
+
+        with mock.patch('products.job_handlers.refresh_product', return_value=self.product) as refresh, \
+                mock.patch('threading.Thread', InlineThread), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('products:detail', args=['B000000060']))
+
+        refresh.assert_called_once_with('B000000060')
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_SUCCEEDED)
+        self.assertEqual(Job.objects.count(), 1)
+
+
+class InlineThread:
+    """Stand-in for threading.Thread that runs its target on start()"""
+
+    def __init__(self, target, args=(), name=None, daemon=None):
+        self.target, self.args = target, args
+
+    def start(self):
+        self.target(*self.args)
+
+    def join(self, timeout=None):
+        pass
+
+
+@override_settings(JOB_QUEUE_ENABLED=True)
+class JobQueueTests(TestCase):
+    """Background jobs are queued by the views and run by run_workers"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='trabajos', email='trabajos@example.com', password='clave-segura-123')
+
+    def test_retries_then_fails(self):
+        handler = mock.Mock(side_effect=[RuntimeError('caído'), {'ok': True}])
+        with mock.patch.dict(JOB_HANDLERS, {'prueba': handler}):
+            job = enqueue_job('prueba', {'n': 1}, key='prueba:1')
+            self.assertEqual(enqueue_job('prueba', {'n': 1}, key='prueba:1').pk, job.pk)
+
+            self.assertFalse(run_job(claim_jobs('worker')[0]))
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), (Job.STATUS_PENDING, 1))
+            self.assertEqual(claim_jobs('worker'), [])
+
+            Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+            self.assertTrue(run_job(claim_jobs('worker')[0]))
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.result), (Job.STATUS_SUCCEEDED, {'ok': True}))
+
+        with mock.patch.dict(JOB_HANDLERS, {'prueba': mock.Mock(side_effect=PermanentJobError('sin datos'))}):
+            job = enqueue_job('prueba', max_attempts=5)
+            run_job(claim_jobs('worker')[0])
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts, job.last_error), (Job.STATUS_FAILED, 1, 'sin datos'))
+
+    def test_ai_summary_is_queued_and_reported(self):
+        Product.objects.create(asin='B000000070', title='Producto', queried_by=self.user)
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('products:generate_ai_summary', args=['B000000070']))
+        self.assertEqual(response.status_code, 202)
+        status_url = response.json()['status_url']
+        self.assertFalse(self.client.get(status_url).json()['done'])
+
+        with mock.patch('products.job_handlers.OpenAIService') as openai_service:
+            openai_service.return_value.generate_price_summary.return_value = 'Buen momento para comprar'
+            out = StringIO()
+            # Hilos del pool en el hilo del test, que es el que ve la base de datos de prueba
+            with mock.patch('threading.Thread', InlineThread):
+                call_command('run_workers', '--threads', '1', '--once', stdout=out)
+        self.assertIn('1 trabajos completados', out.getvalue())
+
+        status = self.client.get(status_url).json()
+        self.assertEqual((status['status'], status['result']['summary']), ('succeeded', 'Buen momento para comprar'))
+        self.assertEqual(Product.objects.get(asin='B000000070').ai_summary, 'Buen momento para comprar')
+
+        with mock.patch.dict(JOB_HANDLERS, {'prueba': mock.Mock()}):
+            private = enqueue_job('prueba', user=self.user)
+        other = User.objects.create_user(username='otro', email='otro@example.com', password='clave-segura-123')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(reverse('products:job_status', args=[private.pk])).status_code, 404)
+
+    def test_users_requesting_the_same_summary_share_the_job(self):
+        Product.objects.create(asin='B000000071', title='Producto', queried_by=self.user)
+        other = User.objects.create_user(username='otra', email='otra@example.com', password='clave-segura-123')
+        status_urls = []
+        for user in (self.user, other):
+            self.client.force_login(user)
+            response = self.client.post(reverse('products:generate_ai_summary', args=['B000000071']))
+            status_urls.append(response.json()['status_url'])
+            status = self.client.get(status_urls[-1])
+            self.assertEqual((status.status_code, status.json()['done']), (200, False))
+        self.assertEqual(status_urls[0], status_urls[1])
+        self.assertEqual(Job.objects.filter(kind='ai_summary').count(), 1)
+
+    def test_manual_refresh_is_queued(self):
+        Product.objects.create(asin='B000000072', title='Producto', queried_by=self.user)
+        self.client.force_login(self.user)
+        with mock.patch('products.product_freshness.KeepaService') as keepa_service:
+            response = self.client.get(reverse('products:refresh', args=['B000000072']))
+        self.assertRedirects(response, reverse('products:detail', args=['B000000072']), fetch_redirect_response=False)
+        keepa_service.assert_not_called()
+        self.assertTrue(Job.objects.filter(kind='refresh_product', key='refresh:B000000072').exists())
+        detail = self.client.get(reverse('products:detail', args=['B000000072']))
+        self.assertTrue(detail.context['freshness']['refreshing'])
@@ -7,6 +7,7 @@ urlpatterns = [
     # Productos
     path('search/', views.search_product_view, name='search'),
     path('detail/<str:asin>/', views.product_detail_view, name='detail'),
+    path('detail/<str:asin>/freshness/', views.product_freshness_view, name='freshness'),
     path('list/', views.product_list_view, name='list'),
     path('refresh/<str:asin>/', views.refresh_product_view, name='refresh'),
     path('delete/<str:asin>/', views.delete_product_view, name='delete'),
@@ -25,6 +26,7 @@ urlpatterns = [
     path('detect-document-intent/', views.detect_document_intent_view, name='detect_document_intent'),
     path('ai-chat/', views.ai_chat_view, name='ai_chat'),
     path('generate-ai-summary/<str:asin>/', views.generate_ai_summary_view, name='generate_ai_summary'),
+    path('jobs/<int:job_id>/', views.job_status_view, name='job_status'),
     path('generate-document/', views.generate_document_view, name='generate_document'),
     
     # Categories
@@ -0,0 +1,169 @@
+"""
+Denormalized per-user counters for the badges every page shows.
+
+The notifications context processor ran two COUNT(*) queries (unread
+notifications, active alerts) on every render for every authenticated user. It
+now reads one UserCounters row. Creating a notification or an active alert
+increments the row; any other change to those counts (reading, deactivating,
+triggering, deleting) deletes it, and the next render recomputes it. The row
+lives in the database, so the counters stay correct across web workers and the
+cron commands.
+
+Model signals cover save() and delete(). Writes that bypass them (queryset
+update(), bulk_create) call invalidate_user_counters or increment_counters
+themselves. reconcile_user_counters recomputes the stored rows from the source
+tables, repairing any drift (e.g. a row recomputed while a concurrent write was
+invalidating it).
+
+invalidate_user_counters and increment_counters also drop the user's dashboard
+snapshot (dashboard_stats.py), which shows the same counts. Deleting a product
+drops the snapshot of the user who queried it, whose product total (also shown
+on the product list) it changes.
+"""
+import logging
+from typing import Dict, Iterable, List
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .dashboard_stats import invalidate_dashboard_stats
+from .models import Notification, PriceAlert, Product, UserCounters
+
+logger = logging.getLogger(__name__)
+
+# Users per reconcile batch
+RECONCILE_BATCH_SIZE = 1000
+
+
+def _unread_counts(user_ids: List[int]) -> Dict[int, int]:
+    rows = (
+        Notification.objects.filter(user_id__in=user_ids, is_read=False)
+        .values('user_id').annotate(count=Count('id')).order_by()
+    )
+    return {row['user_id']: row['count'] for row in rows}
+
+
+def _active_alert_counts(user_ids: List[int]) -> Dict[int, int]:
+    rows = (
+        PriceAlert.objects.filter(user_id__in=user_ids, is_active=True)
+        .values('user_id').annotate(count=Count('id')).order_by()
+    )
+    return {row['user_id']: row['count'] for row in rows}
+
+
+def get_user_counters(user) -> UserCounters:
+    """
+    Counters of a user, recomputed and stored if they were invalidated
+
+    Args:
+        user: Authenticated user
+
+    Returns:
+        UserCounters (one query when the row is stored)
+    """
+    counters = UserCounters.objects.filter(user_id=user.pk).first()
+    if counters is not None:
+        return counters
+    counters = UserCounters(
+        user_id=user.pk,
+        unread_notifications=_unread_counts([user.pk]).get(user.pk, 0),
+        active_alerts=_active_alert_counts([user.pk]).get(user.pk, 0),
+    )
+    try:
+        with transaction.atomic():
+            counters.save(force_insert=True)
+    except IntegrityError:
+        # Stored by a concurrent request; the values just computed are as good
+        pass
+    return counters
+
+
+def invalidate_user_counters(user_ids: Iterable[int]) -> None:
+    """Drop the stored counters (and dashboard snapshots) of the users so the next render recomputes them"""
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if user_ids:
+        UserCounters.objects.filter(user_id__in=user_ids).delete()
+        invalidate_dashboard_stats(user_ids)
+
+
+def increment_counters(user_ids: Iterable[int], field_name: str, amount: int = 1) -> None:
+    """
+    Add to a stored counter of the users (users without a stored row are skipped)
+
+    Args:
+        user_ids: Users to update
+        field_name: 'unread_notifications' or 'active_alerts'
+        amount: Amount to add
+    """
+    user_ids = list(user_ids)
+    if user_ids:
+        UserCounters.objects.filter(user_id__in=user_ids).update(**{field_name: F(field_name) + amount})
+        invalidate_dashboard_stats(user_ids)
+
+
+def reconcile_user_counters(batch_size: int = RECONCILE_BATCH_SIZE) -> int:
+    """
+    Recompute every stored counter row from the notifications and alerts tables
+
+    Args:
+        batch_size: Users per batch (two GROUP BY queries and one bulk_update each)
+
+    Returns:
+        Number of rows that were wrong and got fixed
+    """
+    fixed = 0
+    user_ids = UserCounters.objects.order_by('user_id').values_list('user_id', flat=True)
+    batch = []
+    for user_id in user_ids.iterator(chunk_size=batch_size):
+        batch.append(user_id)
+        if len(batch) >= batch_size:
+            fixed += _reconcile_batch(batch)
+            batch = []
+    if batch:
+        fixed += _reconcile_batch(batch)
+    return fixed
+
+
+def _reconcile_batch(user_ids: List[int]) -> int:
+    unread = _unread_counts(user_ids)
+    active = _active_alert_counts(user_ids)
+    changed = []
+    for counters in UserCounters.objects.filter(user_id__in=user_ids):
+        expected = (unread.get(counters.user_id, 0), active.get(counters.user_id, 0))
+        if (counters.unread_notifications, counters.active_alerts) != expected:
+            counters.unread_notifications, counters.active_alerts = expected
+            changed.append(counters)
+    UserCounters.objects.bulk_update(changed, ['unread_notifications', 'active_alerts'])
+    return len(changed)
+
+
+@receiver(post_save, sender=Notification)
+def notification_saved(sender, instance, created, **kwargs):
+    if created:
+        if not instance.is_read:
+            increment_counters([instance.user_id], 'unread_notifications')
+    else:
+        invalidate_user_counters([instance.user_id])
+
+
+@receiver(post_save, sender=PriceAlert)
+def alert_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        if instance.is_active:
+            increment_counters([instance.user_id], 'active_alerts')
+    elif update_fields is None or 'is_active' in update_fields:
+        # Bookkeeping saves (last_checked, next_check_at) leave the count alone
+        invalidate_user_counters([instance.user_id])
+
+
+@receiver(post_delete, sender=Notification)
+@receiver(post_delete, sender=PriceAlert)
+def counted_object_deleted(sender, instance, **kwargs):
+    invalidate_user_counters([instance.user_id])
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    invalidate_dashboard_stats([instance.queried_by_id])
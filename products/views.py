@@ -3,15 +3,24 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.core.paginator import Paginator
 from django.db import transaction
+from django.db.models import Count, Q
 from django.views.decorators.http import require_http_methods
 from django.http import JsonResponse
+from django.urls import reverse
 from django.utils import timezone
 from datetime import timedelta, datetime
 from io import StringIO
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 import json
-from .models import Product, PriceAlert, Notification, BestSellerSearch
+from .dashboard_stats import get_dashboard_stats
+from .job_handlers import AI_SUMMARY_JOB, PRODUCT_JOB_KINDS
+from .jobs import enqueue_job, job_status
+from .keyset import CURSOR_PARAM, KeysetPaginator
+from .models import Job, Product, PriceAlert, Notification, BestSellerSearch, product_heavy_fields
 from .keepa_service import KeepaService, RootCategoryDTO
+from .product_freshness import is_stale, product_freshness, schedule_refresh, synced_at
+from .product_upsert import bulk_upsert_products, upsert_product
+from .single_flight import single_flight
 from .openai_service import OpenAIService
 from .document_generator import DocumentGenerator
 from .notifications import create_system_notification, get_user_unread_notifications_count
@@ -19,6 +28,14 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Campos que una página de best sellers (consultada sin historial) puede actualizar en productos existentes.
+# Los precios actuales salen de stats.current, así que una página puede disparar alertas de precio
+BEST_SELLER_UPDATE_FIELDS = [
+    'title', 'brand', 'image_url', 'color', 'binding', 'availability_amazon',
+    'categories', 'category_tree', 'sales_rank_current', 'rating', 'review_count',
+    'current_price_new', 'current_price_amazon', 'current_price_used',
+]
+
 
 @login_required
 @require_http_methods(["GET", "POST"])
@@ -50,71 +67,23 @@ def search_product_view(request):
                 messages.info(request, f'Producto {asin} encontrado en la base de datos.')
                 return redirect('products:detail', asin=asin)
             
-            # Consultar producto usando Keepa API
+            # Consultar producto usando Keepa API (una sola consulta por ASIN aunque
+            # varias peticiones lo busquen a la vez) y guardarlo en la BD
             try:
-                keepa_service = KeepaService()
-                product_data = keepa_service.query_product(asin)
-                
-                if not product_data:
-                    messages.error(request, f'No se pudo encontrar el producto con ASIN: {asin}. Verifica que el ASIN sea correcto y que exista en Amazon.')
-                    # Patrón POST-REDIRECT-GET: redirigir para que el mensaje se consuma
-                    return redirect('products:search')
-                
-                # Verificar si el producto tiene al menos el ASIN
-                if not product_data.get('asin'):
-                    messages.error(request, 'El producto no tiene datos válidos. Por favor, verifica que el ASIN sea correcto.')
-                    # Patrón POST-REDIRECT-GET: redirigir para que el mensaje se consuma
-                    return redirect('products:search')
-                
-                # Verificar que el producto tenga título (requerido)
-                if not product_data.get('title') or not product_data['title'].strip():
-                    messages.error(request, 'No se pudo encontrar información completa del producto. El ASIN puede ser incorrecto o el producto puede no estar disponible en Amazon.')
-                    # Patrón POST-REDIRECT-GET: redirigir para que el mensaje se consuma
-                    return redirect('products:search')
-                    
+                product = _fetch_missing_product(asin, request.user)
             except ValueError as e:
                 messages.error(request, 'Error de configuración del sistema. Por favor, contacta al administrador.')
                 logger.error(f"Error de configuración Keepa: {e}")
                 # Patrón POST-REDIRECT-GET: redirigir para que el mensaje se consuma
                 return redirect('products:search')
             
-            # Guardar producto en la BD
-            try:
-                with transaction.atomic():
-                    product = Product.objects.create(
-                        asin=product_data['asin'],
-                        title=product_data['title'],
-                        brand=product_data.get('brand'),
-                        image_url=product_data.get('image_url'),
-                        color=product_data.get('color'),
-                        binding=product_data.get('binding'),
-                        availability_amazon=product_data.get('availability_amazon', 0),
-                        categories=product_data.get('categories', []),
-                        category_tree=product_data.get('category_tree', []),
-                        current_price_new=product_data.get('current_price_new'),
-                        current_price_amazon=product_data.get('current_price_amazon'),
-                        current_price_used=product_data.get('current_price_used'),
-                        sales_rank_current=product_data.get('sales_rank_current'),
-                        rating=product_data.get('rating'),
-                        review_count=product_data.get('review_count'),
-                        price_history=product_data.get('price_history', {}),
-                        rating_history=product_data.get('rating_history', {}),
-                        sales_rank_history=product_data.get('sales_rank_history', {}),
-                        reviews_data=product_data.get('reviews_data', {}),
-                        queried_by=request.user
-                    )
-                    
-                    messages.success(request, f'Producto consultado exitosamente.')
-                    return redirect('products:detail', asin=asin)
-            except Exception as db_error:
-                logger.error(f"Error guardando producto {asin} en BD: {db_error}")
-                # Si es error de campo requerido, dar mensaje específico
-                if 'cannot be null' in str(db_error) or 'NOT NULL constraint' in str(db_error):
-                    messages.error(request, 'No se encontró información completa del producto. El ASIN puede ser incorrecto o el producto puede no estar disponible en Amazon.')
-                else:
-                    messages.error(request, 'Hubo un problema al guardar el producto. Por favor, intenta de nuevo.')
+            if product is None:
+                messages.error(request, f'No se pudo encontrar información completa del producto con ASIN: {asin}. Verifica que el ASIN sea correcto y que exista en Amazon.')
                 # Patrón POST-REDIRECT-GET: redirigir para que el mensaje se consuma
                 return redirect('products:search')
+            
+            messages.success(request, f'Producto consultado exitosamente.')
+            return redirect('products:detail', asin=asin)
                 
         except Exception as e:
             logger.error(f"Error en búsqueda de producto {asin}: {e}")
@@ -140,6 +109,44 @@ def search_product_view(request):
     return render(request, 'products/search.html', context)
 
 
+def _fetch_missing_product(asin: str, user) -> Optional[Product]:
+    """
+    Fetch a product missing from the DB from Keepa and store it
+
+    Concurrent calls for the same ASIN, in this or other processes, share one Keepa
+    query: the others wait for the stored row. An ASIN without data is answered
+    with None for a few seconds without querying Keepa again.
+    
+    Args:
+        asin: Normalized ASIN
+        user: User stored as queried_by if the product is created
+        
+    Returns:
+        Stored product, or None if Keepa returned no usable data
+    """
+    def fetch() -> Optional[Product]:
+        product_data = KeepaService().query_product(asin)
+        if not product_data or not product_data.get('asin') or not (product_data.get('title') or '').strip():
+            return None
+        product, _, _ = upsert_product(product_data, user)
+        return product
+    
+    return single_flight(f'product:{asin}', fetch, lambda: Product.objects.filter(asin=asin).first())
+
+
+def _chart_history(history: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Rating/sales rank history without the per-point dict list, which the detail charts never read
+    
+    Args:
+        history: Product.rating_history or Product.sales_rank_history
+        
+    Returns:
+        Dict with only the parallel arrays (formatted_times, values)
+    """
+    return {key: value for key, value in (history or {}).items() if key not in ('ratings', 'sales_ranks')}
+
+
 @login_required
 def product_detail_view(request, asin):
     """
@@ -156,47 +163,15 @@ def product_detail_view(request, asin):
         logger.info(f"Producto {asin} no encontrado en BD, intentando obtenerlo de Keepa API")
         
         try:
-            keepa_service = KeepaService()
-            product_data = keepa_service.query_product(asin)
+            product = _fetch_missing_product(asin, request.user)
             
-            if not product_data or not product_data.get('asin'):
+            if product is None:
                 logger.warning(f"No se pudo obtener el producto {asin} de Keepa API")
                 from django.http import Http404
                 raise Http404(f"Producto con ASIN {asin} no encontrado")
             
-            # Guardar el producto en la BD
-            try:
-                with transaction.atomic():
-                    product = Product.objects.create(
-                        asin=product_data['asin'],
-                        title=product_data['title'],
-                        brand=product_data.get('brand'),
-                        image_url=product_data.get('image_url'),
-                        color=product_data.get('color'),
-                        binding=product_data.get('binding'),
-                        availability_amazon=product_data.get('availability_amazon', 0),
-                        categories=product_data.get('categories', []),
-                        category_tree=product_data.get('category_tree', []),
-                        current_price_new=product_data.get('current_price_new'),
-                        current_price_amazon=product_data.get('current_price_amazon'),
-                        current_price_used=product_data.get('current_price_used'),
-                        sales_rank_current=product_data.get('sales_rank_current'),
-                        rating=product_data.get('rating'),
-                        review_count=product_data.get('review_count'),
-                        price_history=product_data.get('price_history', {}),
-                        rating_history=product_data.get('rating_history', {}),
-                        sales_rank_history=product_data.get('sales_rank_history', {}),
-                        reviews_data=product_data.get('reviews_data', {}),
-                        queried_by=request.user
-                    )
-                    messages.success(request, f'Producto {asin} obtenido exitosamente.')
-                    logger.info(f"Producto {asin} guardado en BD exitosamente")
-            except Exception as db_error:
-                logger.error(f"Error guardando producto {asin} en BD después de obtenerlo de Keepa: {db_error}")
-                # Aún así intentar mostrar el producto con los datos obtenidos
-                # Crear un objeto producto temporal para el template
-                from django.http import Http404
-                raise Http404(f"No se pudo guardar el producto {asin} en la base de datos")
+            messages.success(request, f'Producto {asin} obtenido exitosamente.')
+            logger.info(f"Producto {asin} guardado en BD exitosamente")
                 
         except ValueError as e:
             logger.error(f"Error de configuración Keepa al obtener producto {asin}: {e}")
@@ -214,17 +189,24 @@ def product_detail_view(request, asin):
         {'text': product.title[:50] + '...' if len(product.title) > 50 else product.title},
     ]
     
+    # Stale-while-revalidate: se muestran los datos guardados y, si superan el TTL, se
+    # refrescan en segundo plano; la página consulta product_freshness_view hasta tenerlos.
+    # Un producto al día puede tener igualmente un refresco en curso (botón «Actualizar»)
+    refreshing = schedule_refresh(product) if is_stale(product) else None
+    
     # Preparar datos para el template
     context = {
         'product': product,
+        'freshness': product_freshness(product, refreshing),
+        'synced_at': synced_at(product),
         'price_new_display': product.get_price_display('new'),
         'price_amazon_display': product.get_price_display('amazon'),
         'price_used_display': product.get_price_display('used'),
         'rating_display': product.get_rating_display(),
         'sales_rank_display': product.get_sales_rank_display(),
         'price_history_json': json.dumps(product.price_history),
-        'rating_history_json': json.dumps(product.rating_history),
-        'sales_rank_history_json': json.dumps(product.sales_rank_history),
+        'rating_history_json': json.dumps(_chart_history(product.rating_history)),
+        'sales_rank_history_json': json.dumps(_chart_history(product.sales_rank_history)),
         'reviews_data_json': json.dumps(product.reviews_data),
         'breadcrumbs': breadcrumbs,
     }
@@ -232,17 +214,27 @@ def product_detail_view(request, asin):
     return render(request, 'products/detail.html', context)
 
 
+@login_required
+def product_freshness_view(request, asin):
+    """
+    Vista AJAX con la frescura de los datos de un producto (el detalle la consulta
+    mientras se refresca en segundo plano)
+    """
+    product = get_object_or_404(Product.summaries, asin=asin.upper().strip())
+    return JsonResponse(product_freshness(product))
+
+
 @login_required
 def product_list_view(request):
     """
     Vista para listar productos consultados por el usuario
     """
-    products = Product.objects.filter(queried_by=request.user).order_by('-last_updated')
+    # Proyección ligera: la lista no muestra historiales ni reseñas
+    products = Product.summaries.filter(queried_by=request.user).order_by('-last_updated')
     
-    # Paginación
-    paginator = Paginator(products, 10)  # 10 productos por página
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Paginación por cursor sobre (last_updated, asin): sin COUNT(*) ni OFFSET
+    paginator = KeysetPaginator(products, ordering=('-last_updated', '-asin'), per_page=10)
+    page_obj = paginator.get_page(request.GET.get(CURSOR_PARAM))
     
     # Breadcrumbs
     breadcrumbs = [
@@ -253,6 +245,8 @@ def product_list_view(request):
     context = {
         'page_obj': page_obj,
         'products': page_obj,
+        # El total sale del snapshot del dashboard en vez de un COUNT(*) por página
+        'total_products': get_dashboard_stats(request.user)['total_products'],
         'breadcrumbs': breadcrumbs,
     }
     
@@ -263,45 +257,19 @@ def product_list_view(request):
 def refresh_product_view(request, asin):
     """
     Vista para actualizar los datos de un producto existente
+    La actualización se encola (run_workers); la página de detalle la sigue y se recarga al terminar
     """
-    product = get_object_or_404(Product, asin=asin)
+    product = get_object_or_404(Product.summaries, asin=asin)
     
     try:
-        keepa_service = KeepaService()
-        product_data = keepa_service.query_product(asin)
-        
-        if not product_data:
-            messages.error(request, f'No se pudo actualizar el producto {asin}')
-            return redirect('products:detail', asin=asin)
-        
-        # Actualizar campos del producto
-        with transaction.atomic():
-            product.title = product_data['title']
-            product.brand = product_data.get('brand')
-            product.image_url = product_data.get('image_url')
-            product.color = product_data.get('color')
-            product.binding = product_data.get('binding')
-            product.availability_amazon = product_data.get('availability_amazon', 0)
-            product.categories = product_data.get('categories', [])
-            product.category_tree = product_data.get('category_tree', [])
-            product.current_price_new = product_data.get('current_price_new')
-            product.current_price_amazon = product_data.get('current_price_amazon')
-            product.current_price_used = product_data.get('current_price_used')
-            product.sales_rank_current = product_data.get('sales_rank_current')
-            product.rating = product_data.get('rating')
-            product.review_count = product_data.get('review_count')
-            product.price_history = product_data.get('price_history', {})
-            product.rating_history = product_data.get('rating_history', {})
-            product.sales_rank_history = product_data.get('sales_rank_history', {})
-            product.reviews_data = product_data.get('reviews_data', {})
-            product.save()
-        
-        messages.success(request, f'Producto {asin} actualizado exitosamente.')
-        # Redirigir al detalle del producto después de actualizar
+        # Mismo trabajo que el refresco de productos desactualizados: si ya hay uno
+        # pendiente para este ASIN no se encola otro
+        schedule_refresh(product)
+        messages.info(request, f'Actualizando el producto {asin}; la página se recargará con los nuevos datos.')
         return redirect('products:detail', asin=asin)
         
     except Exception as e:
-        logger.error(f"Error actualizando producto {asin}: {e}")
+        logger.error(f"Error encolando la actualización del producto {asin}: {e}")
         messages.error(request, f'Error al actualizar el producto: {str(e)}')
         # Redirigir a la lista de productos en caso de error
         return redirect('products:list')
@@ -456,7 +424,7 @@ def list_alerts_view(request):
     """
     Vista para listar las alertas de precio del usuario
     """
-    alerts = PriceAlert.objects.filter(user=request.user).select_related('product').order_by('-created_at')
+    alerts = PriceAlert.objects.filter(user=request.user).with_product_summary().order_by('-created_at')
     
     active_alerts_count = alerts.filter(is_active=True).count()
     total_alerts_count = alerts.count()
@@ -511,19 +479,25 @@ def notifications_view(request):
     """
     Vista para el centro de notificaciones del usuario
     """
-    notifications = Notification.objects.filter(user=request.user).select_related('alert__product').order_by('-created_at')
+    notifications = Notification.objects.filter(user=request.user).select_related('alert__product').defer(
+        *product_heavy_fields('alert__product__')
+    ).order_by('-created_at')
     
-    # Estadísticas
-    total_count = notifications.count()
-    unread_count = notifications.filter(is_read=False).count()
-    read_count = notifications.filter(is_read=True).count()
+    # Estadísticas (una sola consulta)
     one_day_ago = timezone.now() - timedelta(days=1)
-    recent_count = notifications.filter(created_at__gte=one_day_ago).count()
+    stats = Notification.objects.filter(user=request.user).aggregate(
+        total=Count('id'),
+        unread=Count('id', filter=Q(is_read=False)),
+        recent=Count('id', filter=Q(created_at__gte=one_day_ago)),
+    )
+    total_count = stats['total']
+    unread_count = stats['unread']
+    read_count = total_count - unread_count
+    recent_count = stats['recent']
     
-    # Paginación
-    paginator = Paginator(notifications, 15)  # 15 notificaciones por página
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Paginación por cursor sobre (created_at, id): sin COUNT(*) ni OFFSET
+    paginator = KeysetPaginator(notifications, ordering=('-created_at', '-id'), per_page=15)
+    page_obj = paginator.get_page(request.GET.get(CURSOR_PARAM))
     
     # Breadcrumbs
     breadcrumbs = [
@@ -655,73 +629,66 @@ def ensure_product_in_db(asin: str, user, keepa_service: KeepaService = None) ->
         Product si se obtiene exitosamente, None si hay error
     """
     asin = asin.upper().strip()
+    return ensure_products_in_db([asin], user, keepa_service).get(asin)
+
+
+def ensure_products_in_db(asins: List[str], user, keepa_service: KeepaService = None) -> Dict[str, Product]:
+    """
+    Batch version of ensure_product_in_db: fetches every missing ASIN from Keepa in
+    batched requests (up to 100 ASINs each) and stores them in the database.
     
-    # Verificar si ya existe en BD
-    try:
-        product = Product.objects.get(asin=asin)
-        logger.info(f"[ENSURE_PRODUCT] Producto {asin} ya existe en BD")
-        return product
-    except Product.DoesNotExist:
-        pass
+    Args:
+        asins: ASINs to ensure
+        user: User that performs the query (stored as queried_by for new products)
+        keepa_service: KeepaService instance (optional, created if not provided)
+        
+    Returns:
+        Dict mapping ASIN to Product for every product available after the call.
+        ASINs that could not be fetched or saved are missing from the result.
+    """
+    asins = [asin.upper().strip() for asin in asins if asin]
     
-    # No existe, obtenerlo desde Keepa
-    logger.info(f"[ENSURE_PRODUCT] Producto {asin} no encontrado en BD, obteniendo desde Keepa...")
+    # Verificar cuáles ya existen en BD con una sola consulta
+    products = Product.objects.in_bulk(asins)
+    missing_asins = [asin for asin in asins if asin not in products]
+    logger.info(f"[ENSURE_PRODUCT] {len(products)} productos ya en BD, {len(missing_asins)} por obtener desde Keepa")
+    
+    if not missing_asins:
+        return products
     
     try:
         if not keepa_service:
             keepa_service = KeepaService()
         
-        # Obtener producto con historial completo (como en search_product_view)
-        product_data = keepa_service.query_product(asin)
-        
-        if not product_data or not product_data.get('asin'):
-            logger.warning(f"[ENSURE_PRODUCT] No se pudo obtener producto {asin} de Keepa")
-            return None
-        
-        # Verificar que tenga título
-        if not product_data.get('title') or not product_data['title'].strip():
-            logger.warning(f"[ENSURE_PRODUCT] Producto {asin} sin título válido")
-            return None
-        
-        # Guardar en BD
-        try:
-            with transaction.atomic():
-                product = Product.objects.create(
-                    asin=product_data['asin'],
-                    title=product_data['title'],
-                    brand=product_data.get('brand'),
-                    image_url=product_data.get('image_url'),
-                    color=product_data.get('color'),
-                    binding=product_data.get('binding'),
-                    availability_amazon=product_data.get('availability_amazon', 0),
-                    categories=product_data.get('categories', []),
-                    category_tree=product_data.get('category_tree', []),
-                    current_price_new=product_data.get('current_price_new'),
-                    current_price_amazon=product_data.get('current_price_amazon'),
-                    current_price_used=product_data.get('current_price_used'),
-                    sales_rank_current=product_data.get('sales_rank_current'),
-                    rating=product_data.get('rating'),
-                    review_count=product_data.get('review_count'),
-                    price_history=product_data.get('price_history', {}),
-                    rating_history=product_data.get('rating_history', {}),
-                    sales_rank_history=product_data.get('sales_rank_history', {}),
-                    reviews_data=product_data.get('reviews_data', {}),
-                    queried_by=user
-                )
-                
-                logger.info(f"[ENSURE_PRODUCT] Producto {asin} guardado exitosamente en BD")
-                return product
-                
-        except Exception as db_error:
-            logger.error(f"[ENSURE_PRODUCT] Error guardando producto {asin} en BD: {db_error}")
-            return None
-            
+        # Obtener productos con historial completo (como en search_product_view)
+        batch_result = keepa_service.query_products(missing_asins)
     except ValueError as e:
         logger.error(f"[ENSURE_PRODUCT] Error de configuración Keepa: {e}")
-        return None
+        return products
     except Exception as e:
-        logger.error(f"[ENSURE_PRODUCT] Error obteniendo producto {asin} de Keepa: {e}")
-        return None
+        logger.error(f"[ENSURE_PRODUCT] Error obteniendo productos {missing_asins} de Keepa: {e}")
+        return products
+    
+    for asin, error in batch_result.errors.items():
+        logger.warning(f"[ENSURE_PRODUCT] No se pudo obtener producto {asin} de Keepa: {error}")
+    
+    products_data = []
+    for asin, product_data in batch_result.products.items():
+        # Verificar que tenga título
+        if not product_data.get('title') or not product_data['title'].strip():
+            logger.warning(f"[ENSURE_PRODUCT] Producto {asin} sin título válido")
+            continue
+        products_data.append(product_data)
+    
+    # Guardar en BD en lote (una inserción para todos los productos nuevos)
+    try:
+        upsert = bulk_upsert_products(products_data, user)
+        products.update(upsert.products)
+        logger.info(f"[ENSURE_PRODUCT] {upsert.created_count} productos guardados exitosamente en BD")
+    except Exception as db_error:
+        logger.error(f"[ENSURE_PRODUCT] Error guardando productos {[p['asin'] for p in products_data]} en BD: {db_error}")
+    
+    return products
 
 
 def find_product_by_name(product_name: str, user) -> Optional[Product]:
@@ -742,7 +709,7 @@ def find_product_by_name(product_name: str, user) -> Optional[Product]:
     
     # Buscar productos que contengan el nombre en el título
     # Primero intentar búsqueda exacta (case insensitive)
-    products = Product.objects.filter(
+    products = Product.summaries.filter(
         title__icontains=product_name_clean
     ).order_by('-last_updated')[:10]  # Limitar a 10 resultados
     
@@ -752,14 +719,13 @@ def find_product_by_name(product_name: str, user) -> Optional[Product]:
         keywords = product_name_clean.split()
         if len(keywords) > 1:
             # Buscar productos que contengan al menos algunas de las palabras clave
-            from django.db.models import Q
             query = Q()
             for keyword in keywords:
                 if len(keyword) > 2:  # Ignorar palabras muy cortas
                     query |= Q(title__icontains=keyword)
             
             if query:
-                products = Product.objects.filter(query).order_by('-last_updated')[:10]
+                products = Product.summaries.filter(query).order_by('-last_updated')[:10]
     
     # Si hay resultados, intentar encontrar el mejor match
     if products.exists():
@@ -1017,22 +983,18 @@ def handle_best_sellers_request(request, user_message: str, intent_data: Dict[st
             # Asegurar que todos los productos estén en BD
             # Esto permite que luego se puedan consultar con información completa
             logger.info(f"[BEST_SELLERS] Asegurando que {len(asins_to_fetch)} productos estén en BD...")
-            products_in_db = []
-            for asin in asins_to_fetch:
-                try:
-                    product = ensure_product_in_db(asin, request.user, keepa_service)
-                    if product:
-                        products_in_db.append(product)
-                except Exception as e:
-                    logger.warning(f"[BEST_SELLERS] Error asegurando producto {asin} en BD: {e}")
-                    continue
+            try:
+                products_in_db = list(ensure_products_in_db(asins_to_fetch, request.user, keepa_service).values())
+            except Exception as e:
+                logger.warning(f"[BEST_SELLERS] Error asegurando productos en BD: {e}")
+                products_in_db = []
             
             logger.info(f"[BEST_SELLERS] {len(products_in_db)} productos asegurados en BD")
             
             # Consultar información básica de los productos para la respuesta del chat
             # (aunque ya están en BD, necesitamos datos formateados para OpenAI)
             try:
-                products_raw = keepa_service.api.query(
+                products_raw = keepa_service.query_raw_products(
                     asins_to_fetch,
                     history=False,
                     stats=90,  # Necesitamos stats para rating y review_count
@@ -1157,76 +1119,28 @@ def handle_best_sellers_request(request, user_message: str, intent_data: Dict[st
 def generate_ai_summary_view(request, asin):
     """
     Vista AJAX para generar resumen de IA bajo demanda
+    El resumen se genera en segundo plano (run_workers); la página consulta job_status_view
     """
-    try:
-        product = get_object_or_404(Product, asin=asin)
-        
-        # Preparar datos COMPLETOS del producto para OpenAI
-        product_data = {
-            'title': product.title,
-            'brand': product.brand,
-            'categories': product.categories,
-            'asin': product.asin,
-            # PRECIOS - Historial completo
-            'price_history': product.price_history,
-            'current_price_new': product.current_price_new,
-            'current_price_amazon': product.current_price_amazon,
-            'current_price_used': product.current_price_used,
-            # VENTAS - Actual + Historial
-            'sales_rank_current': product.sales_rank_current,
-            'sales_rank_history': product.sales_rank_history,
-            # REPUTACIÓN - Actual + Historiales
-            'rating': product.rating,
-            'review_count': product.review_count,
-            'rating_history': product.rating_history,
-            'reviews_data': product.reviews_data,
-        }
-        
-        # Generar resumen con OpenAI
-        try:
-            openai_service = OpenAIService()
-            ai_summary = openai_service.generate_price_summary(product_data)
-            
-            if ai_summary:
-                # Guardar resumen en la base de datos con timestamp
-                product.ai_summary = ai_summary
-                product.ai_summary_generated_at = timezone.now()
-                product.save()
-                
-                logger.info(f"Resumen de IA generado exitosamente para {asin}")
-                
-                return JsonResponse({
-                    'success': True,
-                    'summary': ai_summary,
-                    'generated_at': product.ai_summary_generated_at.strftime('%d/%m/%Y %H:%M')
-                })
-            else:
-                logger.warning(f"No se pudo generar resumen de IA para {asin}")
-                return JsonResponse({
-                    'success': False,
-                    'error': 'No se pudo generar el resumen. Verifica que el producto tenga historial de precios.'
-                }, status=400)
-                
-        except ValueError as e:
-            logger.error(f"OpenAI no configurado: {e}")
-            return JsonResponse({
-                'success': False,
-                'error': 'OpenAI no está configurado. Por favor, contacta al administrador.'
-            }, status=500)
-            
-        except Exception as e:
-            logger.error(f"Error generando resumen de IA para {asin}: {e}")
-            return JsonResponse({
-                'success': False,
-                'error': f'Error al generar el resumen: {str(e)}'
-            }, status=500)
-            
-    except Exception as e:
-        logger.error(f"Error en generate_ai_summary_view para {asin}: {e}")
-        return JsonResponse({
-            'success': False,
-            'error': 'Error procesando la solicitud'
-        }, status=500)
+    product = get_object_or_404(Product.summaries, asin=asin)
+    job = enqueue_job(AI_SUMMARY_JOB, {'asin': product.asin}, user=request.user, key=f'ai_summary:{product.asin}', max_attempts=2)
+    
+    return JsonResponse({
+        'success': True,
+        'job_id': job.pk,
+        'status_url': reverse('products:job_status', kwargs={'job_id': job.pk}),
+    }, status=202)
+
+
+@login_required
+@require_http_methods(["GET"])
+def job_status_view(request, job_id):
+    """
+    Vista AJAX con el estado de un trabajo en segundo plano
+    Los trabajos de un producto (resumen de IA, refresco) se comparten entre usuarios, así que
+    cualquiera puede seguirlos; el resto solo los ve quien los encoló
+    """
+    job = get_object_or_404(Job.objects.filter(Q(user=request.user) | Q(kind__in=PRODUCT_JOB_KINDS)), pk=job_id)
+    return JsonResponse(job_status(job))
 
 
 @login_required
@@ -1561,18 +1475,11 @@ def best_sellers_view(request):
                             logger.warning(f"[BEST_SELLERS_VIEW] No hay ASINs para la página {page_number_int}")
                             products_data = []
                         else:
-                            # Verificar qué productos ya existen en BD
-                            existing_products = Product.objects.filter(asin__in=asins_for_page).values_list('asin', flat=True)
-                            existing_asins_set = set(existing_products)
-                            new_asins = [asin for asin in asins_for_page if asin not in existing_asins_set]
-                            
-                            logger.info(f"[BEST_SELLERS_VIEW] {len(existing_asins_set)} productos ya en BD, {len(new_asins)} nuevos para obtener")
-                            
                             # Consultar productos en batch solo para los ASINs de la página actual
                             # Usar query sin historial completo para ahorrar tokens
                             logger.info(f"[BEST_SELLERS_VIEW] Consultando información de {len(asins_for_page)} best sellers para la página actual")
                             
-                            products_raw = keepa_service.api.query(
+                            products_raw = keepa_service.query_raw_products(
                                 asins_for_page,
                                 history=False,  # Sin historial para ahorrar tokens
                                 stats=365,  # Con estadísticas ampliadas (365 días) para obtener precios actuales y rating
@@ -1709,61 +1616,30 @@ def best_sellers_view(request):
                                     if product_basic.get('title'):
                                         products_data.append(product_basic)
                                         
-                                        # Preparar producto para guardar en BD (solo si es nuevo)
-                                        if product_basic['asin'] in new_asins:
-                                            try:
-                                                # Parsear datos completos del producto para guardar en BD
-                                                parsed_product_data = keepa_service.parse_product_data(product_raw)
-                                                products_to_save.append({
-                                                    'asin': parsed_product_data['asin'],
-                                                    'data': parsed_product_data,
-                                                    'raw_data': product_raw
-                                                })
-                                            except Exception as e:
-                                                logger.warning(f"Error preparando producto {product_basic['asin']} para BD: {e}")
+                                        # Preparar producto para el upsert en lote
+                                        try:
+                                            products_to_save.append(keepa_service.parse_product_data(product_raw))
+                                        except Exception as e:
+                                            logger.warning(f"Error preparando producto {product_basic['asin']} para BD: {e}")
                                         
                                 except Exception as e:
                                     logger.warning(f"Error parseando producto best seller: {e}")
                                     continue
                             
-                            # Batch save de productos nuevos en BD
+                            # Upsert en lote: una inserción para los nuevos y solo las columnas que cambiaron en los existentes
                             if products_to_save:
-                                logger.info(f"[BEST_SELLERS_VIEW] Guardando {len(products_to_save)} productos nuevos en BD...")
-                                saved_count = 0
-                                for product_info in products_to_save:
-                                    try:
-                                        with transaction.atomic():
-                                            # Verificar nuevamente si existe (por si acaso)
-                                            if not Product.objects.filter(asin=product_info['asin']).exists():
-                                                product_data = product_info['data']
-                                                Product.objects.create(
-                                                    asin=product_data['asin'],
-                                                    title=product_data['title'],
-                                                    brand=product_data.get('brand'),
-                                                    image_url=product_data.get('image_url'),
-                                                    color=product_data.get('color'),
-                                                    binding=product_data.get('binding'),
-                                                    availability_amazon=product_data.get('availability_amazon', 0),
-                                                    categories=product_data.get('categories', []),
-                                                    category_tree=product_data.get('category_tree', []),
-                                                    current_price_new=product_data.get('current_price_new'),
-                                                    current_price_amazon=product_data.get('current_price_amazon'),
-                                                    current_price_used=product_data.get('current_price_used'),
-                                                    sales_rank_current=product_data.get('sales_rank_current'),
-                                                    rating=product_data.get('rating'),
-                                                    review_count=product_data.get('review_count'),
-                                                    price_history=product_data.get('price_history', {}),
-                                                    rating_history=product_data.get('rating_history', {}),
-                                                    sales_rank_history=product_data.get('sales_rank_history', {}),
-                                                    reviews_data=product_data.get('reviews_data', {}),
-                                                    queried_by=request.user
-                                                )
-                                                saved_count += 1
-                                    except Exception as e:
-                                        logger.warning(f"[BEST_SELLERS_VIEW] Error guardando producto {product_info['asin']} en BD: {e}")
-                                        continue
-                                
-                                logger.info(f"[BEST_SELLERS_VIEW] {saved_count} productos nuevos guardados en BD")
+                                try:
+                                    upsert = bulk_upsert_products(
+                                        products_to_save,
+                                        request.user,
+                                        update_fields=BEST_SELLER_UPDATE_FIELDS,
+                                    )
+                                    logger.info(
+                                        f"[BEST_SELLERS_VIEW] {upsert.created_count} productos nuevos guardados, "
+                                        f"{upsert.updated_count} actualizados en BD"
+                                    )
+                                except Exception as e:
+                                    logger.warning(f"[BEST_SELLERS_VIEW] Error guardando productos en BD: {e}")
                             
                             # Log de resumen de tipos de productos
                             if binding_counts:
@@ -1961,7 +1837,7 @@ def best_sellers_api_view(request):
                 })
             
             # Consultar información básica en batch
-            products_raw = keepa_service.api.query(
+            products_raw = keepa_service.query_raw_products(
                 asins[:100],  # Limitar a 100
                 history=False,
                 stats=0,
@@ -2168,7 +2044,7 @@ def category_children_view(request, category_id):
             # If not found in root, try to get it from category_lookup
             if not parent_category:
                 try:
-                    category_response = keepa_service.api.category_lookup(category_id, domain=domain)
+                    category_response = keepa_service.lookup_category(category_id, domain=domain)
                     if category_response and isinstance(category_response, dict):
                         parent_data = category_response.get(category_id)
                         if parent_data: